@@ -1,8 +1,11 @@
 import importlib.metadata
 
 from . import (
+    cache,
+    document,
     sentence_splitter,
     somajo,
+    telemetry,
     tokenizer
 )
 
@@ -11,3 +14,5 @@ __version__ = importlib.metadata.version(__package__ or __name__)
 Tokenizer = tokenizer.Tokenizer
 SentenceSplitter = sentence_splitter.SentenceSplitter
 SoMaJo = somajo.SoMaJo
+ResultCache = cache.ResultCache
+TokenizedDocument = document.TokenizedDocument
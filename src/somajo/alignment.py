@@ -113,10 +113,19 @@ def _resolve_entities(xml):
 def token_offsets(token_list, raw, position, xml_input, tokens):
     """Determine character offsets for tokens."""
     if xml_input:
+        # Implicit end tags of empty elements have zero length and
+        # keep their offsets
+        empty = {i for i, t in enumerate(tokens) if t.markup and t.character_offset[0] == t.character_offset[1]}
+        if len(empty) > 0:
+            offsets = iter(token_offsets(token_list, raw, position, xml_input, [t for i, t in enumerate(tokens) if i not in empty]))
+            return [tokens[i].character_offset if i in empty else next(offsets) for i in range(len(tokens))]
         chunk_offsets = [(t.character_offset[0] - position, t.character_offset[1] - position) for t in token_list]
         raw, align_to_entities = _resolve_entities(raw)
         align_from_entities = {i: char_i for char_i, (start, end) in enumerate(align_to_entities) for i in range(start, end)}
-        chunks = [raw[align_from_entities[start]:align_from_entities[end - 1] + 1] for start, end in chunk_offsets]
+        # Each chunk extends to the end of the previous one, so that
+        # pruned elements (replaced by NUL characters) are included
+        ends = [align_from_entities[end - 1] + 1 for start, end in chunk_offsets]
+        chunks = [raw[start:end] for start, end in zip([0] + ends[:-1], ends)]
         chunks_nfc = [unicodedata.normalize("NFC", c) for c in chunks]
         alignments = [_align_nfc(chunk_nfc, chunk) for chunk, chunk_nfc in zip(chunks, chunks_nfc)]
         align_to_raw = alignments[0]
@@ -149,8 +158,35 @@ def token_offsets(token_list, raw, position, xml_input, tokens):
     return offsets
 
 
+def _match_blanked(text, raw):
+    """Return the end of text at the start of raw, skipping the NUL
+    characters that replace pruned elements in raw.
+
+    """
+    i, j = 0, 0
+    while i < len(text):
+        blank = raw.find("\0", j, j + len(text) - i)
+        if blank == -1:
+            blank = j + len(text) - i
+        assert raw.startswith(text[i:i + blank - j], j), f"'{raw}' does not start with '{text}'"
+        i += blank - j
+        j = blank
+        while i < len(text) and raw[j] == "\0":
+            j += 1
+    return j
+
+
 def xml_chunk_offset(token, raw):
     """Determine character offset for an XML chunk created by `utils._xml_chunk_generator`."""
+    if raw.startswith("\0"):
+        # Skip pruned elements
+        stripped = raw.lstrip("\0")
+        start, end = xml_chunk_offset(token, stripped)
+        if start == end:
+            return (0, 0)
+        skip = len(raw) - len(stripped)
+        return (start + skip, end + skip)
+    raw_length = len(raw)
     raw, align_to_raw = _resolve_entities(raw)
     raw = re.sub(r"\s", " ", raw)
     text = token.text
@@ -175,10 +211,14 @@ def xml_chunk_offset(token, raw):
                 assert m, f"'{text}' not found in '{local_raw}'"
                 start, end = m.span(1)
     else:
-        assert raw.startswith(text), f"'{raw}' does not start with '{text}'"
         start = 0
-        end = len(text)
+        if raw.startswith(text):
+            end = len(text)
+        else:
+            end = _match_blanked(text, raw)
     if start == end:
+        if start == len(align_to_raw):
+            return (raw_length, raw_length)
         return (align_to_raw[start][0], align_to_raw[start][0])
     else:
         return (align_to_raw[start][0], align_to_raw[end - 1][1])
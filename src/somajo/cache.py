@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import array
+import collections
+import hashlib
+import importlib.metadata
+import json
+import sqlite3
+import threading
+
+from . import token
+
+
+def _encode(result):
+    """Serialize a packed result, i.e. a pair of the output of
+    token.pack_tokens and an array of sentence lengths (or None), as
+    JSON. Unlike
+    pickle, loading JSON cannot execute code from a tampered database.
+
+    """
+    (text, lengths, classes, flags, spellings, offsets), sentence_lengths = result
+    if offsets is not None:
+        offsets = [offsets[0], offsets[1].tolist()]
+    if sentence_lengths is not None:
+        sentence_lengths = sentence_lengths.tolist()
+    return json.dumps([text, lengths.tolist(), list(classes), list(flags), sorted(spellings.items()), offsets, sentence_lengths])
+
+
+def _decode(data):
+    """Restore a packed result from the output of _encode."""
+    text, lengths, classes, flags, spellings, offsets, sentence_lengths = json.loads(data)
+    if offsets is not None:
+        offsets = (offsets[0], token._compact_array(offsets[1]))
+    if sentence_lengths is not None:
+        sentence_lengths = array.array("L", sentence_lengths)
+    return (text, token._compact_array(lengths), bytes(classes), bytes(flags), {i: s for i, s in spellings}, offsets), sentence_lengths
+
+
+class ResultCache:
+    """Cache for the tokenization results of paragraphs of text.
+
+    Duplicate paragraphs (boilerplate, retweets, etc.) are tokenized
+    only once. The results are kept in a bounded in-memory LRU cache
+    and, optionally, in an SQLite database (as JSON) that persists
+    across runs and is shared by the worker processes. The cache is
+    keyed by a hash of the paragraph, the tokenizer options and the
+    version of SoMaJo, so that a single cache can be used with
+    differently configured tokenizers.
+
+    Parameters
+    ----------
+    maxsize : int, (default=100000)
+        Maximum number of paragraphs in the in-memory cache (per
+        process).
+    path : str, optional (default=None)
+        Filename of the SQLite database. If None, results are only
+        cached in memory.
+
+    Attributes
+    ----------
+    hits : int
+        Number of paragraphs found in the in-memory cache.
+    disk_hits : int
+        Number of paragraphs found in the database.
+    misses : int
+        Number of paragraphs that had to be tokenized.
+
+    """
+
+    version = importlib.metadata.version(__package__)
+
+    def __init__(self, maxsize=100000, path=None):
+        assert maxsize >= 0
+        self.maxsize = maxsize
+        self.path = path
+        self._reset()
+
+    def _reset(self):
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # Worker processes start with an empty cache and open their
+        # own database connection
+        return {"maxsize": self.maxsize, "path": self.path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    @property
+    def hit_rate(self):
+        """The proportion of paragraphs that have been found in the cache."""
+        total = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / total if total > 0 else 0.0
+
+    def key(self, text, options):
+        """Hash text together with the options of the tokenizer."""
+        h = hashlib.blake2b(repr((self.version, options)).encode("utf-8"), digest_size=16)
+        h.update(text.encode("utf-8", "surrogatepass"))
+        return h.digest()
+
+    def _database(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value BLOB)")
+        return self._connection
+
+    def get(self, key):
+        """Return the cached result for key or None."""
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return result
+            if self.path is not None:
+                row = self._database().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    try:
+                        result = _decode(row[0])
+                    except (ValueError, TypeError):
+                        # Not written by this version of ResultCache
+                        result = None
+                if result is not None:
+                    self._remember(key, result)
+                    self.disk_hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        """Store the result for key."""
+        with self._lock:
+            self._remember(key, result)
+            if self.path is not None:
+                self._database().execute("INSERT OR IGNORE INTO results VALUES (?, ?)", (key, _encode(result)))
+
+    def _remember(self, key, result):
+        if self.maxsize == 0:
+            return
+        self._results[key] = result
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def _take_statistics(self):
+        """Return the hit counts and reset them to zero."""
+        with self._lock:
+            counts = (self.hits, self.disk_hits, self.misses)
+            self.hits = self.disk_hits = self.misses = 0
+        return counts
+
+    def _add_statistics(self, counts):
+        """Add the hit counts of a worker process."""
+        with self._lock:
+            self.hits += counts[0]
+            self.disk_hits += counts[1]
+            self.misses += counts[2]
+
+    def clear(self):
+        """Remove all results from the in-memory cache and the database."""
+        with self._lock:
+            self._results.clear()
+            if self.path is not None:
+                self._database().execute("DELETE FROM results")
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
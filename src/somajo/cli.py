@@ -2,11 +2,17 @@
 
 import argparse
 import logging
+import os
+import pathlib
+import sys
 import time
 
 from . import (
+    ResultCache,
     SoMaJo,
-    __version__
+    __version__,
+    telemetry,
+    utils
 )
 
 logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
@@ -20,6 +26,7 @@ def arguments():
     parser.add_argument("-x", "--xml", action="store_true", help="The input is an XML file. You can specify tags that always constitute a sentence break (e.g. HTML p tags) via the --tag option.")
     parser.add_argument("--tag", action="append", help="Start and end tags of this type constitute sentence breaks, i.e. they do not occur in the middle of a sentence. Can be used multiple times to specify multiple tags, e.g. --tag p --tag br. Implies option -x/--xml. (Default: --tag title --tag h1 --tag h2 --tag h3 --tag h4 --tag h5 --tag h6 --tag p --tag br --tag hr --tag div --tag ol --tag ul --tag dl --tag table)")
     parser.add_argument("--prune", action="append", help="Tags of this type will be removed from the input before tokenization. Can be used multiple times to specify multiple tags, e.g. --tag script --tag style. Implies option -x/--xml. By default, no tags are pruned.")
+    parser.add_argument("--xml-parser", choices=sorted(SoMaJo.xml_parsers), help="The XML parser to use. lxml is faster but has to be installed separately. Implies option -x/--xml. (Default: expat)")
     parser.add_argument("--strip-tags", action="store_true", help="Suppresses output of XML tags. Implies option -x/--xml.")
     parser.add_argument("-c", "--split_camel_case", action="store_true", help="Split items in written in camelCase (excluding established names and terms).")
     parser.add_argument("--split_sentences", "--split-sentences", action="store_true", help="Also split the input into sentences.")
@@ -27,54 +34,151 @@ def arguments():
     parser.add_argument("-t", "--token_classes", action="store_true", help="Output the token classes (number, XML tag, abbreviation, etc.) in addition to the tokens.")
     parser.add_argument("-e", "--extra_info", action="store_true", help='Output additional information for each token: SpaceAfter=No if the token was not followed by a space and OriginalSpelling="…" if the token contained whitespace.')
     parser.add_argument("--character-offsets", action="store_true", help='Output character offsets in the input for each token.')
+    parser.add_argument("--cache", metavar="FILE", help="Store the tokenized paragraphs in the SQLite database FILE, so that duplicate paragraphs are only tokenized once, also across runs. Ignored for XML input.")
     parser.add_argument("--parallel", type=int, default=1, metavar="N", help="Run N worker processes (up to the number of CPUs) to speed up tokenization.")
+    parser.add_argument("--regex-timeout", type=float, metavar="SECONDS", help="Skip a tokenization rule for a token if it takes longer than SECONDS, e.g. on pathological input. The output then depends on the speed of the machine. By default, there is no timeout.")
+    parser.add_argument("--progress", action="store_true", help="Log the progress, the current throughput and the slowest paragraph at regular intervals.")
+    parser.add_argument("--progress-interval", type=float, default=10.0, metavar="SECONDS", help="Interval for --progress in seconds. (Default: 10)")
+    parser.add_argument("--stats-file", metavar="FILE", help="Write the size, number of tokens and sentences, tokenization time and worker of every paragraph as JSON lines to FILE. If FILE ends in .prom, write counters and a histogram of tokenization times in the Prometheus text format instead, updated every 10 seconds.")
+    parser.add_argument("--backend", choices=sorted(SoMaJo.backends), default=SoMaJo._default_backend, help="Use worker processes or threads for --parallel. Threads share a single tokenizer and are most useful on free-threaded Python builds. (Default: process)")
+    parser.add_argument("--input-dir", metavar="DIR", help="Tokenize all files in DIR (and its subdirectories) instead of FILE. Requires --output-dir.")
+    parser.add_argument("--output-dir", metavar="DIR", help="Write the output for each file in --input-dir to a file with the same relative path in DIR. Files whose output already exists are skipped. Compressed input files result in compressed output files.")
+    parser.add_argument("--glob", action="append", metavar="PATTERN", help="Only tokenize files in --input-dir whose path (relative to --input-dir) matches PATTERN, e.g. --glob '**/*.txt'. Can be used multiple times. (Default: all files)")
     parser.add_argument("-v", "--version", action="version", version="SoMaJo %s" % __version__, help="Output version information and exit.")
-    parser.add_argument("FILE", type=argparse.FileType("r", encoding="utf-8"), help="The input file (UTF-8-encoded) or \"-\" to read from STDIN.")
+    parser.add_argument("-o", "--output", metavar="FILE", help="Write the output to FILE instead of STDOUT. If FILE ends in .gz, .bz2, .xz or .zst, the output is compressed accordingly.")
+    parser.add_argument("FILE", nargs="?", help="The input file (UTF-8-encoded) or \"-\" to read from STDIN. Files compressed with gzip, bzip2, xz or Zstandard are decompressed on the fly.")
     args = parser.parse_args()
+    if args.FILE not in (None, "-") and not os.path.isfile(args.FILE):
+        parser.error("No such file: %s" % args.FILE)
+    if (args.FILE is None) == (args.input_dir is None):
+        parser.error("Specify either FILE or --input-dir")
+    if (args.input_dir is None) != (args.output_dir is None):
+        parser.error("--input-dir and --output-dir have to be used together")
+    if args.input_dir is not None and args.output is not None:
+        parser.error("--output cannot be used with --input-dir")
     return args
 
 
+def corpus_files(input_dir, output_dir, patterns):
+    """Find the input files in input_dir that match one of the patterns
+    and whose output file in output_dir does not exist yet. Return a
+    dictionary that maps input paths to output paths.
+
+    """
+    input_dir = pathlib.Path(input_dir)
+    if patterns is None:
+        patterns = ["**/*"]
+    files = {}
+    for pattern in patterns:
+        for path in input_dir.glob(pattern):
+            if path.is_file():
+                out = os.path.join(output_dir, path.relative_to(input_dir))
+                if os.path.exists(out):
+                    logging.info("Skipping %s: %s exists" % (path, out))
+                    continue
+                files[str(path)] = out
+    return files
+
+
+def write_chunks(chunks, args, fh):
+    """Write the tokenized chunks to fh and return the number of tokens
+    and the number of chunks.
+
+    """
+    n_tokens = 0
+    n_sentences = 0
+    for chunk in chunks:
+        n_sentences += 1
+        for token in chunk:
+            output = token.text
+            if not token.markup:
+                n_tokens += 1
+                if args.token_classes:
+                    output += "\t" + token.token_class
+                if args.extra_info:
+                    output += "\t" + token.extra_info
+                if args.character_offsets:
+                    output += f"\t{token.character_offset[0]}, {token.character_offset[1]}"
+            print(output, file=fh)
+        if args.split_sentences and args.sentence_tag is None:
+            print(file=fh)
+    return n_tokens, n_sentences
+
+
 def main():
     args = arguments()
     n_tokens = 0
     n_sentences = 0
     t0 = time.perf_counter()
     is_xml = False
-    if args.xml or args.strip_tags or (args.tag is not None) or (args.prune is not None):
+    if args.xml or args.strip_tags or (args.tag is not None) or (args.prune is not None) or (args.xml_parser is not None):
         is_xml = True
     if args.sentence_tag:
         args.split_sentences = True
+    observers = []
+    if args.progress:
+        observers.append(telemetry.ProgressLogger(args.progress_interval))
+    if args.stats_file is not None:
+        if args.stats_file.endswith(".prom"):
+            observers.append(telemetry.PrometheusExporter(args.stats_file))
+        else:
+            observers.append(telemetry.JsonLinesWriter(args.stats_file))
     tokenizer = SoMaJo(
         args.language,
         split_camel_case=args.split_camel_case,
         split_sentences=args.split_sentences,
         xml_sentences=args.sentence_tag,
-        character_offsets=args.character_offsets
+        character_offsets=args.character_offsets,
+        cache=None if args.cache is None else ResultCache(path=args.cache),
+        observers=observers,
+        regex_timeout=args.regex_timeout
     )
-    if is_xml:
-        eos_tags = args.tag
-        if eos_tags is None:
-            eos_tags = "title h1 h2 h3 h4 h5 h6 p br hr div ol ul dl table".split()
-        chunks = tokenizer.tokenize_xml_file(args.FILE, eos_tags, strip_tags=args.strip_tags, parallel=args.parallel, prune_tags=args.prune)
+    eos_tags = args.tag
+    if eos_tags is None:
+        eos_tags = "title h1 h2 h3 h4 h5 h6 p br hr div ol ul dl table".split()
+    if args.input_dir is not None:
+        files = corpus_files(args.input_dir, args.output_dir, args.glob)
+        if is_xml:
+            results = tokenizer.tokenize_corpus(files, xml=True, eos_tags=eos_tags, strip_tags=args.strip_tags, prune_tags=args.prune, xml_parser=args.xml_parser, parallel=args.parallel, backend=args.backend)
+        else:
+            results = tokenizer.tokenize_corpus(files, paragraph_separator=args.paragraph_separator, parallel=args.parallel, backend=args.backend)
+        for path, chunks in results:
+            # Write to a temporary file first, so that an existing
+            # output file is always complete
+            out = files[path]
+            root, ext = os.path.splitext(out)
+            partial = root + ".part" + ext
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with utils.open_file(partial, "w") as fh:
+                tokens, sentences = write_chunks(chunks, args, fh)
+            os.replace(partial, out)
+            n_tokens += tokens
+            n_sentences += sentences
     else:
-        chunks = tokenizer.tokenize_text_file(args.FILE, args.paragraph_separator, parallel=args.parallel)
-    for chunk in chunks:
-        n_sentences += 1
-        for token in chunk:
-            output = token.text
-            if not token.markup:
-                n_tokens += 1
-                if args.token_classes:
-                    output += "\t" + token.token_class
-                if args.extra_info:
-                    output += "\t" + token.extra_info
-                if args.character_offsets:
-                    output += f"\t{token.character_offset[0]}, {token.character_offset[1]}"
-            print(output)
-        if args.split_sentences and args.sentence_tag is None:
-            print()
+        input_file = sys.stdin if args.FILE == "-" else args.FILE
+        if is_xml:
+            chunks = tokenizer.tokenize_xml_file(input_file, eos_tags, strip_tags=args.strip_tags, parallel=args.parallel, backend=args.backend, prune_tags=args.prune, xml_parser=args.xml_parser)
+        else:
+            chunks = tokenizer.tokenize_text_file(input_file, args.paragraph_separator, parallel=args.parallel, backend=args.backend)
+        if args.output is None:
+            n_tokens, n_sentences = write_chunks(chunks, args, sys.stdout)
+        else:
+            with utils.open_file(args.output, "w") as fh:
+                n_tokens, n_sentences = write_chunks(chunks, args, fh)
     t1 = time.perf_counter()
+    for observer in observers:
+        observer.close()
     if args.split_sentences:
         logging.info("Tokenized %d tokens (%d sentences) in %d seconds (%d tokens/s)" % (n_tokens, n_sentences, t1 - t0, n_tokens / (t1 - t0)))
     else:
         logging.info("Tokenized %d tokens in %d seconds (%d tokens/s)" % (n_tokens, t1 - t0, n_tokens / (t1 - t0)))
+    if args.sentence_tag and is_xml:
+        statistics = tokenizer.xml_tag_statistics
+        logging.info("Sentence tags: %d closing and %d re-opening tags inserted (maximum depth %d)" % (statistics["closed"], statistics["reopened"], statistics["max_depth"]))
+    if sum(tokenizer.regex_timeouts.values()) > 0:
+        rules = ", ".join("%s (%d)" % (rule, n) for rule, n in sorted(tokenizer.regex_timeouts.items()))
+        logging.warning("Skipped rules that timed out: %s; the output may differ between runs" % rules)
+    if tokenizer.cache is not None:
+        cache = tokenizer.cache
+        logging.info("Cache: %d hits in memory, %d hits on disk, %d misses (hit rate %.1f%%)" % (cache.hits, cache.disk_hits, cache.misses, 100 * cache.hit_rate))
+        cache.close()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import bisect
+import collections
+import io
+import itertools
+
+from . import utils
+from .token import Token
+
+
+# The result of TokenizedDocument.edit: the sentences from index
+# onwards that have been removed from the document and the ones that
+# have been added in their place
+DocumentDiff = collections.namedtuple("DocumentDiff", ["index", "removed", "added"])
+
+
+def _split_paragraphs(text, paragraph_separator):
+    """Split text into the pieces that are tokenized independently of
+    each other, delimited in the same way as by
+    utils.get_paragraphs_str. Unlike the paragraphs, the pieces add up
+    to the whole text (blank lines are pieces of their own).
+
+    """
+    fh = io.StringIO(text)
+    if paragraph_separator == "single_newlines":
+        return list(fh)
+    return [paragraph for paragraph, position in utils.get_paragraphs_str(fh, paragraph_separator)]
+
+
+def _is_complete(piece, paragraph_separator):
+    """Does the piece end in a way that makes the next one start a new
+    paragraph, no matter what follows?
+
+    """
+    if not piece.endswith("\n"):
+        return False
+    if paragraph_separator == "single_newlines":
+        return True
+    return piece[piece.rfind("\n", 0, len(piece) - 1) + 1:].strip() == ""
+
+
+def _shift(sentences, shift):
+    """Move the character offsets of the tokens by shift characters."""
+    for sentence in sentences:
+        for t in sentence:
+            if t.character_offset is not None:
+                t.character_offset = (t.character_offset[0] + shift, t.character_offset[1] + shift)
+
+
+def _sentence_key(sentence, anchor):
+    """Compare sentences independently of the objects and of the
+    position of anchor.
+
+    """
+    return [(t.text, t.token_class, t.space_after, t.original_spelling, t.markup, None if t.character_offset is None else (t.character_offset[0] - anchor, t.character_offset[1] - anchor)) for t in sentence]
+
+
+class TokenizedDocument:
+    """A tokenized (and sentence split) text that can be edited.
+
+    Every edit only re-tokenizes the paragraphs that it touches, so
+    that small edits in large documents are cheap. Use
+    ``SoMaJo.tokenize_document`` to create a TokenizedDocument.
+
+    Iterating over the document yields the same sentences (or
+    paragraphs, depending on the value of ``split_sentences``) as
+    ``SoMaJo.tokenize_text_file``, without empty ones. The character
+    offsets, if computed, are relative to the current text of the
+    document.
+
+    """
+
+    def __init__(self, somajo, text, paragraph_separator, *, parallel=1, backend="process"):
+        self._somajo = somajo
+        self.paragraph_separator = paragraph_separator
+        self._pieces = _split_paragraphs(text, paragraph_separator)
+        token_info = (([Token(p, first_in_sentence=True, last_in_sentence=True)], p, 0) for p in self._pieces)
+        self._sentences = [somajo._postprocess_paragraph(tokens) for _, tokens in somajo._tokenize_paragraphs(token_info, parallel, backend, True, False)]
+        # The start position that the character offsets of the tokens
+        # in each piece are currently based on
+        self._bases = [0] * len(self._pieces)
+        self._starts = None
+        self._text = text
+
+    def _tokenize_pieces(self, pieces):
+        """Tokenize pieces of text one after another."""
+        return [self._somajo._postprocess_paragraph(self._somajo._tokenize(([Token(p, first_in_sentence=True, last_in_sentence=True)], p, 0), False)) for p in pieces]
+
+    def _piece_starts(self):
+        if self._starts is None:
+            self._starts = list(itertools.accumulate(itertools.chain([0], map(len, self._pieces))))
+        return self._starts
+
+    def _rebase(self, i):
+        """Make the character offsets in piece i relative to the document."""
+        start = self._piece_starts()[i]
+        shift = start - self._bases[i]
+        if shift != 0:
+            _shift(self._sentences[i], shift)
+            self._bases[i] = start
+        return self._sentences[i]
+
+    @property
+    def text(self):
+        """The current text of the document."""
+        if self._text is None:
+            self._text = "".join(self._pieces)
+        return self._text
+
+    def __len__(self):
+        return sum(map(len, self._sentences))
+
+    def __iter__(self):
+        for i in range(len(self._pieces)):
+            yield from self._rebase(i)
+
+    def edit(self, start, end, replacement):
+        """Replace the text between the character positions start and
+        end with replacement and re-tokenize the affected paragraphs.
+
+        Parameters
+        ----------
+        start : int
+            Start of the replaced text.
+        end : int
+            End of the replaced text (exclusive).
+        replacement : str
+            The new text.
+
+        Returns
+        -------
+        DocumentDiff
+            A named tuple ``(index, removed, added)``: The sentences
+            starting at position ``index`` that have been removed from
+            the document and the ones that have taken their place.
+            Unchanged sentences before and after the edit are not
+            part of the diff.
+
+        """
+        starts = self._piece_starts()
+        assert 0 <= start <= end <= starts[-1], "Edit (%d, %d) is out of range" % (start, end)
+        # The piece boundaries before start are not affected by the
+        # edit. We include the preceding piece, so that an insertion
+        # at its end is handled correctly.
+        first = max(bisect.bisect_right(starts, start) - 2, 0)
+        last = min(bisect.bisect_left(starts, end), len(self._pieces))
+        text = "".join(self._pieces[first:last])
+        offset = starts[first]
+        text = text[:start - offset] + replacement + text[end - offset:]
+        # Extend the region until the new pieces end at a paragraph
+        # boundary
+        new_pieces = _split_paragraphs(text, self.paragraph_separator)
+        while last < len(self._pieces) and len(new_pieces) > 0 and not _is_complete(new_pieces[-1], self.paragraph_separator):
+            text = new_pieces[-1] + self._pieces[last]
+            new_pieces[-1:] = _split_paragraphs(text, self.paragraph_separator)
+            last += 1
+        # Pieces that are unchanged keep their tokens
+        old_pieces = self._pieces[first:last]
+        while len(old_pieces) > 0 and len(new_pieces) > 0 and old_pieces[0] == new_pieces[0]:
+            del old_pieces[0], new_pieces[0]
+            first += 1
+        while len(old_pieces) > 0 and len(new_pieces) > 0 and old_pieces[-1] == new_pieces[-1]:
+            del old_pieces[-1], new_pieces[-1]
+            last -= 1
+        region_start = starts[first]
+        old_end = starts[last]
+        new_end = region_start + sum(map(len, new_pieces))
+        removed = list(itertools.chain.from_iterable(self._rebase(i) for i in range(first, last)))
+        new_sentences = self._tokenize_pieces(new_pieces)
+        new_bases = list(itertools.accumulate(itertools.chain([region_start], map(len, new_pieces))))[:-1]
+        for sentences, base in zip(new_sentences, new_bases):
+            _shift(sentences, base)
+        added = list(itertools.chain.from_iterable(new_sentences))
+        index = sum(map(len, self._sentences[:first]))
+        self._pieces[first:last] = new_pieces
+        self._sentences[first:last] = new_sentences
+        self._bases[first:last] = new_bases
+        self._starts = None
+        self._text = None
+        # Sentences at the edges of the region may be unchanged
+        while len(removed) > 0 and len(added) > 0 and _sentence_key(removed[0], 0) == _sentence_key(added[0], 0):
+            del removed[0], added[0]
+            index += 1
+        while len(removed) > 0 and len(added) > 0 and _sentence_key(removed[-1], old_end) == _sentence_key(added[-1], new_end):
+            del removed[-1], added[-1]
+        return DocumentDiff(index, removed, added)
@@ -1,14 +1,24 @@
 #!/usr/bin/env python3
 
+import array
 import collections
+import itertools
 import regex as re
 
 from . import (
-    doubly_linked_list,
     token,
     utils
 )
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Token features for split_many
+_ENDING, _STARTING, _OPENING, _CLOSING = 1, 2, 4, 8
+
 
 class SentenceSplitter():
     def __init__(self, is_tuple=False, language="de_CMC"):
@@ -34,121 +44,190 @@ class SentenceSplitter():
         # that does not have SoMaJo token classes
         self.mention = re.compile(r'^[@]\w+$')
         self.hashtag = re.compile(r'^[#]\w(?:[\w-]*\w)?$')
+        # Cheap checks that rule out most tokens before a regular
+        # expression or the abbreviation set has to be consulted
+        self._sentence_ending_initials = frozenset(".…!?")
+        self._eos_abbreviation_finals = frozenset(c for a in self.eos_abbreviations for c in (a[-1], a[-1].upper()))
+        # Opening and closing punctuation consists of single
+        # characters (apart from dashes); the results for single
+        # characters are cached
+        self._opening_chars = {}
+        self._closing_chars = {}
+        # Features of the token types seen by split_many
+        self._features = {}
+        # Statistics of _add_xml_tags
+        self.xml_tag_statistics = {"closed": 0, "reopened": 0, "max_depth": 0}
 
-    def _get_sentence_boundaries(self, tokens):
-        sentence_boundaries = []
-        n = len(tokens)
-        for i, t in enumerate(tokens, start=1):
-            if t.last_in_sentence:
-                boundary = i
-                for j in range(i, n):
-                    if tokens[j].markup_class == "end":
-                        boundary += 1
-                    else:
-                        break
-                sentence_boundaries.append(boundary)
-        if len(sentence_boundaries) == 0:
-            sentence_boundaries.append(n)
-        if sentence_boundaries[-1] != n:
-            sentence_boundaries[-1] = n
-        return sentence_boundaries
+    def _is_sentence_ending(self, text):
+        """Is text sentence-ending punctuation or an abbreviation that
+        can end a sentence?
+
+        """
+        if text[:1] in self._sentence_ending_initials and self.sentence_ending_punct.search(text):
+            return True
+        return text[-1:] in self._eos_abbreviation_finals and text.lower() in self.eos_abbreviations
+
+    def _is_opening(self, text):
+        if len(text) > 1:
+            return text[0] == "-" and self.opening_punct.search(text) is not None
+        opening = self._opening_chars.get(text)
+        if opening is None:
+            opening = self._opening_chars[text] = self.opening_punct.search(text) is not None
+        return opening
+
+    def _is_closing(self, text):
+        if len(text) > 1:
+            return False
+        closing = self._closing_chars.get(text)
+        if closing is None:
+            closing = self._closing_chars[text] = self.closing_punct.search(text) is not None
+        return closing
+
+    def _is_mention_or_hashtag(self, tok):
+        """Use the token class if the token comes from the tokenizer and
+        the regular expressions for pretokenized input.
+
+        """
+        if tok.token_class is not None:
+            return tok.token_class == "mention" or tok.token_class == "hashtag"
+        c = tok.text[0]
+        return (c == "@" and self.mention.search(tok.text) is not None) or (c == "#" and self.hashtag.search(tok.text) is not None)
+
+    def _token_features(self, text):
+        """Encode the properties of a pretokenized token that the
+        sentence splitter looks at as bits. The lookahead checks for
+        starting, opening and closing tokens in this order, so at most
+        one of them is set.
+
+        """
+        features = self._features.get(text)
+        if features is None:
+            features = 0
+            if self._is_sentence_ending(text):
+                features |= _ENDING
+            c = text[:1]
+            if c.isupper() or text.isnumeric() or (c == "@" and self.mention.search(text) is not None) or (c == "#" and self.hashtag.search(text) is not None):
+                features |= _STARTING
+            # Pretokenized tokens always have space_after, i.e.
+            # problematic quotes are opening ones
+            elif text in self.problematic_quotes or self._is_opening(text):
+                features |= _OPENING
+            elif self._is_closing(text):
+                features |= _CLOSING
+            if len(self._features) >= 1000000:
+                self._features.clear()
+            self._features[text] = features
+        return features
 
     def _add_xml_tags(self, tokens, s_tag="s"):
         """Mark sentence boundaries with XML tags."""
         # Positions of XML tags w.r.t. the actual sentence:
         start, inside, end, na = 1, 2, 3, 4
+        statistics = self.xml_tag_statistics
         open_tags = collections.deque()
         reopen_after_start = collections.deque()
-        reopen_after_end = collections.deque()
-        start_tag = re.compile(r"^<([^ ]+)[ ]?[^>]*>$")
-        end_tag = re.compile(r"^</(.+)>$")
+        reopen_after_end = []
+        # Tags that have been opened before the current sentence have
+        # the position na. Instead of updating all open tags at the
+        # end of every sentence, which takes time proportional to the
+        # nesting depth, we compare the number of the sentence in
+        # which the tag has been opened.
+        sentence_number = 0
         for sentence in tokens:
-            # print([(t.text, t.first_in_sentence, t.last_in_sentence) for t in sentence])
-            sentence_dll = doubly_linked_list.DLL(sentence)
-            position = start
-            tags = collections.deque()
-            first_token, last_token = None, None
+            # Tags that have been closed at the end of the previous
+            # sentence are re-opened at the start of this one
             for tag in reversed(reopen_after_end):
                 top = open_tags.pop()
                 assert top is tag
-            while len(reopen_after_end) > 0:
-                tag = reopen_after_end.pop()
-                sentence_dll.insert_left(tag["start_token"], sentence_dll.first)
-            for tok in sentence_dll:
-                if tok.value.markup:
-                    # better store tag name in Token object
-                    if tok.value.markup_class == "start":
-                        m = start_tag.search(tok.value.text)
-                        assert m
-                        tag_name = m.group(1)
-                        tag = {"tag_name": tag_name, "start_token": tok, "end_token": None, "start": position, "end": na}
+            if len(reopen_after_end) > 0:
+                sentence = [tag["start_token"] for tag in reopen_after_end] + sentence
+                statistics["reopened"] += len(reopen_after_end)
+                reopen_after_end = []
+            position = start
+            tags = collections.deque()
+            first_index, last_index = None, None
+            for i, tok in enumerate(sentence):
+                if tok.markup:
+                    if tok.markup_class == "start":
+                        tag = {"tag_name": tok.tag_name, "start_token": tok, "start_index": i, "end_index": None, "sentence": sentence_number, "start": position, "end": na}
                         open_tags.append(tag)
                         tags.append(tag)
-                    elif tok.value.markup_class == "end":
-                        m = end_tag.search(tok.value.text)
-                        assert m
-                        tag_name = m.group(1)
+                        if len(open_tags) > statistics["max_depth"]:
+                            statistics["max_depth"] = len(open_tags)
+                    elif tok.markup_class == "end":
                         top = open_tags.pop()
-                        assert tag_name == top["tag_name"]
-                        top["end_token"] = tok
+                        assert tok.tag_name == top["tag_name"]
+                        top["end_index"] = i
                         top["end"] = position
-                        if top["start"] == na:
+                        if top["sentence"] != sentence_number:
                             tags.appendleft(top)
-                if tok.value.first_in_sentence:
+                if tok.first_in_sentence:
                     position = inside
-                    first_token = tok
-                if tok.value.last_in_sentence:
+                    first_index = i
+                if tok.last_in_sentence:
                     position = end
-                    last_token = tok
-            if first_token is None:
-                yield sentence_dll.to_list()
+                    last_index = i
+            if first_index is None:
+                yield sentence
                 continue
-            s_start = first_token  # left of first token
-            s_end = last_token     # right of last token
-            lot = sentence_dll.last
+            s_start = first_index  # left of first token
+            s_end = last_index     # right of last token
+            # Tags that are closed before the sentence and after its
+            # last token (in reverse order)
+            closed_before = []
+            closed_after = []
+            # The tags that are closed before the sentence are put
+            # after the end tags of elements nested in them
+            before_index = 0
             for tag in tags:
-                # print(tag)
-                if tag["start"] == na:
-                    if tag["end"] == inside:
-                        ft = sentence_dll.first
-                        # close tag
-                        closing_tag = token.Token("</%s>" % tag["tag_name"], markup=True, markup_class="end", markup_eos=False, locked=True)
-                        sentence_dll.insert_left(closing_tag, ft)
-                        # put starting s-tag to the right
-                        assert sentence_dll.is_right_of(s_start, ft.prev)
-                        # re-open tag
+                if tag["sentence"] != sentence_number:
+                    if tag["end"] == start:
+                        before_index = max(before_index, tag["end_index"] + 1)
+                    elif tag["end"] == inside:
+                        closed_before.append(token.Token("</%s>" % tag["tag_name"], markup=True, markup_class="end", markup_eos=False, tag_name=tag["tag_name"], locked=True))
+                        # re-open tag after the starting s-tag
                         reopen_after_start.append(tag)
                 elif tag["start"] == start:
                     if tag["end"] == inside:
                         # put starting s-tag to the left
-                        if not sentence_dll.is_left_of(s_start, tag["start_token"]):
-                            s_start = tag["start_token"]
+                        s_start = min(s_start, tag["start_index"])
                 elif tag["start"] == inside:
                     if tag["end"] == end:
                         # put ending s-tag to the right
-                        if not sentence_dll.is_right_of(s_end, tag["end_token"]):
-                            s_end = tag["end_token"]
+                        s_end = max(s_end, tag["end_index"])
                     elif tag["end"] == na:
-                        # close tag
-                        closing_tag = token.Token("</%s>" % tag["tag_name"], markup=True, markup_class="end", markup_eos=False, locked=True)
-                        sentence_dll.insert_right(closing_tag, lot)
-                        # put ending s-tag
-                        if not sentence_dll.is_right_of(s_end, lot.next):
-                            # s_end = sentence_dll.last
-                            s_end = lot.next
+                        closed_after.append(token.Token("</%s>" % tag["tag_name"], markup=True, markup_class="end", markup_eos=False, tag_name=tag["tag_name"], locked=True))
                         # re-open tag
                         reopen_after_end.append(tag)
+                elif tag["start"] == end:
+                    # Tags that are opened after the last token are
+                    # nested in the tags that are closed after it
+                    if tag["end"] == na and len(closed_after) > 0:
+                        closed_after.append(token.Token("</%s>" % tag["tag_name"], markup=True, markup_class="end", markup_eos=False, tag_name=tag["tag_name"], locked=True))
+                        reopen_after_end.append(tag)
+            result = sentence[:before_index]
+            result.extend(reversed(closed_before))
+            result.extend(sentence[before_index:s_start])
             # starting s-tag
-            sentence_dll.insert_left(token.Token("<%s>" % s_tag, markup=True, markup_class="start", markup_eos=True, locked=True), s_start)
+            result.append(token.Token("<%s>" % s_tag, markup=True, markup_class="start", markup_eos=True, tag_name=s_tag, locked=True))
+            statistics["closed"] += len(closed_before) + len(closed_after)
+            statistics["reopened"] += len(reopen_after_start)
             while len(reopen_after_start) > 0:
-                tag = reopen_after_start.popleft()
-                sentence_dll.insert_left(tag["start_token"], s_start)
-            # ending s-tag
-            sentence_dll.insert_right(token.Token("</%s>" % s_tag, markup=True, markup_class="end", markup_eos=True, locked=True), s_end)
-            # for all tags on the stack, change start to na
-            for tag in open_tags:
-                tag["start"] = na
-            yield sentence_dll.to_list()
+                result.append(reopen_after_start.popleft()["start_token"])
+            # ending s-tag; it is put after the tags that are closed
+            # at the end of the sentence
+            s_end_tag = token.Token("</%s>" % s_tag, markup=True, markup_class="end", markup_eos=True, tag_name=s_tag, locked=True)
+            if len(closed_after) > 0:
+                result.extend(sentence[s_start:])
+                result.extend(reversed(closed_after))
+                result.append(s_end_tag)
+            else:
+                result.extend(sentence[s_start:s_end + 1])
+                result.append(s_end_tag)
+                result.extend(sentence[s_end + 1:])
+            # all tags on the stack now have the position na
+            sentence_number += 1
+            yield result
         assert len(open_tags) == 0
 
     def _merge_empty_sentences(self, tokens):
@@ -168,22 +247,63 @@ class SentenceSplitter():
                     previous = sentence
         yield previous
 
-    def _split_sentences(self, tokens):
-        """Split list of Token objects into sentences."""
-        tokens, sentence_boundaries = self._split_token_objects(tokens)
-        return [tokens[i:j] for i, j in zip([0] + sentence_boundaries[:-1], sentence_boundaries)]
+    def split(self, tokenized_paragraph, *, spans=False):
+        """Split tokenized_paragraph into sentences. If spans is True,
+        return (start, end) index pairs into tokenized_paragraph instead
+        of lists of tokens.
 
-    def split(self, tokenized_paragraph):
-        """Split tokenized_paragraph into sentences."""
+        """
         if self.is_tuple:
             tokens = [token.Token(t[0]) for t in tokenized_paragraph]
         else:
             tokens = [token.Token(t) for t in tokenized_paragraph]
         tokens, sentence_boundaries = self._split_token_objects(tokens)
-        return [tokenized_paragraph[i:j] for i, j in zip([0] + sentence_boundaries[:-1], sentence_boundaries)]
+        if spans:
+            return _spans(sentence_boundaries)
+        return [tokenized_paragraph[i:j] for i, j in _spans(sentence_boundaries)]
+
+    def split_many(self, tokenized_paragraphs, *, spans=False):
+        """Split a batch of tokenized paragraphs into sentences and
+        return a list with the result of split for every paragraph.
+
+        The tokens of the batch are encoded as an array of features
+        from which the sentence boundaries are derived (with NumPy if
+        it is installed), which is much faster than splitting the
+        paragraphs one by one.
+
+        """
+        tokenized_paragraphs = list(tokenized_paragraphs)
+        if self.is_tuple:
+            texts = (t[0] for paragraph in tokenized_paragraphs for t in paragraph)
+        else:
+            texts = itertools.chain.from_iterable(tokenized_paragraphs)
+        features = array.array("B", map(self._token_features, texts))
+        offsets = array.array("q", itertools.accumulate(itertools.chain([0], map(len, tokenized_paragraphs))))
+        if np is None:
+            ends = _sentence_ends_array(features, offsets)
+        else:
+            ends = _sentence_ends_numpy(features, offsets)
+        result = []
+        k = 0
+        for paragraph, start, end in zip(tokenized_paragraphs, offsets, offsets[1:]):
+            sentence_boundaries = []
+            while k < len(ends) and ends[k] <= end:
+                sentence_boundaries.append(ends[k] - start)
+                k += 1
+            if len(sentence_boundaries) == 0:
+                sentence_boundaries.append(0)
+            if spans:
+                result.append(_spans(sentence_boundaries))
+            else:
+                result.append([paragraph[i:j] for i, j in _spans(sentence_boundaries)])
+        return result
+
+    def split_xml(self, tokenized_xml, eos_tags=set(), *, spans=False):
+        """Split tokenized XML into sentences. If spans is True, return
+        (start, end) index pairs into tokenized_xml instead of lists of
+        tokens.
 
-    def split_xml(self, tokenized_xml, eos_tags=set()):
-        """Split tokenized XML into sentences."""
+        """
         opening_tag = re.compile(r"""<(?:[^\s:]+:)?([_A-Z][-.\w]*)(?:\s+[_:A-Z][-.:\w]*\s*=\s*(?:"[^"]*"|'[^']*'))*\s*/?>""", re.IGNORECASE)
         closing_tag = re.compile(r"^</([_:A-Z][-.:\w]*)\s*>$", re.IGNORECASE)
         if self.is_tuple:
@@ -198,10 +318,12 @@ class SentenceSplitter():
                 t.markup = True
                 t.markup_class = "start"
                 tagname = opening.group(1)
+                t.tag_name = tagname
             if closing:
                 t.markup = True
                 t.markup_class = "end"
                 tagname = closing.group(1)
+                t.tag_name = tagname
             if t.markup:
                 if tagname in eos_tags:
                     # previous non-markup is last_in_sentence
@@ -216,9 +338,17 @@ class SentenceSplitter():
                 t.first_in_sentence = True
                 first_token_in_sentence = False
         tokens, sentence_boundaries = self._split_token_objects(tokens)
-        return [tokenized_xml[i:j] for i, j in zip([0] + sentence_boundaries[:-1], sentence_boundaries)]
+        if spans:
+            return _spans(sentence_boundaries)
+        return [tokenized_xml[i:j] for i, j in _spans(sentence_boundaries)]
 
     def _split_token_objects(self, tokens):
+        """Mark the first and last tokens of the sentences and return the
+        tokens and the sentence boundaries (the end indexes of the
+        sentences, including trailing end tags), computed in a single
+        pass.
+
+        """
         n = len(tokens)
         # the first non-markup token is first_in_sentence
         for tok in tokens:
@@ -230,12 +360,25 @@ class SentenceSplitter():
             if not tok.markup:
                 tok.last_in_sentence = True
                 break
+        sentence_boundaries = []
+        # The boundary after the last token of a sentence is moved
+        # past any end tags that follow it. The lookahead only marks
+        # tokens to the right of i, so tokens[i] is final when we
+        # reach it.
+        boundary = None
         for i, tok in enumerate(tokens):
-            if tok.markup:
-                continue
+            if boundary is not None:
+                if tok.markup_class == "end":
+                    boundary += 1
+                    continue
+                sentence_boundaries.append(boundary)
+                boundary = None
             if tok.last_in_sentence:
+                boundary = i + 1
+                continue
+            if tok.markup:
                 continue
-            if self.sentence_ending_punct.search(tok.text) or tok.text.lower() in self.eos_abbreviations:
+            if self._is_sentence_ending(tok.text):
                 last = None
                 last_token_in_sentence = tok
                 first_token_in_sentence = None
@@ -249,12 +392,12 @@ class SentenceSplitter():
                     # Heuristically disambiguate problematic quotes:
                     if tok_j.text in self.problematic_quotes:
                         # opening: preceded by space or opening
-                        if tokens[j - 1].space_after or self.opening_punct.search(tokens[j - 1].text):
+                        if tokens[j - 1].space_after or self._is_opening(tokens[j - 1].text):
                             opening = True
                         # closing: last token or followed by space or closing
-                        elif j == n - 1 or tok_j.space_after or self.closing_punct.search(tokens[j + 1].text):
+                        elif j == n - 1 or tok_j.space_after or self._is_closing(tokens[j + 1].text):
                             closing = True
-                    if tok_j.text[0].isupper() or tok_j.text.isnumeric() or self.mention.search(tok_j.text) or self.hashtag.search(tok_j.text):
+                    if tok_j.text[0].isupper() or tok_j.text.isnumeric() or self._is_mention_or_hashtag(tok_j):
                         last_token_in_sentence.last_in_sentence = True
                         first_token_in_sentence.first_in_sentence = True
                         break
@@ -268,13 +411,78 @@ class SentenceSplitter():
                     elif tok_j.token_class == "emoticon" and last != "opening":
                         last_token_in_sentence = tok_j
                         first_token_in_sentence = None
-                    elif opening or (self.opening_punct.search(tok_j.text) and not closing):
+                    elif opening or (self._is_opening(tok_j.text) and not closing):
                         last = "opening"
-                    elif (closing or (self.closing_punct.search(tok_j.text) and not opening)) and last != "opening":
+                    elif (closing or (self._is_closing(tok_j.text) and not opening)) and last != "opening":
                         last_token_in_sentence = tok_j
                         first_token_in_sentence = None
                         last = "closing"
                     else:
                         break
-        sentence_boundaries = self._get_sentence_boundaries(tokens)
+                if tok.last_in_sentence:
+                    boundary = i + 1
+        if boundary is not None:
+            sentence_boundaries.append(boundary)
+        if len(sentence_boundaries) == 0:
+            sentence_boundaries.append(n)
+        if sentence_boundaries[-1] != n:
+            sentence_boundaries[-1] = n
         return tokens, sentence_boundaries
+
+
+def _spans(sentence_boundaries):
+    """Turn sentence boundaries into (start, end) pairs."""
+    return list(zip([0] + sentence_boundaries[:-1], sentence_boundaries))
+
+
+def _sentence_ends_numpy(features, offsets):
+    """Return the end indexes of all sentences in a batch of
+    paragraphs, given the token features and the paragraph offsets.
+
+    A sentence-ending token ends a sentence if it is followed by
+    closing punctuation, then opening punctuation and then a starting
+    token; the sentence also includes the closing punctuation.
+
+    """
+    n = len(features)
+    f = np.append(np.frombuffer(features, dtype=np.uint8), np.uint8(0))
+    offsets = np.frombuffer(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    positions = np.arange(n + 1)
+    # The next position at or after every position that is not
+    # closing (or opening) punctuation
+    next_not_closing = np.minimum.accumulate(np.where((f & _CLOSING) == 0, positions, n)[::-1])[::-1]
+    next_not_opening = np.minimum.accumulate(np.where((f & _OPENING) == 0, positions, n)[::-1])[::-1]
+    ending = np.flatnonzero(f[:-1] & _ENDING)
+    paragraph_end = np.repeat(offsets[1:], lengths)[ending]
+    after_closing = np.minimum(next_not_closing[ending + 1], paragraph_end)
+    after_opening = np.minimum(next_not_opening[after_closing], paragraph_end)
+    starting = (after_opening < paragraph_end) & ((f[after_opening] & _STARTING) != 0)
+    last = np.zeros(n + 1, dtype=bool)
+    last[after_closing[starting] - 1] = True
+    last[offsets[1:][lengths > 0] - 1] = True
+    return (np.flatnonzero(last) + 1).tolist()
+
+
+def _sentence_ends_array(features, offsets):
+    """Like _sentence_ends_numpy, without NumPy."""
+    n = len(features)
+    next_not_closing = array.array("q", range(n + 1))
+    next_not_opening = array.array("q", range(n + 1))
+    for i in range(n - 1, -1, -1):
+        if features[i] & _CLOSING:
+            next_not_closing[i] = next_not_closing[i + 1]
+        elif features[i] & _OPENING:
+            next_not_opening[i] = next_not_opening[i + 1]
+    ends = set()
+    for start, end in zip(offsets, offsets[1:]):
+        if start == end:
+            continue
+        for i in range(start, end):
+            if features[i] & _ENDING:
+                after_closing = min(next_not_closing[i + 1], end)
+                after_opening = min(next_not_opening[after_closing], end)
+                if after_opening < end and features[after_opening] & _STARTING:
+                    ends.add(after_closing)
+        ends.add(end)
+    return sorted(ends)
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+
+import argparse
+import bisect
+import collections
+import http.server
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socketserver
+import threading
+import time
+
+from . import (
+    SoMaJo,
+    __version__,
+    somajo,
+    utils
+)
+from .token import Token
+
+logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
+
+
+def arguments():
+    """"""
+    parser = argparse.ArgumentParser(description="Run a local tokenization server that keeps warm SoMaJo instances and answers JSON requests with NDJSON streams of sentences. POST {\"paragraphs\": [...]} to /tokenize; optional keys are language, split_camel_case, split_sentences, xml_sentences, character_offsets and deadline (in seconds). GET /metrics returns latency histograms and the queue depth.")
+    parser.add_argument("--host", default="127.0.0.1", help="Listen on this address. (Default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Listen on this port. (Default: 8080)")
+    parser.add_argument("--socket", metavar="PATH", help="Listen on the Unix socket PATH instead of a TCP port.")
+    parser.add_argument("--parallel", type=int, default=1, metavar="N", help="Run N worker processes (up to the number of CPUs) per combination of language and options.")
+    parser.add_argument("--backend", choices=sorted(SoMaJo.backends), default=SoMaJo._default_backend, help="Use worker processes or threads for --parallel. (Default: process)")
+    parser.add_argument("--batch-wait", type=float, default=0.005, metavar="SECONDS", help="Wait this long for concurrent requests to join a batch. (Default: 0.005)")
+    parser.add_argument("--max-batch", type=int, default=1000, metavar="N", help="Maximum number of paragraphs in a batch. (Default: 1000)")
+    parser.add_argument("--max-queue", type=int, default=1000, metavar="N", help="Reject requests with status 503 if N requests are already waiting. (Default: 1000)")
+    parser.add_argument("--max-instances", type=int, default=16, metavar="N", help="Keep at most N warm SoMaJo instances; the least recently used one is closed when a new combination of language and options is requested. (Default: 16)")
+    parser.add_argument("-v", "--version", action="version", version="SoMaJo %s" % __version__, help="Output version information and exit.")
+    args = parser.parse_args()
+    return args
+
+
+class DeadlineExceeded(Exception):
+    """The deadline of a request has passed."""
+
+
+def _token_dict(t):
+    """JSON representation of a Token."""
+    d = {"text": t.text, "token_class": t.token_class, "space_after": t.space_after}
+    if t.markup:
+        d["markup"] = True
+    if t.original_spelling is not None:
+        d["original_spelling"] = t.original_spelling
+    if t.character_offset is not None:
+        d["character_offset"] = list(t.character_offset)
+    return d
+
+
+class _Metrics:
+    """Request counters and latency histograms in the Prometheus text
+    format.
+
+    """
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "errors": 0, "deadline_exceeded": 0, "rejected": 0, "paragraphs": 0, "batches": 0}
+        self.histograms = {name: [[0] * (len(self.buckets) + 1), 0.0] for name in ("request_latency", "queue_latency", "batch_latency")}
+        self.queue_depth = 0
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms[name]
+            histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+
+    def waiting(self, n):
+        with self._lock:
+            self.queue_depth += n
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, value in self.counters.items():
+                lines.append("# TYPE somajo_%s_total counter" % name)
+                lines.append("somajo_%s_total %d" % (name, value))
+            lines.append("# TYPE somajo_queue_depth gauge")
+            lines.append("somajo_queue_depth %d" % self.queue_depth)
+            for name, (counts, total) in self.histograms.items():
+                lines.append("# TYPE somajo_%s_seconds histogram" % name)
+                cumulative = 0
+                for le, n in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+                    cumulative += n
+                    lines.append('somajo_%s_seconds_bucket{le="%s"} %d' % (name, le, cumulative))
+                lines.append("somajo_%s_seconds_sum %f" % (name, total))
+                lines.append("somajo_%s_seconds_count %d" % (name, cumulative))
+        return "\n".join(lines) + "\n"
+
+
+class _Job:
+    """The paragraphs of a single request. Results are put into the
+    queue as (paragraph index, sentences) pairs.
+
+    """
+
+    def __init__(self, paragraphs, deadline):
+        self.paragraphs = paragraphs
+        self.deadline = deadline
+        self.created = time.perf_counter()
+        self.results = queue.Queue()
+        self.cancelled = False
+
+
+class _Batcher(threading.Thread):
+    """Collect the jobs for a warm SoMaJo instance into batches and
+    tokenize them.
+
+    """
+
+    def __init__(self, tokenizer, metrics, parallel, backend, batch_wait, max_batch):
+        super().__init__(daemon=True)
+        self.tokenizer = tokenizer
+        self.metrics = metrics
+        self.parallel = parallel
+        self.backend = backend
+        self.batch_wait = batch_wait
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+        self.closed = False
+        self._lock = threading.Lock()
+        self.pool = None
+        if parallel > 1 and backend == "process":
+            self.n_workers = min(parallel, multiprocessing.cpu_count())
+            self.pool = multiprocessing.Pool(self.n_workers, initializer=somajo._init_worker, initargs=(tokenizer,))
+
+    def submit(self, job):
+        """Queue the job. Return False if the batcher is already closed."""
+        with self._lock:
+            if self.closed:
+                return False
+            self.metrics.waiting(1)
+            self.jobs.put(job)
+            return True
+
+    def close(self):
+        """Finish the queued jobs and stop the batcher."""
+        with self._lock:
+            self.closed = True
+            self.jobs.put(None)
+        self.join()
+        if self.pool is not None:
+            self.pool.terminate()
+
+    def _next_batch(self):
+        """Wait for a job and add the ones that arrive within
+        batch_wait seconds. Return None if the batcher is closed.
+
+        """
+        job = self.jobs.get()
+        if job is None:
+            return None
+        batch = [job]
+        n_paragraphs = len(job.paragraphs)
+        until = time.perf_counter() + self.batch_wait
+        while n_paragraphs < self.max_batch:
+            try:
+                job = self.jobs.get(timeout=max(until - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if job is None:
+                self.jobs.put(None)
+                break
+            batch.append(job)
+            n_paragraphs += len(job.paragraphs)
+        self.metrics.waiting(-len(batch))
+        return batch
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            now = time.perf_counter()
+            jobs, token_info = [], []
+            for job in batch:
+                self.metrics.observe("queue_latency", now - job.created)
+                if job.cancelled:
+                    continue
+                if job.deadline is not None and now > job.deadline:
+                    job.results.put(DeadlineExceeded())
+                    continue
+                for i, p in enumerate(job.paragraphs):
+                    jobs.append((job, i))
+                    token_info.append(([Token(p, first_in_sentence=True, last_in_sentence=True)], p, 0))
+            if len(token_info) == 0:
+                continue
+            self.metrics.count("batches")
+            self.metrics.count("paragraphs", len(token_info))
+            try:
+                for index, tokens in self._tokenize(token_info):
+                    job, i = jobs[index]
+                    if not job.cancelled:
+                        job.results.put((i, [[_token_dict(t) for t in sentence] for sentence in self.tokenizer._postprocess_paragraph(tokens)]))
+            except Exception as e:
+                logging.exception("Tokenization failed")
+                for job in {job for job, i in jobs}:
+                    job.results.put(e)
+            self.metrics.observe("batch_latency", time.perf_counter() - now)
+
+    def _tokenize(self, token_info):
+        """Yield (index, result of _tokenize) pairs as soon as they are
+        finished.
+
+        """
+        if self.pool is not None:
+            return self.tokenizer._batched_imap(self.pool, self.n_workers, token_info, False, ordered=False)
+        return self.tokenizer._tokenize_paragraphs(token_info, self.parallel, self.backend, False, False)
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "SoMaJo/%s" % __version__
+
+    def address_string(self):
+        # Unix sockets have no client address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        logging.debug("%s %s" % (self.address_string(), format % args))
+
+    def _send(self, status, body, content_type="application/json"):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self.server.metrics.count("errors")
+        self._send(status, json.dumps({"error": message}) + "\n")
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, self.server.metrics.render(), "text/plain; version=0.0.4")
+        else:
+            self._error(404, "Not found: %s" % self.path)
+
+    def do_POST(self):
+        if self.path != "/tokenize":
+            self._error(404, "Not found: %s" % self.path)
+            return
+        t0 = time.perf_counter()
+        self.server.metrics.count("requests")
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            paragraphs = request["paragraphs"]
+            if not (isinstance(paragraphs, list) and all(isinstance(p, str) for p in paragraphs)):
+                raise ValueError("'paragraphs' must be a list of strings")
+            language = request.get("language", SoMaJo._default_language)
+            options = {key: request[key] for key in ("split_camel_case", "split_sentences", "xml_sentences", "character_offsets") if key in request}
+            deadline = None
+            if request.get("deadline") is not None:
+                deadline = t0 + float(request["deadline"])
+            batcher = self.server.batcher(language, options)
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            self._error(400, "Bad request: %s" % (e if str(e) else type(e).__name__))
+            return
+        if self.server.metrics.queue_depth >= self.server.max_queue:
+            self.server.metrics.count("rejected")
+            self._error(503, "Too many requests are waiting")
+            return
+        job = _Job(paragraphs, deadline)
+        # the batcher may have been evicted in the meantime
+        while not batcher.submit(job):
+            batcher = self.server.batcher(language, options)
+        try:
+            self._stream(job)
+        finally:
+            job.cancelled = True
+            self.server.metrics.observe("request_latency", time.perf_counter() - t0)
+
+    def _results(self, job):
+        """Yield the (paragraph index, sentences) pairs of the job."""
+        for _ in range(len(job.paragraphs)):
+            timeout = None if job.deadline is None else max(job.deadline - time.perf_counter(), 0)
+            try:
+                result = job.results.get(timeout=timeout)
+            except queue.Empty:
+                raise DeadlineExceeded()
+            if isinstance(result, Exception):
+                raise result
+            yield result
+
+    def _stream(self, job):
+        """Write the sentences of the job as NDJSON in input order."""
+        started = False
+        try:
+            for i, sentences in utils.reorder(self._results(job), len(job.paragraphs)):
+                if not started:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.end_headers()
+                    started = True
+                self.wfile.write("".join(json.dumps({"paragraph": i, "sentence": j, "tokens": tokens}) + "\n" for j, tokens in enumerate(sentences)).encode("utf-8"))
+                self.wfile.flush()
+        except DeadlineExceeded:
+            self.server.metrics.count("deadline_exceeded")
+            if not started:
+                self._error(504, "Deadline exceeded")
+            else:
+                self.wfile.write((json.dumps({"error": "Deadline exceeded"}) + "\n").encode("utf-8"))
+            return
+        except Exception as e:
+            if not started:
+                self._error(500, "%s: %s" % (type(e).__name__, e))
+            else:
+                self.wfile.write((json.dumps({"error": "%s: %s" % (type(e).__name__, e)}) + "\n").encode("utf-8"))
+            return
+        if not started:
+            self._send(200, "", "application/x-ndjson")
+
+
+class _ServerMixin:
+    """Keep a warm SoMaJo instance (and batcher) for the max_instances
+    most recently used combinations of language and options.
+
+    """
+
+    daemon_threads = True
+
+    def _setup(self, parallel=1, backend="process", batch_wait=0.005, max_batch=1000, max_queue=1000, max_instances=16):
+        assert backend in SoMaJo.backends
+        assert max_instances > 0
+        self.parallel = parallel
+        self.backend = backend
+        self.batch_wait = batch_wait
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.max_instances = max_instances
+        self.metrics = _Metrics()
+        self._batchers = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _validate(language, options):
+        """Raise a ValueError if the language or an option has the
+        wrong type.
+
+        """
+        if not isinstance(language, str):
+            raise ValueError("'language' must be a string")
+        for key in ("split_camel_case", "split_sentences", "character_offsets"):
+            if key in options and not isinstance(options[key], bool):
+                raise ValueError("'%s' must be a boolean" % key)
+        if not isinstance(options.get("xml_sentences"), (str, type(None))):
+            raise ValueError("'xml_sentences' must be a string or null")
+
+    def batcher(self, language, options):
+        """Return the batcher for language and options, creating it if
+        necessary. The least recently used batcher is closed if there
+        are more than max_instances.
+
+        """
+        self._validate(language, options)
+        key = (language, tuple(sorted(options.items())))
+        evicted = None
+        with self._lock:
+            if key in self._batchers:
+                self._batchers.move_to_end(key)
+            else:
+                tokenizer = SoMaJo(language, **options)
+                batcher = _Batcher(tokenizer, self.metrics, self.parallel, self.backend, self.batch_wait, self.max_batch)
+                batcher.start()
+                self._batchers[key] = batcher
+                if len(self._batchers) > self.max_instances:
+                    evicted = self._batchers.popitem(last=False)[1]
+            batcher = self._batchers[key]
+        if evicted is not None:
+            # let the evicted batcher finish its queued jobs in the background
+            threading.Thread(target=evicted.close, daemon=True).start()
+        return batcher
+
+    def server_close(self):
+        super().server_close()
+        with self._lock:
+            for batcher in self._batchers.values():
+                batcher.close()
+            self._batchers.clear()
+
+
+class TokenizationServer(_ServerMixin, http.server.ThreadingHTTPServer):
+    """HTTP server for tokenization requests. Use port 0 to listen on
+    an arbitrary free port (see ``server_address``).
+
+    """
+
+    def __init__(self, server_address, **kwargs):
+        self._setup(**kwargs)
+        super().__init__(server_address, _RequestHandler)
+
+
+class UnixTokenizationServer(_ServerMixin, socketserver.ThreadingUnixStreamServer):
+    """Tokenization server that listens on a Unix socket."""
+
+    def __init__(self, path, **kwargs):
+        self._setup(**kwargs)
+        super().__init__(path, _RequestHandler)
+
+
+def main():
+    args = arguments()
+    kwargs = {"parallel": args.parallel, "backend": args.backend, "batch_wait": args.batch_wait, "max_batch": args.max_batch, "max_queue": args.max_queue, "max_instances": args.max_instances}
+    if args.socket is not None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixTokenizationServer(args.socket, **kwargs)
+        logging.info("Listening on %s" % args.socket)
+    else:
+        server = TokenizationServer((args.host, args.port), **kwargs)
+        logging.info("Listening on http://%s:%d" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,12 +1,25 @@
 #!/usr/bin/env python3
 
+import array
+import asyncio
+import collections
+import concurrent.futures
 import functools
 import itertools
+import logging
 import multiprocessing
+import operator
+import os
+import queue
+import threading
+import time
 
 from . import (
     alignment,
+    document,
     doubly_linked_list,
+    telemetry,
+    token,
     utils
 )
 from .sentence_splitter import SentenceSplitter
@@ -14,6 +27,49 @@ from .token import Token
 from .tokenizer import Tokenizer
 
 
+# The SoMaJo object used by the current worker process
+_worker_somajo = None
+
+
+def _init_worker(somajo):
+    """Make the SoMaJo object available to the worker process, so that
+    it does not have to be sent along with every batch.
+
+    """
+    global _worker_somajo
+    _worker_somajo = somajo
+
+
+def _tokenize_batch(start, batch, xml_input):
+    """Tokenize a batch of token_infos in a worker process. start is
+    the input index of the first token_info in the batch. An XmlSegment
+    is parsed into chunks first, each of which gives one result.
+
+    """
+    t0 = time.perf_counter()
+    tokens = []
+    # (size, elapsed time) for every result
+    timings = []
+    for ti in batch:
+        if isinstance(ti, utils.XmlSegment):
+            for chunk in utils.xml_segment_chunks(ti):
+                size = _worker_somajo._input_size(chunk)
+                t1 = time.perf_counter()
+                tokens.append(_worker_somajo._pack(*_worker_somajo._tokenize_flat(chunk, xml_input)))
+                timings.append((size, time.perf_counter() - t1))
+        else:
+            size = _worker_somajo._input_size(ti)
+            t1 = time.perf_counter()
+            tokens.append(_worker_somajo._tokenize_packed(ti, xml_input))
+            timings.append((size, time.perf_counter() - t1))
+    cache_statistics = None
+    if _worker_somajo.cache is not None:
+        cache_statistics = _worker_somajo.cache._take_statistics()
+    # The parent process counts the timeouts of all workers
+    regex_timeouts = _worker_somajo._tokenizer._take_timeouts()
+    return start, tokens, time.perf_counter() - t0, os.getpid(), cache_statistics, regex_timeouts, timings
+
+
 class SoMaJo:
     """Tokenization and sentence splitting.
 
@@ -35,6 +91,29 @@ class SoMaJo:
     character_offsets : bool, (default=False)
         Compute the character offsets in the input for each token.
         This allows for stand-off tokenization.
+    cache : ResultCache, optional (default=None)
+        Look up paragraphs of text in this cache before tokenizing
+        them, so that duplicate paragraphs are only tokenized once.
+        XML input is not cached.
+    observers : list, optional (default=None)
+        Callables that are called with a ``telemetry.ParagraphEvent``
+        for every tokenized paragraph, e.g. the sinks in
+        ``somajo.telemetry``. Observers are called in the main process
+        (or the thread that consumes the results) and can be added to
+        or removed from the ``observers`` attribute at any time.
+        However, paragraphs are only timed if there are observers when
+        a ``tokenize_*`` method is called; observers added to an empty
+        list take effect with the next call.
+    regex_timeout : float, optional (default=None)
+        Maximum time in seconds that a single tokenization rule may
+        take on a token. Some rules take quadratic time on
+        pathological input (e.g. thousands of "a." without spaces).
+        If a rule times out, it is skipped for that token, which is
+        left to the remaining rules, and a warning with the name of
+        the rule and a hash of the token is logged. As the output
+        then depends on the speed of the machine, the timeout is
+        disabled by default; see ``regex_timeouts`` for the number of
+        skipped rules.
 
     """
 
@@ -42,20 +121,108 @@ class SoMaJo:
     _default_language = "de_CMC"
     paragraph_separators = {"empty_lines", "single_newlines"}
     _default_parsep = "empty_lines"
+    backends = {"process", "thread", "serial"}
+    _default_backend = "process"
+    xml_parsers = set(utils.xml_parsers)
+    # Batches for worker processes are sized by number of characters;
+    # the size adapts so that each batch takes roughly _batch_latency
+    # seconds
+    _batch_latency = 0.1
+    _initial_batch_size = 10000
+    _min_batch_size = 1000
+    _max_batch_size = 1000000
+    # Minimum size of the segments of an XML document that are parsed
+    # by the worker processes
+    _xml_segment_size = 10000
 
-    def __init__(self, language, *, split_camel_case=False, split_sentences=True, xml_sentences=None, character_offsets=False):
+    def __init__(self, language, *, split_camel_case=False, split_sentences=True, xml_sentences=None, character_offsets=False, cache=None, observers=None, regex_timeout=None):
         assert language in self.supported_languages
         self.language = language
         self.split_camel_case = split_camel_case
         self.split_sentences = split_sentences
         self.xml_sentences = xml_sentences
         self.character_offsets = character_offsets
-        self._tokenizer = Tokenizer(split_camel_case=self.split_camel_case, language=self.language)
+        self.cache = cache
+        self.observers = [] if observers is None else list(observers)
+        # Options that affect the results of _tokenize
+        self._cache_options = (self.language, self.split_camel_case, self.split_sentences, self.character_offsets)
+        self._tokenizer = Tokenizer(split_camel_case=self.split_camel_case, language=self.language, regex_timeout=regex_timeout)
         if self.split_sentences:
             self._sentence_splitter = SentenceSplitter(language=self.language)
 
+    def __getstate__(self):
+        # Observers are only called in the main process
+        state = self.__dict__.copy()
+        state["observers"] = []
+        return state
+
+    @property
+    def xml_tag_statistics(self):
+        """Statistics of the tags that have been inserted to keep the
+        output well-formed if sentences are marked with XML tags
+        (``xml_sentences``): the numbers of closing tags (``closed``)
+        and of re-opened start tags (``reopened``) and the maximum
+        depth of nested elements (``max_depth``).
+
+        """
+        if not self.split_sentences:
+            return None
+        return self._sentence_splitter.xml_tag_statistics
+
+    @property
+    def regex_timeouts(self):
+        """The number of times each rule has timed out (see
+        ``regex_timeout``), also in the worker processes.
+
+        """
+        return self._tokenizer.regex_timeouts
+
     def _tokenize(self, token_info, xml_input):
         """Tokenize and sentence split a single token_dll."""
+        if isinstance(token_info, utils.FileSlice):
+            token_info = utils.read_slice(token_info)
+        if self.cache is not None and not xml_input:
+            return self._unpack(self._tokenize_cached(token_info))
+        return self._tokenize_uncached(token_info, xml_input)
+
+    def _tokenize_packed(self, token_info, xml_input):
+        """Tokenize a single token_dll and return the packed result."""
+        if isinstance(token_info, utils.FileSlice):
+            token_info = utils.read_slice(token_info)
+        if self.cache is not None and not xml_input:
+            return self._tokenize_cached(token_info)
+        return self._pack(*self._tokenize_flat(token_info, xml_input))
+
+    def _tokenize_cached(self, token_info):
+        """Look up a paragraph of text in the cache or tokenize it.
+        The cache stores packed results with character offsets
+        relative to the start of the paragraph.
+
+        """
+        token_list, raw, position = token_info
+        key = self.cache.key(raw, self._cache_options)
+        packed = self.cache.get(key)
+        if packed is None:
+            n_timeouts = self._tokenizer._timeouts_in_thread()
+            packed = self._pack(*self._tokenize_flat(token_info, False))
+            # Results that depend on a timeout are not cached
+            if self._tokenizer._timeouts_in_thread() == n_timeouts:
+                self.cache.put(key, (token.shift_packed_offsets(packed[0], -position), packed[1]))
+            return packed
+        return token.shift_packed_offsets(packed[0], position), packed[1]
+
+    def _tokenize_uncached(self, token_info, xml_input):
+        tokens, sentence_boundaries = self._tokenize_flat(token_info, xml_input)
+        if sentence_boundaries is None:
+            return tokens
+        return [tokens[i:j] for i, j in zip([0] + sentence_boundaries[:-1], sentence_boundaries)]
+
+    def _tokenize_flat(self, token_info, xml_input):
+        """Tokenize and sentence split a single token_dll without
+        copying the sentences. Return the tokens and the sentence
+        boundaries (None if sentences are not split).
+
+        """
         token_list, raw, position = token_info
         token_dll = doubly_linked_list.DLL(token_list)
         tokens = self._tokenizer._tokenize(token_dll)
@@ -64,31 +231,221 @@ class SoMaJo:
             for i in range(len(tokens)):
                 tokens[i].character_offset = offsets[i]
         if self.split_sentences:
-            tokens = self._sentence_splitter._split_sentences(tokens)
-        return tokens
+            return self._sentence_splitter._split_token_objects(tokens)
+        return tokens, None
+
+    def _pack(self, tokens, sentence_boundaries):
+        """Pack the result of _tokenize_flat for sending it to the
+        parent process.
+
+        """
+        if sentence_boundaries is None:
+            return token.pack_tokens(tokens), None
+        sentence_lengths = array.array("L", (j - i for i, j in zip([0] + sentence_boundaries[:-1], sentence_boundaries)))
+        return token.pack_tokens(tokens), sentence_lengths
+
+    def _unpack(self, packed):
+        """Restore the result of _tokenize from the output of _pack."""
+        packed_tokens, sentence_lengths = packed
+        tokens = token.unpack_tokens(packed_tokens)
+        if sentence_lengths is None:
+            return tokens
+        ends = list(itertools.accumulate(sentence_lengths))
+        return [tokens[i:j] for i, j in zip([0] + ends[:-1], ends)]
+
+    def _input_size(self, token_info):
+        """The size of a token_info or XmlSegment (in characters) or
+        FileSlice (in bytes).
+
+        """
+        if isinstance(token_info, utils.FileSlice):
+            return token_info.end - token_info.start
+        if isinstance(token_info, utils.XmlSegment):
+            return len(token_info.raw)
+        return sum(len(t.text) for t in token_info[0])
+
+    def _text_file_token_info(self, text_file, paragraph_separator, parallel, backend):
+        """Read paragraphs from a text file. Worker processes read the
+        paragraphs of uncompressed files themselves, so that only their
+        positions have to be sent to them.
+
+        """
+        if isinstance(text_file, str) and parallel > 1 and backend == "process":
+            slices = utils.get_paragraph_slices(text_file, paragraph_separator)
+            if slices is not None:
+                return slices
+        return utils.get_paragraphs_list(text_file, paragraph_separator)
+
+    def _batched_imap(self, pool, n_workers, token_info, xml_input, ordered=True, timed=False):
+        """Send token_infos to the worker processes in batches of roughly
+        equal size (in characters) and yield (index, result) pairs. A
+        token_info that is larger than the batch size is sent as a
+        batch of its own. The batch size is adjusted to the observed
+        throughput, and only a bounded number of batches is in flight
+        at any time. If ordered is False, results are yielded as soon
+        as their batch is finished. In ordered mode, the indexes count
+        results rather than token_infos, as an XmlSegment gives one
+        result per chunk. If timed is True, yield (index, result, size,
+        elapsed time, worker) tuples.
+
+        """
+        batch_size = self._initial_batch_size
+        pending = collections.OrderedDict()
+        done = queue.Queue()
+        statistics = collections.defaultdict(lambda: [0, 0, 0, 0.0])
+        token_info = enumerate(token_info)
+        carry = None
+        exhausted = False
+        n_results = 0
+        while True:
+            while not exhausted and len(pending) < 2 * n_workers:
+                batch, n_chars = [], 0
+                if carry is not None:
+                    batch.append(carry)
+                    n_chars = self._input_size(carry[1])
+                    carry = None
+                for i, ti in token_info:
+                    size = self._input_size(ti)
+                    if len(batch) > 0 and n_chars + size > batch_size:
+                        carry = (i, ti)
+                        break
+                    batch.append((i, ti))
+                    n_chars += size
+                else:
+                    exhausted = True
+                if len(batch) > 0:
+                    start = batch[0][0]
+                    args = (start, [ti for i, ti in batch], xml_input)
+                    if ordered:
+                        result = pool.apply_async(_tokenize_batch, args)
+                    else:
+                        result = pool.apply_async(_tokenize_batch, args, callback=done.put, error_callback=done.put)
+                    pending[start] = (result, len(batch), n_chars)
+            if len(pending) == 0:
+                break
+            if ordered:
+                start, tokens, elapsed, worker, cache_statistics, regex_timeouts, timings = pending[next(iter(pending))][0].get()
+            else:
+                finished = done.get()
+                if isinstance(finished, BaseException):
+                    raise finished
+                start, tokens, elapsed, worker, cache_statistics, regex_timeouts, timings = finished
+            result, n_items, n_chars = pending.pop(start)
+            if cache_statistics is not None:
+                self.cache._add_statistics(cache_statistics)
+            self._tokenizer._add_timeouts(regex_timeouts)
+            stats = statistics[worker]
+            stats[0] += 1
+            stats[1] += n_items
+            stats[2] += n_chars
+            stats[3] += elapsed
+            if elapsed > 0 and n_chars > 0:
+                target = n_chars / elapsed * self._batch_latency
+                batch_size = int(min(max((batch_size + target) / 2, self._min_batch_size), self._max_batch_size))
+            # Token objects are only created when the paragraph is needed
+            if ordered:
+                start = n_results
+                n_results += len(tokens)
+            if timed:
+                for i, (packed, (size, seconds)) in enumerate(zip(tokens, timings), start=start):
+                    yield i, self._unpack(packed), size, seconds, worker
+            else:
+                for i, packed in enumerate(tokens, start=start):
+                    yield i, self._unpack(packed)
+        for worker, (n_batches, n_items, n_chars, elapsed) in sorted(statistics.items()):
+            logging.info("Worker %d: %d paragraphs in %d batches, %d characters in %.1f seconds (%d characters/s)" % (worker, n_items, n_batches, n_chars, elapsed, n_chars / elapsed if elapsed > 0 else 0))
+
+    def _parallel_tokenize(self, token_info, *, parallel=1, backend="process", ordered=True, reorder_buffer=None, strip_tags=False, xml_input=False):
+        """Tokenize and sentence split an iterable of token_dlls; optional
+        parallelization. If ordered is False, yield (paragraph index,
+        sentence index, tokens) triples in the order in which the
+        paragraphs are finished.
+
+        """
+        if not ordered:
+            assert not (xml_input and self.split_sentences and self.xml_sentences is not None), "Cannot use `ordered=False` for XML input when SoMaJo is initialized with `xml_sentences`."
+        tokens = self._tokenize_paragraphs(token_info, parallel, backend, ordered, xml_input)
+        if not ordered:
+            if reorder_buffer is not None:
+                tokens = utils.reorder(tokens, reorder_buffer)
+            return self._postprocess_unordered(tokens, strip_tags)
+        return self._postprocess((par for i, par in tokens), strip_tags)
 
-    def _parallel_tokenize(self, token_info, *, parallel=1, strip_tags=False, xml_input=False):
+    def _tokenize_paragraphs(self, token_info, parallel, backend, ordered, xml_input):
         """Tokenize and sentence split an iterable of token_dlls; optional
-        parallelization.
+        parallelization. Yield (index, result of _tokenize) pairs. If
+        there are observers, they are notified about every result.
 
         """
+        assert backend in self.backends
+        timed = len(self.observers) > 0
+        tokenize = functools.partial(self._tokenize, xml_input=xml_input)
+        if timed:
+            def tokenize(ti, tokenize=tokenize):
+                size = self._input_size(ti)
+                t0 = time.perf_counter()
+                result = tokenize(ti)
+                return result, size, time.perf_counter() - t0, threading.get_native_id()
+
         def partok():
-            with multiprocessing.Pool(min(parallel, multiprocessing.cpu_count())) as pool:
-                tokens = pool.imap(
-                    functools.partial(self._tokenize, xml_input=xml_input),
-                    token_info,
-                    250
-                )
-                for par in tokens:
-                    yield par
-
-        if parallel > 1:
-            tokens = partok()
+            n_workers = min(parallel, multiprocessing.cpu_count())
+            with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=(self,)) as pool:
+                yield from self._batched_imap(pool, n_workers, token_info, xml_input, ordered, timed)
+
+        def threadtok():
+            # Keep a bounded number of paragraphs in flight, so that we
+            # do not read the whole input into memory
+            n_threads = min(parallel, multiprocessing.cpu_count())
+            with concurrent.futures.ThreadPoolExecutor(n_threads) as executor:
+                futures = collections.OrderedDict()
+                for i, ti in enumerate(token_info):
+                    futures[executor.submit(tokenize, ti)] = i
+                    while len(futures) >= 4 * n_threads:
+                        if ordered:
+                            finished = [next(iter(futures))]
+                        else:
+                            finished, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in finished:
+                            yield futures.pop(future), future.result()
+                remaining = futures if ordered else concurrent.futures.as_completed(futures)
+                for future in remaining:
+                    yield futures[future], future.result()
+
+        if parallel > 1 and backend == "process":
+            results = partok()
+        elif parallel > 1 and backend == "thread":
+            results = threadtok()
         else:
-            tokens = map(
-                functools.partial(self._tokenize, xml_input=xml_input),
-                token_info
-            )
+            results = enumerate(map(tokenize, token_info))
+        if timed:
+            if not (parallel > 1 and backend == "process"):
+                results = ((i, *r) for i, r in results)
+            return self._notify(results)
+        return results
+
+    def _notify(self, results):
+        """Send a ParagraphEvent to the observers for every (index,
+        result, size, elapsed time, worker) tuple and yield (index,
+        result) pairs.
+
+        """
+        for i, result, size, elapsed, worker in results:
+            sentences = result if self.split_sentences else [result]
+            n_tokens, n_sentences = 0, 0
+            for sentence in sentences:
+                n = sum(1 for t in sentence if not t.markup)
+                if n > 0:
+                    n_tokens += n
+                    n_sentences += 1
+            if not self.split_sentences:
+                n_sentences = 0
+            event = telemetry.ParagraphEvent(i, size, n_tokens, n_sentences, elapsed, worker)
+            for observer in self.observers:
+                observer(event)
+            yield i, result
+
+    def _postprocess(self, tokens, strip_tags):
+        """Merge empty sentences, strip tags and add sentence tags."""
         if self.split_sentences:
             tokens = itertools.chain.from_iterable(tokens)
             tokens = self._sentence_splitter._merge_empty_sentences(tokens)
@@ -98,49 +455,154 @@ class SoMaJo:
             tokens = self._sentence_splitter._add_xml_tags(tokens, s_tag=self.xml_sentences)
         return tokens
 
-    def _tokenize_text(self, token_info, parallel):
-        tokens = self._parallel_tokenize(token_info, parallel=parallel)
+    def _postprocess_unordered(self, tokens, strip_tags):
+        """Postprocess (index, paragraph) pairs one paragraph at a time
+        and yield (paragraph index, sentence index, tokens) triples.
+
+        """
+        for i, par in tokens:
+            if self.split_sentences:
+                sentences = self._sentence_splitter._merge_empty_sentences(par)
+            else:
+                sentences = [par]
+            if strip_tags:
+                sentences = ([t for t in sentence if not t.markup] for sentence in sentences)
+            if self.split_sentences and (self.xml_sentences is not None):
+                sentences = self._sentence_splitter._add_xml_tags(sentences, s_tag=self.xml_sentences)
+            sentences = [sentence for sentence in sentences if len(sentence) > 0]
+            for j, sentence in enumerate(sentences):
+                yield i, j, sentence
+
+    def _postprocess_paragraph(self, tokens):
+        """Postprocess a single tokenized paragraph and return its
+        non-empty sentences.
+
+        """
+        sentences = [sentence for _, _, sentence in self._postprocess_unordered([(0, tokens)], False)]
+        if self.xml_sentences:
+            sentences = list(map(utils.escape_xml_tokens, sentences))
+        return sentences
+
+    def _tokenize_corpus(self, paths, read, xml_input, strip_tags, escape, parallel, backend):
+        # All files are fed into a single pipeline, so that they share
+        # one pool of workers. We keep track of the file that each
+        # paragraph in flight belongs to.
+        file_indexes = collections.deque()
+
+        def token_info():
+            for i, path in enumerate(paths):
+                for ti in read(path):
+                    file_indexes.append(i)
+                    yield ti
+
+        paragraphs = self._tokenize_paragraphs(token_info(), parallel, backend, True, xml_input)
+        paragraphs = ((file_indexes.popleft(), par) for _, par in paragraphs)
+        next_file = 0
+        for i, group in itertools.groupby(paragraphs, key=operator.itemgetter(0)):
+            for empty in paths[next_file:i]:
+                yield empty, iter(())
+            tokens = self._postprocess((par for _, par in group), strip_tags)
+            if escape:
+                tokens = map(utils.escape_xml_tokens, tokens)
+            yield paths[i], tokens
+            next_file = i + 1
+        for empty in paths[next_file:]:
+            yield empty, iter(())
+
+    def _tokenize_text(self, token_info, parallel, backend, ordered, reorder_buffer):
+        tokens = self._parallel_tokenize(token_info, parallel=parallel, backend=backend, ordered=ordered, reorder_buffer=reorder_buffer)
         if self.xml_sentences:
-            tokens = map(utils.escape_xml_tokens, tokens)
+            tokens = self._escape_xml_tokens(tokens, ordered)
         return tokens
 
-    def _tokenize_xml(self, xml_data, is_file, eos_tags, strip_tags, parallel, prune_tags):
+    def _escape_xml_tokens(self, tokens, ordered):
+        if ordered:
+            return map(utils.escape_xml_tokens, tokens)
+        return ((i, j, utils.escape_xml_tokens(sentence)) for i, j, sentence in tokens)
+
+    def _xml_parser(self, xml_parser):
+        if xml_parser is None:
+            return utils.default_xml_parser
+        assert xml_parser in self.xml_parsers
+        return xml_parser
+
+    def _tokenize_xml(self, xml_data, is_file, eos_tags, strip_tags, parallel, backend, ordered, reorder_buffer, prune_tags, xml_parser):
+        xml_parser = self._xml_parser(xml_parser)
         if eos_tags is not None:
             eos_tags = set(eos_tags)
         if prune_tags is not None:
             prune_tags = set(prune_tags)
-            assert not self.character_offsets, "Cannot use `prune_tags` when SoMaJo is initialized with `character_offsets=True`."
-        token_info = utils.xml_chunk_generator(
-            xml_data,
-            is_file,
-            eos_tags=eos_tags,
-            prune_tags=prune_tags,
-            character_offsets=self.character_offsets
-        )
-        tokens = self._parallel_tokenize(token_info, parallel=parallel, strip_tags=strip_tags, xml_input=True)
+        if parallel > 1 and backend == "process" and ordered and eos_tags is not None:
+            # Worker processes parse segments of the document
+            # themselves, so that the parent only has to scan the
+            # markup for eos tags
+            token_info = utils.xml_segment_generator(
+                xml_data,
+                is_file,
+                eos_tags=eos_tags,
+                prune_tags=prune_tags,
+                character_offsets=self.character_offsets,
+                segment_size=self._xml_segment_size,
+                xml_parser=xml_parser
+            )
+        else:
+            token_info = utils.xml_chunk_generator(
+                xml_data,
+                is_file,
+                eos_tags=eos_tags,
+                prune_tags=prune_tags,
+                character_offsets=self.character_offsets,
+                xml_parser=xml_parser
+            )
+        tokens = self._parallel_tokenize(token_info, parallel=parallel, backend=backend, ordered=ordered, reorder_buffer=reorder_buffer, strip_tags=strip_tags, xml_input=True)
         if not (strip_tags and self.xml_sentences is None):
-            tokens = map(utils.escape_xml_tokens, tokens)
+            tokens = self._escape_xml_tokens(tokens, ordered)
         return tokens
 
-    def tokenize_text_file(self, text_file, paragraph_separator, *, parallel=1):
+    def tokenize_text_file(self, text_file, paragraph_separator, *, parallel=1, backend="process", ordered=True, reorder_buffer=None):
         """Split the contents of a text file into sequences of tokens.
 
         Parameters
         ----------
         text_file : str or file-like object
             Either a filename or a file-like object containing text.
+            Files compressed with gzip, bzip2, xz or Zstandard (the
+            latter requires the zstandard module) are decompressed on
+            the fly.
         paragraph_separator : {'single_newlines', 'empty_lines'}
             How are paragraphs separated in the input? Is there one
             paragraph per line ('single_newlines') or do paragraphs
             span several lines and are separated by 'empty_lines'?
         parallel : int, (default=1)
-            Number of processes to use.
+            Number of processes (or threads) to use.
+        backend : {'process', 'thread', 'serial'}, (default='process')
+            How to parallelize tokenization if ``parallel > 1``:
+            Use a pool of worker processes ('process'), a pool of
+            threads that share a single tokenizer ('thread'; most
+            useful on free-threaded Python builds) or no
+            parallelization at all ('serial').
+        ordered : bool, (default=True)
+            Yield the results in input order. If ``ordered=False``,
+            results are yielded as soon as they are ready, so that a
+            single slow paragraph does not hold back the others, and
+            every result is tagged with its position in the input
+            (see below).
+        reorder_buffer : int, optional (default=None)
+            Only used with ``ordered=False``: Restore the input order
+            as far as possible by keeping up to this many finished
+            paragraphs in memory. If the buffer is full, the paragraph
+            with the lowest index is yielded even if some of its
+            predecessors are not yet finished.
 
         Yields
         -------
         list
             The ``Token`` objects in a single sentence or paragraph
             (depending on the value of ``split_sentences``).
+        tuple
+            With ``ordered=False``: Triples of the index of the
+            paragraph in the input, the index of the sentence within
+            the paragraph and the list of ``Token`` objects.
 
         Examples
         --------
@@ -200,17 +662,19 @@ class SoMaJo:
 
         """
         assert paragraph_separator in self.paragraph_separators
-        token_info = utils.get_paragraphs_list(text_file, paragraph_separator)
-        return self._tokenize_text(token_info, parallel)
+        token_info = self._text_file_token_info(text_file, paragraph_separator, parallel, backend)
+        return self._tokenize_text(token_info, parallel, backend, ordered, reorder_buffer)
 
-    def tokenize_xml_file(self, xml_file, eos_tags, *, strip_tags=False, parallel=1, prune_tags=None):
+    def tokenize_xml_file(self, xml_file, eos_tags, *, strip_tags=False, parallel=1, backend="process", ordered=True, reorder_buffer=None, prune_tags=None, xml_parser=None):
         """Split the contents of an xml file into sequences of tokens.
 
         Parameters
         ----------
         xml_file : str or file-like object
             A file containing XML data. Either a filename or a
-            file-like object.
+            file-like object. Files compressed with gzip, bzip2, xz or
+            Zstandard (the latter requires the zstandard module) are
+            decompressed on the fly.
         eos_tags : iterable
             XML tags that constitute sentence breaks, i.e. tags that
             do not occur in the middle of a sentence. For HTML input,
@@ -220,12 +684,36 @@ class SoMaJo:
         strip_tags : bool, (default=False)
             Remove all XML tags from the output.
         parallel : int, (default=1)
-            Number of processes to use.
+            Number of processes (or threads) to use.
+        backend : {'process', 'thread', 'serial'}, (default='process')
+            How to parallelize tokenization if ``parallel > 1``:
+            Use a pool of worker processes ('process'), a pool of
+            threads that share a single tokenizer ('thread'; most
+            useful on free-threaded Python builds) or no
+            parallelization at all ('serial').
+        ordered : bool, (default=True)
+            Yield the results in input order. If ``ordered=False``,
+            results are yielded as soon as they are ready, so that a
+            single slow paragraph does not hold back the others, and
+            every result is tagged with its position in the input
+            (see below).
+        reorder_buffer : int, optional (default=None)
+            Only used with ``ordered=False``: Restore the input order
+            as far as possible by keeping up to this many finished
+            paragraphs in memory. If the buffer is full, the paragraph
+            with the lowest index is yielded even if some of its
+            predecessors are not yet finished.
         prune_tags : iterable
             These XML tags and their contents will be removed from the
             input before tokenization. For HTML input, you might use
             ``['script', 'style']`` or, depending on your use case,
             ``['head']``.
+        xml_parser : {'expat', 'lxml', 'sax'}, optional (default=None)
+            The XML parser to use. By default, the expat parser from
+            the standard library is used; lxml is faster but has to be
+            installed separately. All parsers raise
+            ``utils.XmlParseError`` (a subclass of
+            ``xml.sax.SAXParseException``) for ill-formed input.
 
         Yields
         -------
@@ -233,6 +721,10 @@ class SoMaJo:
             The ``Token`` objects in a single sentence or stretch of
             XML delimited by ``eos_tags`` (depending on the value of
             ``split_sentences``).
+        tuple
+            With ``ordered=False``: Triples of the index of the
+            paragraph in the input, the index of the sentence within
+            the paragraph and the list of ``Token`` objects.
 
         Examples
         --------
@@ -331,10 +823,14 @@ class SoMaJo:
             eos_tags=eos_tags,
             strip_tags=strip_tags,
             parallel=parallel,
-            prune_tags=prune_tags
+            backend=backend,
+            ordered=ordered,
+            reorder_buffer=reorder_buffer,
+            prune_tags=prune_tags,
+            xml_parser=xml_parser
         )
 
-    def tokenize_text(self, paragraphs, *, parallel=1):
+    def tokenize_text(self, paragraphs, *, parallel=1, backend="process", ordered=True, reorder_buffer=None):
         """Split paragraphs of text into sequences of tokens.
 
         Parameters
@@ -342,13 +838,35 @@ class SoMaJo:
         paragraphs : iterable
             An iterable of single paragraphs of text.
         parallel : int, (default=1)
-            Number of processes to use.
+            Number of processes (or threads) to use.
+        backend : {'process', 'thread', 'serial'}, (default='process')
+            How to parallelize tokenization if ``parallel > 1``:
+            Use a pool of worker processes ('process'), a pool of
+            threads that share a single tokenizer ('thread'; most
+            useful on free-threaded Python builds) or no
+            parallelization at all ('serial').
+        ordered : bool, (default=True)
+            Yield the results in input order. If ``ordered=False``,
+            results are yielded as soon as they are ready, so that a
+            single slow paragraph does not hold back the others, and
+            every result is tagged with its position in the input
+            (see below).
+        reorder_buffer : int, optional (default=None)
+            Only used with ``ordered=False``: Restore the input order
+            as far as possible by keeping up to this many finished
+            paragraphs in memory. If the buffer is full, the paragraph
+            with the lowest index is yielded even if some of its
+            predecessors are not yet finished.
 
         Yields
         ------
         list
             The ``Token`` objects in a single sentence or paragraph
             (depending on the value of ``split_sentences``).
+        tuple
+            With ``ordered=False``: Triples of the index of the
+            paragraph in the input, the index of the sentence within
+            the paragraph and the list of ``Token`` objects.
 
         Examples
         --------
@@ -436,9 +954,9 @@ class SoMaJo:
         if isinstance(paragraphs, str):
             raise TypeError("``paragraphs`` must be an iterable of strings, not a string!")
         token_info = (([Token(p, first_in_sentence=True, last_in_sentence=True)], p, 0) for p in paragraphs)
-        return self._tokenize_text(token_info, parallel)
+        return self._tokenize_text(token_info, parallel, backend, ordered, reorder_buffer)
 
-    def tokenize_xml(self, xml_data, eos_tags, *, strip_tags=False, parallel=1, prune_tags=None):
+    def tokenize_xml(self, xml_data, eos_tags, *, strip_tags=False, parallel=1, backend="process", ordered=True, reorder_buffer=None, prune_tags=None, xml_parser=None):
         """Split a string of XML data into sequences of tokens.
 
         Parameters
@@ -454,12 +972,36 @@ class SoMaJo:
         strip_tags : bool, (default=False)
             Remove the XML tags from the output.
         parallel : int, (default=1)
-            Number of processes to use.
+            Number of processes (or threads) to use.
+        backend : {'process', 'thread', 'serial'}, (default='process')
+            How to parallelize tokenization if ``parallel > 1``:
+            Use a pool of worker processes ('process'), a pool of
+            threads that share a single tokenizer ('thread'; most
+            useful on free-threaded Python builds) or no
+            parallelization at all ('serial').
+        ordered : bool, (default=True)
+            Yield the results in input order. If ``ordered=False``,
+            results are yielded as soon as they are ready, so that a
+            single slow paragraph does not hold back the others, and
+            every result is tagged with its position in the input
+            (see below).
+        reorder_buffer : int, optional (default=None)
+            Only used with ``ordered=False``: Restore the input order
+            as far as possible by keeping up to this many finished
+            paragraphs in memory. If the buffer is full, the paragraph
+            with the lowest index is yielded even if some of its
+            predecessors are not yet finished.
         prune_tags : iterable
             These XML tags and their contents will be removed from the
             input before tokenization. For HTML input, you might use
             ``['script', 'style']`` or, depending on your use case,
             ``['head']``.
+        xml_parser : {'expat', 'lxml', 'sax'}, optional (default=None)
+            The XML parser to use. By default, the expat parser from
+            the standard library is used; lxml is faster but has to be
+            installed separately. All parsers raise
+            ``utils.XmlParseError`` (a subclass of
+            ``xml.sax.SAXParseException``) for ill-formed input.
 
         Yields
         ------
@@ -467,6 +1009,10 @@ class SoMaJo:
             The ``Token`` objects in a single sentence or stretch of
             XML delimited by ``eos_tags`` (depending on the value of
             ``split_sentences``).
+        tuple
+            With ``ordered=False``: Triples of the index of the
+            paragraph in the input, the index of the sentence within
+            the paragraph and the list of ``Token`` objects.
 
         Examples
         --------
@@ -577,5 +1123,228 @@ class SoMaJo:
             eos_tags=eos_tags,
             strip_tags=strip_tags,
             parallel=parallel,
-            prune_tags=prune_tags
+            backend=backend,
+            ordered=ordered,
+            reorder_buffer=reorder_buffer,
+            prune_tags=prune_tags,
+            xml_parser=xml_parser
         )
+
+    def tokenize_corpus(self, paths, *, xml=False, paragraph_separator="empty_lines", eos_tags=None, strip_tags=False, prune_tags=None, parallel=1, backend="process", xml_parser=None):
+        """Split the contents of many files into sequences of tokens.
+
+        All files share a single pool of workers. To keep the workers
+        busy until the end, the files are processed largest-first.
+
+        Parameters
+        ----------
+        paths : iterable
+            The filenames of the input files. Compressed files are
+            decompressed on the fly.
+        xml : bool, (default=False)
+            The input files are XML files.
+        paragraph_separator : {'single_newlines', 'empty_lines'}
+            How are paragraphs separated in the input? Ignored if
+            ``xml=True``.
+        eos_tags : iterable
+            Only used with ``xml=True``: XML tags that constitute
+            sentence breaks.
+        strip_tags : bool, (default=False)
+            Only used with ``xml=True``: Remove the XML tags from the
+            output.
+        prune_tags : iterable
+            Only used with ``xml=True``: These XML tags and their
+            contents will be removed from the input before
+            tokenization.
+        xml_parser : {'expat', 'lxml', 'sax'}, optional (default=None)
+            Only used with ``xml=True``: The XML parser to use (by
+            default expat).
+        parallel : int, (default=1)
+            Number of processes (or threads) to use.
+        backend : {'process', 'thread', 'serial'}, (default='process')
+            How to parallelize tokenization if ``parallel > 1``.
+
+        Yields
+        ------
+        tuple
+            Pairs of a filename and an iterator over the sentences or
+            paragraphs in that file (lists of ``Token`` objects). The
+            files are yielded largest-first. Each iterator has to be
+            consumed before advancing to the next file.
+
+        Examples
+        --------
+
+        Tokenize two files and print one sentence per line:
+
+        >>> tokenizer = SoMaJo("de_CMC")
+        >>> for path, sentences in tokenizer.tokenize_corpus(["a.txt", "b.txt"]):
+        ...     print(path)
+        ...     for sentence in sentences:
+        ...         print(" ".join(token.text for token in sentence))
+        ...
+        b.txt
+        Was machst du morgen Abend ?!
+        Lust auf Film ? ;-)
+        a.txt
+        Heyi :)
+
+        """
+        if xml:
+            if eos_tags is not None:
+                eos_tags = set(eos_tags)
+            if prune_tags is not None:
+                prune_tags = set(prune_tags)
+            read = functools.partial(utils.xml_chunk_generator, is_file=True, eos_tags=eos_tags, prune_tags=prune_tags, character_offsets=self.character_offsets, xml_parser=self._xml_parser(xml_parser))
+            escape = not (strip_tags and self.xml_sentences is None)
+        else:
+            assert paragraph_separator in self.paragraph_separators
+            read = functools.partial(self._text_file_token_info, paragraph_separator=paragraph_separator, parallel=parallel, backend=backend)
+            escape = self.xml_sentences is not None
+            strip_tags = False
+        paths = sorted(paths, key=os.path.getsize, reverse=True)
+        return self._tokenize_corpus(paths, read, xml, strip_tags, escape, parallel, backend)
+
+    def tokenize_document(self, text, paragraph_separator="empty_lines", *, parallel=1, backend="process"):
+        """Tokenize a text that is going to be edited.
+
+        The returned ``TokenizedDocument`` keeps the tokens and
+        sentences of every paragraph. After an edit, only the
+        affected paragraphs are tokenized and sentence split again.
+
+        Parameters
+        ----------
+        text : str
+            The text of the document.
+        paragraph_separator : {'single_newlines', 'empty_lines'}
+            How are paragraphs separated in the text?
+        parallel : int, (default=1)
+            Number of processes (or threads) to use for the initial
+            tokenization. Edits are always processed serially.
+        backend : {'process', 'thread', 'serial'}, (default='process')
+            How to parallelize tokenization if ``parallel > 1``.
+
+        Returns
+        -------
+        TokenizedDocument
+            Iterating over it yields the sentences or paragraphs
+            (lists of ``Token`` objects); use its ``edit`` method to
+            change the text.
+
+        Examples
+        --------
+
+        Replace a word and print the sentences that have changed:
+
+        >>> tokenizer = SoMaJo("de_CMC")
+        >>> document = tokenizer.tokenize_document("Heyi:)\\n\\nWas machst du morgen Abend?! Lust auf Film?;-)\\n")
+        >>> diff = document.edit(22, 28, "heute")
+        >>> for sentence in diff.added:
+        ...     print(" ".join(token.text for token in sentence))
+        ...
+        Was machst du heute Abend ?!
+
+        """
+        assert paragraph_separator in self.paragraph_separators
+        return document.TokenizedDocument(self, text, paragraph_separator, parallel=parallel, backend=backend)
+
+    async def atokenize_text(self, paragraphs, *, parallel=1, backend="process", ordered=True, reorder_buffer=None, queue_size=100):
+        """Asynchronous version of ``tokenize_text``.
+
+        Tokenization runs in a separate thread (and, with ``parallel >
+        1``, in worker processes or threads), so that it does not
+        block the event loop. When the async generator is closed
+        early, the input is closed and the thread and the worker
+        processes are shut down.
+
+        Parameters
+        ----------
+        paragraphs : iterable or async iterable
+            Single paragraphs of text.
+        parallel : int, (default=1)
+            Number of processes (or threads) to use.
+        backend : {'process', 'thread', 'serial'}, (default='process')
+            How to parallelize tokenization if ``parallel > 1``.
+        ordered : bool, (default=True)
+            Yield the results in input order (see ``tokenize_text``).
+        reorder_buffer : int, optional (default=None)
+            Only used with ``ordered=False`` (see ``tokenize_text``).
+        queue_size : int, (default=100)
+            Maximum number of results that are produced ahead of the
+            consumer. Together with ``parallel``, this limits the
+            amount of work in flight: If the consumer is slow, no
+            further paragraphs are read.
+
+        Yields
+        ------
+        list
+            The ``Token`` objects in a single sentence or paragraph
+            (or triples with ``ordered=False``, see ``tokenize_text``).
+
+        Examples
+        --------
+
+        >>> tokenizer = SoMaJo("de_CMC")
+        >>> async def main():
+        ...     async for sentence in tokenizer.atokenize_text(["Heyi:)", "Was machst du morgen Abend?!"]):
+        ...         print(" ".join(token.text for token in sentence))
+        >>> asyncio.run(main())
+        Heyi :)
+        Was machst du morgen Abend ?!
+
+        """
+        if isinstance(paragraphs, str):
+            raise TypeError("``paragraphs`` must be an iterable of strings, not a string!")
+        loop = asyncio.get_running_loop()
+        stopped = threading.Event()
+
+        def tokenize():
+            return self.tokenize_text(utils.iterate_async(paragraphs, loop, stopped), parallel=parallel, backend=backend, ordered=ordered, reorder_buffer=reorder_buffer)
+
+        results = utils.iterate_in_thread(tokenize, queue_size, stopped)
+        try:
+            async for result in results:
+                yield result
+        finally:
+            await results.aclose()
+
+    async def atokenize_text_file(self, text_file, paragraph_separator, *, parallel=1, backend="process", ordered=True, reorder_buffer=None, queue_size=100):
+        """Asynchronous version of ``tokenize_text_file``.
+
+        The file is read and tokenized in a separate thread (and, with
+        ``parallel > 1``, in worker processes or threads). See
+        ``atokenize_text`` for the parameter ``queue_size`` and
+        ``tokenize_text_file`` for the others.
+
+        """
+        assert paragraph_separator in self.paragraph_separators
+
+        def tokenize():
+            return self.tokenize_text_file(text_file, paragraph_separator, parallel=parallel, backend=backend, ordered=ordered, reorder_buffer=reorder_buffer)
+
+        results = utils.iterate_in_thread(tokenize, queue_size)
+        try:
+            async for result in results:
+                yield result
+        finally:
+            await results.aclose()
+
+    async def atokenize_xml(self, xml_data, eos_tags, *, strip_tags=False, parallel=1, backend="process", ordered=True, reorder_buffer=None, prune_tags=None, xml_parser=None, queue_size=100):
+        """Asynchronous version of ``tokenize_xml``.
+
+        The XML data is parsed and tokenized in a separate thread
+        (and, with ``parallel > 1``, in worker processes or threads).
+        See ``atokenize_text`` for the parameter ``queue_size`` and
+        ``tokenize_xml`` for the others.
+
+        """
+
+        def tokenize():
+            return self.tokenize_xml(xml_data, eos_tags, strip_tags=strip_tags, parallel=parallel, backend=backend, ordered=ordered, reorder_buffer=reorder_buffer, prune_tags=prune_tags, xml_parser=xml_parser)
+
+        results = utils.iterate_in_thread(tokenize, queue_size)
+        try:
+            async for result in results:
+                yield result
+        finally:
+            await results.aclose()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import bisect
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+
+# The event that the observers of a SoMaJo object receive for every
+# tokenized paragraph (or chunk of XML between two eos tags): its
+# index in the input, its size in characters (in bytes for text files
+# that are read by worker processes), the numbers of tokens (without
+# markup) and sentences, the time that tokenization took and the id of
+# the worker process or thread.
+ParagraphEvent = collections.namedtuple("ParagraphEvent", ["index", "characters", "tokens", "sentences", "elapsed", "worker"])
+
+
+class ProgressLogger:
+    """Log the progress and throughput every interval seconds.
+
+    Besides the totals, every message gives the throughput since the
+    previous message, so that a degrading throughput becomes visible,
+    and the slowest paragraph in that period.
+
+    Parameters
+    ----------
+    interval : float, (default=10.0)
+        Seconds between two messages.
+
+    """
+
+    def __init__(self, interval=10.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        # Time is measured from the first event
+        self._t0 = None
+        self._last = None
+        self._totals = [0, 0, 0, 0]
+        self._window = [0, 0, 0, 0]
+        self._slowest = None
+
+    def __call__(self, event):
+        with self._lock:
+            if self._t0 is None:
+                self._t0 = self._last = time.perf_counter()
+            for counts in (self._totals, self._window):
+                counts[0] += 1
+                counts[1] += event.characters
+                counts[2] += event.tokens
+                counts[3] += event.sentences
+            if self._slowest is None or event.elapsed > self._slowest.elapsed:
+                self._slowest = event
+            now = time.perf_counter()
+            if now - self._last >= self.interval:
+                self._log(now)
+
+    def _log(self, now):
+        paragraphs, characters, tokens, sentences = self._totals
+        seconds = now - self._last
+        rate = (self._window[2] / seconds, self._window[1] / seconds) if seconds > 0 else (0, 0)
+        logging.info("Progress: %d paragraphs, %d tokens, %d sentences in %d seconds; %d tokens/s (%d characters/s) in the last %.1f seconds; slowest paragraph: %d (%d characters, %.3f seconds)" % (paragraphs, tokens, sentences, now - self._t0, rate[0], rate[1], seconds, self._slowest.index, self._slowest.characters, self._slowest.elapsed))
+        self._last = now
+        self._window = [0, 0, 0, 0]
+        self._slowest = None
+
+    def close(self):
+        """Log the final state."""
+        with self._lock:
+            if self._window[0] > 0:
+                self._log(time.perf_counter())
+
+
+class PrometheusExporter:
+    """Write counters, a histogram of the time per paragraph and the
+    time per worker to a file in the Prometheus text format every
+    interval seconds, e.g. for the textfile collector of the node
+    exporter. The file is replaced atomically.
+
+    Parameters
+    ----------
+    path : str
+        Filename of the metrics file.
+    interval : float, (default=10.0)
+        Seconds between two updates of the file.
+
+    """
+
+    buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self, path, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = time.perf_counter()
+        self.counters = {"paragraphs": 0, "characters": 0, "tokens": 0, "sentences": 0}
+        self.histogram = [[0] * (len(self.buckets) + 1), 0.0]
+        self.workers = collections.defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, event):
+        with self._lock:
+            self.counters["paragraphs"] += 1
+            self.counters["characters"] += event.characters
+            self.counters["tokens"] += event.tokens
+            self.counters["sentences"] += event.sentences
+            self.histogram[0][bisect.bisect_left(self.buckets, event.elapsed)] += 1
+            self.histogram[1] += event.elapsed
+            worker = self.workers[event.worker]
+            worker[0] += 1
+            worker[1] += event.elapsed
+            now = time.perf_counter()
+            if now - self._last >= self.interval:
+                self._write()
+                self._last = now
+
+    def render(self):
+        """Return the metrics in the Prometheus text format."""
+        lines = []
+        for name, value in self.counters.items():
+            lines.append("# TYPE somajo_%s_total counter" % name)
+            lines.append("somajo_%s_total %d" % (name, value))
+        lines.append("# TYPE somajo_paragraph_seconds histogram")
+        counts, total = self.histogram
+        cumulative = 0
+        for le, n in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+            cumulative += n
+            lines.append('somajo_paragraph_seconds_bucket{le="%s"} %d' % (le, cumulative))
+        lines.append("somajo_paragraph_seconds_sum %f" % total)
+        lines.append("somajo_paragraph_seconds_count %d" % cumulative)
+        lines.append("# TYPE somajo_worker_paragraphs_total counter")
+        for worker, (n, seconds) in sorted(self.workers.items()):
+            lines.append('somajo_worker_paragraphs_total{worker="%s"} %d' % (worker, n))
+        lines.append("# TYPE somajo_worker_seconds_total counter")
+        for worker, (n, seconds) in sorted(self.workers.items()):
+            lines.append('somajo_worker_seconds_total{worker="%s"} %f' % (worker, seconds))
+        return "\n".join(lines) + "\n"
+
+    def _write(self):
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(self.render())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        """Write the final state."""
+        with self._lock:
+            self._write()
+
+
+class JsonLinesWriter:
+    """Write every event as a JSON object on a line of its own.
+
+    Parameters
+    ----------
+    file : str or file-like object
+        Filename or file object (opened in text mode).
+
+    """
+
+    def __init__(self, file):
+        self._close = isinstance(file, str)
+        self.fh = open(file, "w", encoding="utf-8") if self._close else file
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event._asdict())
+        with self._lock:
+            self.fh.write(line + "\n")
+
+    def close(self):
+        """Close the file if it has been opened by the writer."""
+        with self._lock:
+            if self._close:
+                self.fh.close()
+            else:
+                self.fh.flush()
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+import array
+import itertools
+
 
 class Token:
     """Token objects store a piece of text (in the end a single token) with additional information.
@@ -14,6 +17,9 @@ class Token:
         If `markup=True`, then `markup_class` must be either "start" or "end".
     markup_eos : bool, optional (default=None)
         Is the markup token a sentence boundary?
+    tag_name : str, optional (default=None)
+        The name of the element of a markup token. If not given, it
+        is taken from `text`.
     locked : bool, (default=False)
         Mark the token as locked.
     token_class : {'URL', 'XML_entity', 'XML_tag', 'abbreviation', 'action_word', 'amount', 'date', 'email_address', 'emoticon', 'hashtag', 'measurement', 'mention', 'number', 'ordinal', 'regular', 'semester', 'symbol', 'time'}, optional (default=None)
@@ -61,6 +67,7 @@ class Token:
             markup=False,
             markup_class=None,
             markup_eos=None,
+            tag_name=None,
             locked=False,
             token_class=None,
             space_after=True,
@@ -79,22 +86,59 @@ class Token:
         if markup_eos is not None:
             assert markup, "You can only use `markup_eos` for markup tokens."
             assert isinstance(markup_eos, bool), f"'{markup_eos}' is not a Boolean value."
+        if tag_name is not None:
+            assert markup, "You can only specify a `tag_name` for markup tokens."
+        elif markup:
+            tag_name = _tag_name(text)
         if token_class is not None:
             assert token_class in self.token_classes, f"'{token_class}' is not a recognized token class."
         self.markup = markup
         self.markup_class = markup_class
         self.markup_eos = markup_eos
+        self.tag_name = tag_name
         self._locked = locked
-        self.token_class = token_class
+        self._class_code = _class_codes[token_class]
         self.space_after = space_after
         self.original_spelling = original_spelling
         self.first_in_sentence = first_in_sentence
         self.last_in_sentence = last_in_sentence
         self.character_offset = character_offset
 
+    @classmethod
+    def _new(cls, text, class_code, space_after, original_spelling, first_in_sentence, last_in_sentence, locked=False):
+        """Create a non-markup token without validating the arguments.
+        For the tokenizer's own use; class_code is an entry of
+        _class_codes.
+
+        """
+        t = object.__new__(cls)
+        t.text = text
+        t.markup = False
+        t.markup_class = None
+        t.markup_eos = None
+        t.tag_name = None
+        t._locked = locked
+        t._class_code = class_code
+        t.space_after = space_after
+        t.original_spelling = original_spelling
+        t.first_in_sentence = first_in_sentence
+        t.last_in_sentence = last_in_sentence
+        t.character_offset = None
+        return t
+
     def __str__(self):
         return self.text
 
+    @property
+    def token_class(self):
+        """The class of the token, e.g. "regular", "emoticon", "URL", etc."""
+        return _class_names[self._class_code]
+
+    @token_class.setter
+    def token_class(self, token_class):
+        assert token_class is None or token_class in self.token_classes, f"'{token_class}' is not a recognized token class."
+        self._class_code = _class_codes[token_class]
+
     @property
     def extra_info(self):
         """String representation of extra information.
@@ -119,3 +163,117 @@ class Token:
         if self.original_spelling is not None:
             info.append("OriginalSpelling=\"%s\"" % self.original_spelling)
         return ", ".join(info)
+
+
+def _tag_name(text):
+    """Return the element name of a start or end tag."""
+    if text.startswith("</"):
+        return text[2:-1]
+    return text[1:-1].split(" ", 1)[0]
+
+
+# Tokens store their class as a small integer, which is also used for
+# packed tokens; code 0 is reserved for None
+_class_names = [None] + sorted(Token.token_classes)
+_class_codes = {tc: i for i, tc in enumerate(_class_names)}
+
+# Bit flags for packed tokens
+_MARKUP, _START, _END, _EOS, _LOCKED, _SPACE_AFTER, _FIRST, _LAST = (1 << i for i in range(8))
+
+
+def _compact_array(values):
+    """Store integers in an array with the smallest sufficient item size."""
+    low, high = min(values, default=0), max(values, default=0)
+    for typecode in ("b", "h", "l", "q") if low < 0 else ("B", "H", "L", "Q"):
+        item_bits = 8 * array.array(typecode).itemsize
+        if low < 0 and -(1 << (item_bits - 1)) <= low and high < (1 << (item_bits - 1)):
+            return array.array(typecode, values)
+        if low >= 0 and high < (1 << item_bits):
+            return array.array(typecode, values)
+    raise OverflowError("Integer too large to be packed")
+
+
+def pack_tokens(tokens):
+    """Pack a list of Token objects into a compact tuple of strings
+    and arrays that is much cheaper to pickle than the Token objects
+    themselves.
+
+    """
+    classes = bytearray()
+    flags = bytearray()
+    spellings = {}
+    for i, t in enumerate(tokens):
+        classes.append(t._class_code)
+        flags.append(
+            (_MARKUP if t.markup else 0) |
+            (_START if t.markup_class == "start" else 0) |
+            (_END if t.markup_class == "end" else 0) |
+            (_EOS if t.markup_eos else 0) |
+            (_LOCKED if t._locked else 0) |
+            (_SPACE_AFTER if t.space_after else 0) |
+            (_FIRST if t.first_in_sentence else 0) |
+            (_LAST if t.last_in_sentence else 0)
+        )
+        if t.original_spelling is not None:
+            spellings[i] = t.original_spelling
+    offsets = None
+    if len(tokens) > 0 and tokens[0].character_offset is not None:
+        # offsets are stored as distance to the end of the previous
+        # token and length, which are usually small numbers
+        base = tokens[0].character_offset[0]
+        deltas = []
+        previous_end = base
+        for t in tokens:
+            start, end = t.character_offset
+            deltas.append(start - previous_end)
+            deltas.append(end - start)
+            previous_end = end
+        offsets = (base, _compact_array(deltas))
+    lengths = _compact_array([len(t.text) for t in tokens])
+    return "".join(t.text for t in tokens), lengths, bytes(classes), bytes(flags), spellings, offsets
+
+
+def shift_packed_offsets(packed, shift):
+    """Move the character offsets in the output of pack_tokens by shift
+    characters.
+
+    """
+    offsets = packed[5]
+    if offsets is None or shift == 0:
+        return packed
+    return packed[:5] + ((offsets[0] + shift, offsets[1]),)
+
+
+def unpack_tokens(packed):
+    """Turn the output of pack_tokens back into a list of Token objects."""
+    text, lengths, classes, flags, spellings, offsets = packed
+    character_offsets = itertools.repeat(None)
+    if offsets is not None:
+        base, deltas = offsets
+        character_offsets = []
+        previous_end = base
+        for i in range(0, len(deltas), 2):
+            start = previous_end + deltas[i]
+            previous_end = start + deltas[i + 1]
+            character_offsets.append((start, previous_end))
+    tokens = []
+    start = 0
+    for i, (length, token_class, flag, character_offset) in enumerate(zip(lengths, classes, flags, character_offsets)):
+        t = Token._new(
+            text[start:start + length],
+            token_class,
+            bool(flag & _SPACE_AFTER),
+            spellings.get(i),
+            bool(flag & _FIRST),
+            bool(flag & _LAST),
+            bool(flag & _LOCKED)
+        )
+        if flag & _MARKUP:
+            t.markup = True
+            t.markup_class = "start" if flag & _START else "end"
+            t.markup_eos = bool(flag & _EOS)
+            t.tag_name = _tag_name(t.text)
+        t.character_offset = character_offset
+        tokens.append(t)
+        start += length
+    return tokens
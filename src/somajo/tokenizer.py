@@ -1,37 +1,59 @@
 #!/usr/bin/env python3
 
+import collections
+import hashlib
 import itertools
 import logging
 import operator
+import threading
 import unicodedata
 
 import regex as re
 
 from . import (
     doubly_linked_list,
+    token,
     utils
 )
 from .token import Token
 
+_REGULAR = token._class_codes["regular"]
+
 
 class Tokenizer():
 
     _supported_languages = {"de", "de_CMC", "en", "en_PTB"}
     _default_language = "de_CMC"
+    # Some of the regular expressions take quadratic time on
+    # pathological input (e.g. long sequences of "a." or "1."). Texts
+    # shorter than this are matched without a timeout, as they cannot
+    # be slow enough to matter and the timeout has a per-call overhead.
+    _regex_timeout_length = 256
 
-    def __init__(self, split_camel_case=False, token_classes=False, extra_info=False, language="de_CMC"):
+    def __init__(self, split_camel_case=False, token_classes=False, extra_info=False, language="de_CMC", regex_timeout=None):
         """Create a Tokenizer object. If split_camel_case is set to True,
         tokens written in CamelCase will be split. If token_classes is
         set to true, the tokenizer will output the token class for
         each token (if it is a number, an XML tag, an abbreviation,
         etc.). If extra_info is set to True, the tokenizer will output
-        information about the original spelling of the tokens.
+        information about the original spelling of the tokens. If
+        applying a single rule to a token takes longer than
+        regex_timeout seconds, the rule is skipped for that token,
+        i.e. the token is left to the remaining rules (None, the
+        default, disables the timeout).
 
         """
         self.split_camel_case = split_camel_case
         self.token_classes = token_classes
         self.extra_info = extra_info
         self.language = language if language in self._supported_languages else self.default_language
+        self.regex_timeout = regex_timeout
+        # Number of timeouts per rule and per thread. The tokenizer is
+        # shared by the threads of the thread backend, so the counters
+        # are guarded by a lock.
+        self.regex_timeouts = collections.Counter()
+        self._thread_timeouts = collections.Counter()
+        self._timeouts_lock = threading.Lock()
 
         self.spaces = re.compile(r"\s+")
         self.spaces_or_empty = re.compile(r"^\s*$")
@@ -446,12 +468,132 @@ class Tokenizer():
         self.dot = re.compile(r'(\.)')
         # Soft hyphen ­ „“
 
+        # Groups of adjacent rules that are applied in a single scan
+        self.url_rules = self._fuse_rules([
+            (self.markdown_links, "symbol", {}),
+            (self.simple_url_with_brackets, "URL", {}),
+            (self.simple_url, "URL", {}),
+            (self.doi, "URL", {}),
+            (self.doi_with_space, "URL", {}),
+            (self.url_without_protocol, "URL", {}),
+            (self.reddit_links, "URL", {}),
+        ])
+        split_dates = False if self.language == "en" or self.language == "en_PTB" else True
+        self.date_rules = self._fuse_rules([
+            (self.three_part_date_year_first, "date", {"split_named_subgroups": split_dates}),
+            (self.three_part_date_dmy, "date", {"split_named_subgroups": split_dates}),
+            (self.three_part_date_mdy, "date", {"split_named_subgroups": split_dates}),
+            (self.two_part_date, "date", {"split_named_subgroups": split_dates}),
+        ])
+        self.number_rules = self._fuse_rules([
+            (self.number, "number", {}),
+            (self.ipv4, "number", {}),
+            (self.section_number, "number", {}),
+        ])
+        self.en_contraction_rules = self._fuse_rules([(contr, "regular", {}) for contr in self.en_twopart_contractions + self.en_threepart_contractions])
+
+    def _fuse_rules(self, rules):
+        """Combine a list of rules, i.e. (regex, token_class, kwargs)
+        tuples, into a rule group that can be applied with
+        _split_all_matches_fused. The rule group has a trigger regex
+        that matches wherever at least one of the rules matches.
+
+        """
+        inline_flags = [(re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x")]
+        alternatives = []
+        for regex, token_class, kwargs in rules:
+            flags = "".join(f for flag, f in inline_flags if regex.flags & flag)
+            # Group names are not unique across rules; the branch
+            # reset group keeps numbered backreferences intact
+            pattern = re.sub(r"\(\?P<\w+>", "(", regex.pattern)
+            if regex.flags & re.VERBOSE:
+                pattern += "\n"
+            alternatives.append(f"(?{flags}:{pattern})")
+        trigger = re.compile(r"(?|" + r"|".join(alternatives) + r")")
+        return trigger, rules
+
+    def _rule_name(self, regex):
+        """Return the name of the attribute that holds regex."""
+        for name, value in vars(self).items():
+            if value is regex:
+                return name
+            if isinstance(value, list) and any(v is regex for v in value):
+                return "%s[%d]" % (name, next(i for i, v in enumerate(value) if v is regex))
+            if isinstance(value, tuple) and len(value) > 0 and value[0] is regex:
+                return name
+        return regex.pattern
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_timeouts_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._timeouts_lock = threading.Lock()
+
+    def _timeouts_in_thread(self):
+        """Return the number of timeouts in the current thread. As
+        thread identifiers can be reused, only differences between two
+        calls in the same thread are meaningful.
+
+        """
+        with self._timeouts_lock:
+            return self._thread_timeouts[threading.get_ident()]
+
+    def _take_timeouts(self):
+        """Return the timeouts per rule and reset the counters."""
+        with self._timeouts_lock:
+            counts = self.regex_timeouts.copy()
+            self.regex_timeouts.clear()
+            self._thread_timeouts.clear()
+        return counts
+
+    def _add_timeouts(self, counts):
+        """Add the timeouts per rule of a worker process."""
+        with self._timeouts_lock:
+            self.regex_timeouts.update(counts)
+
+    def _timed_out(self, regex, text):
+        """Count and log a timeout of regex on text."""
+        name = self._rule_name(regex)
+        with self._timeouts_lock:
+            self.regex_timeouts[name] += 1
+            self._thread_timeouts[threading.get_ident()] += 1
+        digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+        logging.warning("Rule %s timed out after %s seconds on a token of %d characters (hash %s); leaving the token to the remaining rules" % (name, self.regex_timeout, len(text), digest))
+
+    def _finditer(self, regex, text):
+        """Return the matches for regex in text. If matching takes longer
+        than regex_timeout seconds, log the rule and a hash of the text
+        and return no matches.
+
+        """
+        if self.regex_timeout is None or len(text) < self._regex_timeout_length:
+            return regex.finditer(text)
+        try:
+            return list(regex.finditer(text, timeout=self.regex_timeout))
+        except TimeoutError:
+            self._timed_out(regex, text)
+            return []
+
+    def _search(self, regex, text):
+        """Like _finditer, but return the first match or None."""
+        if self.regex_timeout is None or len(text) < self._regex_timeout_length:
+            return regex.search(text)
+        try:
+            return regex.search(text, timeout=self.regex_timeout)
+        except TimeoutError:
+            self._timed_out(regex, text)
+            return None
+
     def _split_on_boundaries(self, node, boundaries, token_class, *, lock_match=True, delete_whitespace=False):
         """"""
         n = len(boundaries)
         if n == 0:
             return
         token_dll = node.list
+        class_code = token._class_codes[token_class]
         prev_end = 0
         for i, (start, end, replacement) in enumerate(boundaries):
             original_spelling = None
@@ -488,24 +630,21 @@ class Tokenizer():
                     match_last_in_sentence = False
                     right_last_in_sentence = node.value.last_in_sentence
             if left != "":
-                token_dll.insert_left(Token(left, token_class="regular", space_after=left_space_after, first_in_sentence=first_in_sentence), node)
+                token_dll.insert_left(Token._new(left, _REGULAR, left_space_after, None, first_in_sentence, False), node)
                 first_in_sentence = False
-            token_dll.insert_left(Token(match, locked=lock_match,
-                                        token_class=token_class,
-                                        space_after=match_space_after,
-                                        original_spelling=original_spelling,
-                                        first_in_sentence=first_in_sentence,
-                                        last_in_sentence=match_last_in_sentence),
-                                  node)
+            token_dll.insert_left(Token._new(match, class_code, match_space_after, original_spelling, first_in_sentence, match_last_in_sentence, lock_match), node)
             if i == n - 1 and right != "":
-                token_dll.insert_left(Token(right, token_class="regular", space_after=node.value.space_after, last_in_sentence=right_last_in_sentence), node)
+                token_dll.insert_left(Token._new(right, _REGULAR, node.value.space_after, None, False, right_last_in_sentence), node)
         token_dll.remove(node)
 
     def _split_matches(self, regex, node, token_class="regular", repl=None, split_named_subgroups=True, delete_whitespace=False):
         boundaries = []
         split_groups = split_named_subgroups and len(regex.groupindex) > 0
         group_numbers = sorted(regex.groupindex.values())
-        for m in regex.finditer(node.value.text):
+        text = node.value.text
+        # The length check is repeated here to save a function call
+        # for the vast majority of (short) tokens
+        for m in regex.finditer(text) if len(text) < self._regex_timeout_length else self._finditer(regex, text):
             if split_groups:
                 for g in group_numbers:
                     if m.span(g) != (-1, -1):
@@ -530,7 +669,7 @@ class Tokenizer():
 
     def _split_set(self, regex, node, items, token_class="regular", to_lower=False):
         boundaries = []
-        for m in regex.finditer(node.value.text):
+        for m in self._finditer(regex, node.value.text):
             instance = m.group(0)
             if to_lower:
                 instance = instance.lower()
@@ -541,7 +680,7 @@ class Tokenizer():
     def _split_left(self, regex, node):
         boundaries = []
         prev_end = 0
-        for m in regex.finditer(node.value.text):
+        for m in self._finditer(regex, node.value.text):
             boundaries.append((prev_end, m.start(), None))
             prev_end = m.start()
         self._split_on_boundaries(node, boundaries, token_class=None, lock_match=False)
@@ -553,6 +692,33 @@ class Tokenizer():
                 continue
             self._split_matches(regex, t, token_class, repl, split_named_subgroups, delete_whitespace)
 
+    def _split_all_matches_fused(self, rule_group, token_dll):
+        """Apply a group of rules (created by _fuse_rules) in their
+        original order. The result is the same as calling
+        _split_all_matches for every rule, but tokens that are not
+        matched by any of the rules are scanned only once.
+
+        """
+        trigger, rules = rule_group
+        for t in token_dll:
+            if t.value.markup or t.value._locked:
+                continue
+            text = t.value.text
+            if not (trigger.search(text) if len(text) < self._regex_timeout_length else self._search(trigger, text)):
+                continue
+            nodes = [t]
+            for regex, token_class, kwargs in rules:
+                fragments = []
+                for node in nodes:
+                    prev, nxt = node.prev, node.next
+                    self._split_matches(regex, node, token_class, **kwargs)
+                    current = token_dll.first if prev is None else prev.next
+                    while current is not nxt:
+                        if not (current.value.markup or current.value._locked):
+                            fragments.append(current)
+                        current = current.next
+                nodes = fragments
+
     def _split_all_matches_in_match(self, regex1, regex2, token_dll, token_class="regular", *, delete_whitespace=False):
         """Find all matches for regex1 and turn all matches for regex2 within
         the matches for regex1 into tokens.
@@ -562,8 +728,8 @@ class Tokenizer():
             if t.value.markup or t.value._locked:
                 continue
             boundaries = []
-            for m1 in regex1.finditer(t.value.text):
-                for m2 in regex2.finditer(m1.group(0)):
+            for m1 in self._finditer(regex1, t.value.text):
+                for m2 in self._finditer(regex2, m1.group(0)):
                     boundaries.append((m2.start() + m1.start(), m2.end() + m1.start(), None))
             self._split_on_boundaries(t, boundaries, token_class, delete_whitespace=delete_whitespace)
 
@@ -609,7 +775,7 @@ class Tokenizer():
             if t.value.markup or t.value._locked:
                 continue
             boundaries = []
-            for m in self.abbreviation.finditer(t.value.text):
+            for m in self._finditer(self.abbreviation, t.value.text):
                 instance = m.group(0)
                 if split_multipart_abbrevs and self.multipart_abbreviation.fullmatch(instance):
                     start, end = m.span(0)
@@ -691,13 +857,7 @@ class Tokenizer():
         self._split_all_matches(self.email, token_dll, "email_address", delete_whitespace=True)
 
         # urls
-        self._split_all_matches(self.markdown_links, token_dll, "symbol")
-        self._split_all_matches(self.simple_url_with_brackets, token_dll, "URL")
-        self._split_all_matches(self.simple_url, token_dll, "URL")
-        self._split_all_matches(self.doi, token_dll, "URL")
-        self._split_all_matches(self.doi_with_space, token_dll, "URL")
-        self._split_all_matches(self.url_without_protocol, token_dll, "URL")
-        self._split_all_matches(self.reddit_links, token_dll, "URL")
+        self._split_all_matches_fused(self.url_rules, token_dll)
 
         # XML entities
         self._split_all_matches(self.entity, token_dll, "XML_entity")
@@ -741,10 +901,7 @@ class Tokenizer():
             self._split_all_matches(self.en_llreve, token_dll)
             self._split_all_matches(self.en_not, token_dll)
             self._split_all_left(self.en_trailing_apos, token_dll)
-            for contraction in self.en_twopart_contractions:
-                self._split_all_matches(contraction, token_dll)
-            for contraction in self.en_threepart_contractions:
-                self._split_all_matches(contraction, token_dll)
+            self._split_all_matches_fused(self.en_contraction_rules, token_dll)
             self._split_all_matches(self.en_no, token_dll)
             self._split_all_matches(self.en_degree, token_dll)
             self._split_all_matches(self.en_nonbreaking_words, token_dll)
@@ -761,11 +918,7 @@ class Tokenizer():
         # DATES AND NUMBERS
         self._split_all_matches(self.isbn, token_dll, "number", delete_whitespace=True)
         # dates
-        split_dates = False if self.language == "en" or self.language == "en_PTB" else True
-        self._split_all_matches(self.three_part_date_year_first, token_dll, "date", split_named_subgroups=split_dates)
-        self._split_all_matches(self.three_part_date_dmy, token_dll, "date", split_named_subgroups=split_dates)
-        self._split_all_matches(self.three_part_date_mdy, token_dll, "date", split_named_subgroups=split_dates)
-        self._split_all_matches(self.two_part_date, token_dll, "date", split_named_subgroups=split_dates)
+        self._split_all_matches_fused(self.date_rules, token_dll)
         # time
         if self.language == "en" or self.language == "en_PTB":
             self._split_all_matches(self.en_time, token_dll, "time")
@@ -796,9 +949,7 @@ class Tokenizer():
         # number compounds
         self._split_all_matches(self.number_compound, token_dll, "regular")
         # numbers
-        self._split_all_matches(self.number, token_dll, "number")
-        self._split_all_matches(self.ipv4, token_dll, "number")
-        self._split_all_matches(self.section_number, token_dll, "number")
+        self._split_all_matches_fused(self.number_rules, token_dll)
 
         # (clusters of) question marks and exclamation marks
         self._split_all_matches(self.quest_exclam, token_dll, "symbol")
@@ -841,9 +992,9 @@ class Tokenizer():
             n_wt = len(wt)
             for i, tok in enumerate(wt):
                 if i == n_wt - 1:
-                    token_dll.insert_left(Token(tok, token_class="regular", space_after=t.value.space_after), t)
+                    token_dll.insert_left(Token._new(tok, _REGULAR, t.value.space_after, None, False, False), t)
                 else:
-                    token_dll.insert_left(Token(tok, token_class="regular", space_after=True), t)
+                    token_dll.insert_left(Token._new(tok, _REGULAR, True, None, False, False), t)
                 token_dll.remove(t)
 
         return token_dll.to_list()
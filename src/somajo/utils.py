@@ -1,14 +1,97 @@
 #!/usr/bin/env python3
 
+import asyncio
+import bz2
+import collections
+import concurrent.futures
+import functools
+import gzip
+import heapq
+import itertools
 import io
+import logging
+import lzma
+import mmap
 import os
 import regex as re
+import threading
+import xml.parsers.expat
 import xml.sax
 import xml.sax.saxutils
+import xml.sax.xmlreader
 
 from . import alignment
 from .token import Token
 
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+# Compressed files are read and written in blocks of this size
+_block_size = 1 << 20
+_compression_magic = {b"\x1f\x8b": "gz", b"\xfd7zXZ\x00": "xz", b"\x28\xb5\x2f\xfd": "zst"}
+# "BZh" is followed by the block size and the magic number of the
+# first block (or of the end of an empty stream), so that text files
+# starting with "BZh" are not mistaken for bzip2
+_bzip2_magic = re.compile(rb"BZh[1-9](?:1AY&SY|\x17rE8P\x90)")
+_compression_suffixes = {".gz": "gz", ".bz2": "bz2", ".xz": "xz", ".zst": "zst"}
+
+
+def _compression(head):
+    """Return the compression format indicated by the first ten bytes
+    of a file or None.
+
+    """
+    if _bzip2_magic.match(head):
+        return "bz2"
+    return next((c for magic, c in _compression_magic.items() if head.startswith(magic)), None)
+
+
+def _codec_open(compression, filename, mode):
+    """Open a compressed file in binary mode."""
+    if compression == "gz":
+        return gzip.open(filename, mode)
+    if compression == "bz2":
+        return bz2.open(filename, mode)
+    if compression == "xz":
+        return lzma.open(filename, mode)
+    if zstd is None:
+        raise ImportError("Zstandard-compressed files require the zstandard module (pip install zstandard)")
+    return zstd.open(filename, mode)
+
+
+def open_file(filename, mode="r"):
+    """Open a UTF-8-encoded text file that may be compressed with gzip,
+    bzip2, xz or Zstandard. When reading, the compression format is
+    detected from the first bytes of the file; when writing, it is
+    determined by the suffix of filename.
+
+    """
+    assert mode in {"r", "w"}
+    if mode == "r":
+        with open(filename, "rb") as fh:
+            compression = _compression(fh.read(10))
+    else:
+        compression = _compression_suffixes.get(os.path.splitext(filename)[1])
+    if compression is None:
+        return open(filename, mode, encoding="utf-8")
+    binary = _codec_open(compression, filename, mode + "b")
+    if mode == "r":
+        binary = io.BufferedReader(binary, _block_size)
+    else:
+        binary = io.BufferedWriter(binary, _block_size)
+    return io.TextIOWrapper(binary, encoding="utf-8")
+
 
 def get_paragraphs_str(fh, paragraph_separator="empty_lines"):
     """Generator for the paragraphs in the file."""
@@ -35,7 +118,7 @@ def get_paragraphs_str(fh, paragraph_separator="empty_lines"):
 def get_paragraphs_list(text_file, paragraph_separator="empty_lines"):
     """Generator for the paragraphs in the file."""
     if isinstance(text_file, str):
-        with open(text_file, encoding="utf-8") as fh:
+        with open_file(text_file) as fh:
             for paragraph, position in get_paragraphs_str(fh, paragraph_separator):
                 yield [Token(paragraph, first_in_sentence=True, last_in_sentence=True, character_offset=(position, position + len(paragraph)))], paragraph, position
     else:
@@ -43,6 +126,227 @@ def get_paragraphs_list(text_file, paragraph_separator="empty_lines"):
             yield [Token(paragraph, first_in_sentence=True, last_in_sentence=True, character_offset=(position, position + len(paragraph)))], paragraph, position
 
 
+# UTF-8 encodings of the characters for which str.isspace is true,
+# apart from line breaks
+_whitespace_bytes = rb"(?:[\t\x0b\x0c\x1c-\x1f ]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)"
+_blank_line = re.compile(_whitespace_bytes + rb"*(?:\n|\Z)")
+# A blank line is captured in the lookahead, so that consecutive
+# blank lines are found as well
+_after_newline_blank_line = re.compile(rb"\n(?=(" + _whitespace_bytes + rb"*(?:\n|\Z)))")
+_utf8_continuation_bytes = bytes(range(0x80, 0xc0))
+
+# A paragraph in a text file: byte range and character position of
+# its start. file_id identifies the version of the file.
+FileSlice = collections.namedtuple("FileSlice", ["filename", "file_id", "start", "end", "position"])
+
+
+def _file_id(fh):
+    stat = os.fstat(fh.fileno())
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _paragraph_spans(mm, paragraph_separator):
+    """Yield the byte ranges of the paragraphs in the mapped file,
+    delimited in the same way as by get_paragraphs_str.
+
+    """
+    size = len(mm)
+    end = 0
+    if paragraph_separator == "single_newlines":
+        while end < size:
+            start = end
+            end = mm.find(b"\n", start)
+            end = size if end == -1 else end + 1
+            line = mm[start:end]
+            if line.isspace():
+                continue
+            stripped = line.strip()
+            # Non-ASCII whitespace
+            if (stripped[0] >= 0x80 or 0x1c <= stripped[0] <= 0x1f) and _blank_line.fullmatch(line):
+                continue
+            yield start, end
+    elif paragraph_separator == "empty_lines":
+        m = _blank_line.match(mm)
+        if m is not None and m.end() > 0:
+            end = m.end()
+            yield 0, end
+        for m in _after_newline_blank_line.finditer(mm, max(end - 1, 0)):
+            # The empty line at the end of the file
+            if m.end(1) == end:
+                break
+            yield end, m.end(1)
+            end = m.end(1)
+        if end < size:
+            yield end, size
+
+
+def get_paragraph_slices(filename, paragraph_separator="empty_lines"):
+    """Return a generator of FileSlice objects for the paragraphs in the
+    file, or None if the file is compressed or uses carriage returns.
+    The paragraphs are delimited in the same way as by
+    get_paragraphs_str, but they are not decoded; use read_slice to
+    obtain them.
+
+    """
+    with open(filename, "rb") as fh:
+        file_id = _file_id(fh)
+        if file_id[3] == 0:
+            return None
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    # Compressed files have to be decompressed; carriage returns are
+    # subject to newline translation in text mode
+    if _compression(mm[:10]) is not None or mm.find(b"\r") != -1:
+        mm.close()
+        return None
+
+    def slices():
+        with mm:
+            position = 0
+            previous_end = 0
+            for start, end in _paragraph_spans(mm, paragraph_separator):
+                # Count characters without decoding
+                if start > previous_end:
+                    position += len(mm[previous_end:start].translate(None, _utf8_continuation_bytes))
+                yield FileSlice(filename, file_id, start, end, position)
+                position += len(mm[start:end].translate(None, _utf8_continuation_bytes))
+                previous_end = end
+    return slices()
+
+
+# The file that read_slice has mapped most recently
+_mapped_file = (None, None)
+
+
+def read_slice(file_slice):
+    """Read and decode a FileSlice and return it in the same format as
+    get_paragraphs_list.
+
+    """
+    global _mapped_file
+    filename, file_id, start, end, position = file_slice
+    if _mapped_file[0] != (filename, file_id):
+        if _mapped_file[1] is not None:
+            _mapped_file[1].close()
+        with open(filename, "rb") as fh:
+            assert _file_id(fh) == file_id, "%s has changed during tokenization" % filename
+            _mapped_file = ((filename, file_id), mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+    paragraph = str(_mapped_file[1][start:end], "utf-8")
+    return [Token(paragraph, first_in_sentence=True, last_in_sentence=True, character_offset=(position, position + len(paragraph)))], paragraph, position
+
+
+def reorder(items, max_buffered):
+    """Restore the order of (index, value) pairs with a bounded buffer.
+
+    Values are yielded as soon as all values with lower indices have
+    been yielded. If more than max_buffered values are waiting, the
+    value with the lowest index is yielded anyway; its missing
+    predecessors will be yielded as soon as they arrive.
+
+    """
+    buffer = []
+    next_index = 0
+    for index, value in items:
+        if index < next_index:
+            yield index, value
+            continue
+        heapq.heappush(buffer, (index, value))
+        while len(buffer) > 0 and (buffer[0][0] == next_index or len(buffer) > max_buffered):
+            index, value = heapq.heappop(buffer)
+            next_index = index + 1
+            yield index, value
+    while len(buffer) > 0:
+        yield heapq.heappop(buffer)
+
+
+class _Failure:
+    """An exception raised by the producer thread of iterate_in_thread."""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+async def iterate_in_thread(generator, queue_size, stopped=None):
+    """Run the generator function in a separate thread and yield its
+    items asynchronously. At most queue_size items are produced ahead
+    of the consumer. If the consumer stops early, the stopped event is
+    set, the generator is closed in its thread and the thread is
+    joined.
+
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    slots = threading.Semaphore(queue_size)
+    if stopped is None:
+        stopped = threading.Event()
+    done = object()
+
+    def produce():
+        source = None
+        try:
+            source = generator()
+            for item in source:
+                while not slots.acquire(timeout=0.1):
+                    if stopped.is_set():
+                        return
+                if stopped.is_set():
+                    return
+                loop.call_soon_threadsafe(items.put_nowait, item)
+        except BaseException as e:
+            if not stopped.is_set():
+                loop.call_soon_threadsafe(items.put_nowait, _Failure(e))
+            return
+        finally:
+            # a generator can only be closed by the thread that runs it
+            if source is not None and hasattr(source, "close"):
+                source.close()
+        if not stopped.is_set():
+            loop.call_soon_threadsafe(items.put_nowait, done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = await items.get()
+            if item is done:
+                break
+            if isinstance(item, _Failure):
+                raise item.exception
+            slots.release()
+            yield item
+    finally:
+        stopped.set()
+        await loop.run_in_executor(None, thread.join)
+
+
+def iterate_async(iterable, loop, stopped=None):
+    """Iterate over an iterable or async iterable from a thread other
+    than the one that runs the event loop. Stop waiting for the next
+    item of an async iterable when the stopped event is set.
+
+    """
+    if not hasattr(iterable, "__aiter__"):
+        yield from iterable
+        return
+    iterator = iterable.__aiter__()
+
+    async def next_item():
+        return await iterator.__anext__()
+
+    while True:
+        future = asyncio.run_coroutine_threadsafe(next_item(), loop)
+        while True:
+            try:
+                item = future.result(timeout=0.1)
+                break
+            except concurrent.futures.TimeoutError:
+                if stopped is not None and stopped.is_set():
+                    future.cancel()
+                    return
+            except StopAsyncIteration:
+                return
+        yield item
+
+
 def read_abbreviation_file(filename, to_lower=False):
     """Return the abbreviations from the given filename."""
     abbreviations = set()
@@ -59,35 +363,273 @@ def read_abbreviation_file(filename, to_lower=False):
     return sorted(abbreviations, key=len, reverse=True)
 
 
+_xml_markup = re.compile(r"<(?:!--.*?-->|!\[CDATA\[(.*?)\]\]>|\?.*?\?>|(!DOCTYPE)|(/?)([^\s/>!?]+)(?:\s(?:[^>\"'/]|/(?!>)|\"[^\"]*\"|'[^']*')*)?(/?)>)", re.DOTALL)
+_xml_references = re.compile(r"&(?:#([0-9]+)|#x([0-9a-fA-F]+)|([A-Za-z]+));")
+_xml_entities = {"lt": "<", "gt": ">", "amp": "&", "quot": '"', "apos": "'"}
+
+
+def _xml_unescape(text):
+    if "&" not in text:
+        return text
+
+    def replace(m):
+        if m.group(1) is not None:
+            return chr(int(m.group(1)))
+        if m.group(2) is not None:
+            return chr(int(m.group(2), 16))
+        return _xml_entities.get(m.group(3), m.group(0))
+    return _xml_references.sub(replace, text)
+
+
+_xml_doctype = re.compile(r"<!DOCTYPE(?:[^\[>\"']|\"[^\"]*\"|'[^']*')*(?:\[(?:[^\]\"']|\"[^\"]*\"|'[^']*')*\])?\s*>")
+# Markup that can contain "<" or ">": comments, CDATA sections and
+# processing instructions (possibly unterminated at the end of the
+# input)
+_xml_opaque = r"<!--.*?(?:-->|\Z)|<!\[CDATA\[.*?(?:\]\]>|\Z)|<\?.*?(?:\?>|\Z)"
+_xml_opaque_ends = ("-->", "]]>", "?>")
+
+
+@functools.lru_cache(maxsize=None)
+def _pruned_markup(name):
+    return re.compile(_xml_opaque + r"|<(/?)" + re.escape(name) + r"(?=[\s/>]|\Z)", re.DOTALL)
+
+
+def _hold_back(buffer, endpos, final):
+    """Return the position before an incomplete tag at the end of
+    buffer[:endpos] (or endpos if there is none), so that a tag that
+    spans two reads is not missed.
+
+    """
+    if final:
+        return endpos
+    lt = buffer.rfind("<", 0, endpos)
+    if lt != -1 and buffer.find(">", lt, endpos) == -1:
+        return lt
+    return endpos
+
+
+def _skip_pruned(buffer, pos, endpos, name, depth, final):
+    """Skip the contents of a pruned element called name, where depth
+    elements of that name are open. Return the position after its end
+    tag and 0 or, if buffer[:endpos] ends before, the position where
+    scanning has to continue once more input is available and the
+    remaining depth.
+
+    """
+    endpos = _hold_back(buffer, endpos, final)
+    for m in _pruned_markup(name).finditer(buffer, pos, endpos):
+        if m.group(1) is None:
+            if not m.group(0).endswith(_xml_opaque_ends) and not final:
+                return m.start(), depth
+            continue
+        tag = _xml_markup.match(buffer, m.start(), endpos)
+        if tag is None:
+            if not final:
+                return m.start(), depth
+            continue
+        if tag.group(3) == "/":
+            depth -= 1
+            if depth == 0:
+                return tag.end(), 0
+        elif tag.group(5) != "/":
+            depth += 1
+    return endpos, depth
+
+
+class _PruneFilter:
+    """Remove the elements in prune_tags and their contents from XML
+    data that is fed piece by piece, before it reaches the parser.
+    Pruned elements are skipped with a regular expression that only
+    looks for comments, CDATA sections, processing instructions and
+    tags of the same name. If placeholders is True, the pruned
+    elements are replaced by NUL characters in a copy of the data
+    (for the computation of character offsets).
+
+    """
+
+    def __init__(self, prune_tags, placeholders=True):
+        self.placeholders = placeholders
+        self.start_tags = re.compile(_xml_opaque + r"|<!DOCTYPE|<(" + "|".join(re.escape(t) for t in sorted(prune_tags)) + r")(?=[\s/>]|\Z)", re.DOTALL)
+        self.buffer = ""
+        self.name = None
+        self.depth = 0
+        self.n_elements = 0
+        self.n_characters = 0
+
+    def feed(self, data, final=False):
+        """Return the data without the pruned elements and the data with
+        the pruned elements replaced by NUL characters (or, without
+        placeholders, the data without the pruned elements again).
+        Incomplete markup at the end of data is held back until the
+        next call.
+
+        """
+        buffer = self.buffer + data
+        # Positions in buffer: consumed input, start of the data that
+        # has not yet been copied to the output
+        pos, copied = 0, 0
+        kept, raw = [], []
+
+        def prune(start, end):
+            kept.append(buffer[copied:start])
+            if self.placeholders:
+                raw.append(buffer[copied:start])
+                raw.append("\0" * (end - start))
+            self.n_characters += end - start
+            return end
+
+        while True:
+            if self.depth > 0:
+                end, self.depth = _skip_pruned(buffer, pos, len(buffer), self.name, self.depth, final)
+                pos = copied = prune(pos, end)
+                if self.depth > 0:
+                    break
+            endpos = _hold_back(buffer, len(buffer), final)
+            m = self.start_tags.search(buffer, pos, endpos)
+            if m is None:
+                pos = endpos
+                break
+            if m.group(1) is None:
+                if m.group(0) == "<!DOCTYPE":
+                    doctype = _xml_doctype.match(buffer, m.start(), endpos)
+                    complete = doctype is not None
+                    end = m.end() if doctype is None else doctype.end()
+                else:
+                    complete = m.group(0).endswith(_xml_opaque_ends)
+                    end = m.end()
+                if not (complete or final):
+                    pos = m.start()
+                    break
+                pos = end
+                continue
+            tag = _xml_markup.match(buffer, m.start(), endpos)
+            if tag is None:
+                if not final:
+                    pos = m.start()
+                    break
+                # Ill-formed; leave it to the parser
+                pos = m.end()
+                continue
+            self.n_elements += 1
+            pos = copied = prune(m.start(), tag.end())
+            if tag.group(5) != "/":
+                self.name = m.group(1)
+                self.depth = 1
+        kept.append(buffer[copied:pos])
+        self.buffer = buffer[pos:]
+        if self.depth > 0:
+            self.pruned_markup = re.compile(r"<[!?]|</?" + re.escape(self.name) + r"(?=[\s/>]|\Z)")
+        kept = "".join(kept)
+        if not self.placeholders:
+            return kept, kept
+        raw.append(buffer[copied:pos])
+        return kept, "".join(raw)
+
+    def filter(self, lines):
+        """Feed the lines to the filter and yield the results; runs of
+        lines that are completely pruned are combined.
+
+        """
+        pruned = 0
+        placeholder = "\0" if self.placeholders else ""
+        for line in lines:
+            # Fast paths for lines without relevant markup (tag names
+            # cannot contain line breaks)
+            if self.buffer == "" and line.endswith("\n"):
+                if self.depth > 0:
+                    if self.pruned_markup.search(line) is None:
+                        pruned += len(line)
+                        continue
+                elif self.start_tags.search(line) is None:
+                    yield line, line
+                    continue
+            if pruned > 0:
+                self.n_characters += pruned
+                yield "", placeholder * pruned
+                pruned = 0
+            yield self.feed(line)
+        if pruned > 0:
+            self.n_characters += pruned
+            yield "", placeholder * pruned
+        yield self.feed("", final=True)
+
+
+# XML parsers that can be used by incremental_xml_parser; lxml has
+# to be installed and chosen explicitly
+xml_parsers = ("expat", "lxml", "sax")
+default_xml_parser = "expat"
+
+
+class _Position(xml.sax.xmlreader.Locator):
+    def __init__(self, line, column):
+        self.line = line
+        self.column = column
+
+    def getLineNumber(self):
+        return self.line
+
+    def getColumnNumber(self):
+        return self.column
+
+
+class XmlParseError(xml.sax.SAXParseException):
+    """The exception that all XML parsers raise for ill-formed input.
+    Unlike a plain SAXParseException, it can be sent from a worker
+    process.
+
+    """
+
+    def __init__(self, msg, line, column):
+        super().__init__(msg, None, _Position(line, column))
+
+    def __reduce__(self):
+        return type(self), (self.getMessage(), self.getLineNumber(), self.getColumnNumber())
+
+
 class SaxTokenHandler(xml.sax.handler.ContentHandler):
     def __init__(self, eos_tags=None, prune_tags=None):
         super().__init__()
         self.eos_tags = eos_tags
         self.prune_tags = prune_tags
         self.token_list = []
-        self.content = ""
+        # Text is collected in a list, as parsers may report a text
+        # node in many small parts
+        self.content = []
         self.sentence_start = True
         self.open_prune_tags = []
+        # When parsing an XmlSegment: number of enclosing start tags
+        # that do not produce tokens and, at the end of the segment,
+        # whether the next tag is an eos tag
+        self.skip_start = 0
+        self.next_eos = None
+
+    def _flush_content(self, sentence_boundary):
+        if len(self.content) > 0:
+            content = "".join(self.content)
+            self.content = []
+            if content != "":
+                content_token = Token(content, token_class="regular", first_in_sentence=self.sentence_start, last_in_sentence=sentence_boundary)
+                self.token_list.append(content_token)
+                self.sentence_start = False
 
     def _insert_element(self, name, text, markup_class):
         sentence_boundary = False
         if self.eos_tags is not None and name in self.eos_tags:
             sentence_boundary = True
-        if self.content != "":
-            content_token = Token(self.content, token_class="regular", first_in_sentence=self.sentence_start, last_in_sentence=sentence_boundary)
-            self.token_list.append(content_token)
-            self.content = ""
-            self.sentence_start = False
-        token = Token(text, markup=True, markup_class=markup_class, markup_eos=sentence_boundary, locked=True)
+        self._flush_content(sentence_boundary)
+        token = Token(text, markup=True, markup_class=markup_class, markup_eos=sentence_boundary, tag_name=name, locked=True)
         self.token_list.append(token)
         if sentence_boundary:
             self.sentence_start = True
 
     def characters(self, data):
         if not self.open_prune_tags:
-            self.content += data
+            self.content.append(data)
 
     def startElement(self, name, attrs):
+        if self.skip_start > 0:
+            self.skip_start -= 1
+            return
         if self.prune_tags is not None and name in self.prune_tags:
             self.open_prune_tags.append(name)
         if not self.open_prune_tags:
@@ -98,6 +640,9 @@ class SaxTokenHandler(xml.sax.handler.ContentHandler):
             self._insert_element(name, text, "start")
 
     def endElement(self, name):
+        if self.next_eos is not None:
+            self._flush_content(self.next_eos)
+            return
         if not self.open_prune_tags:
             text = "</%s>" % name
             self._insert_element(name, text, "end")
@@ -106,28 +651,159 @@ class SaxTokenHandler(xml.sax.handler.ContentHandler):
             assert top == name
 
 
-def incremental_xml_parser(f, eos_tags=None, prune_tags=None):
-    parser = xml.sax.make_parser(["xml.sax.xmlreader.IncrementalParser"])
+class _LxmlTarget:
+    """Parser target for lxml that passes the events on to a
+    SaxTokenHandler. lxml resolves namespace prefixes, so we restore
+    the qualified names and namespace declarations of the input
+    (declarations are put before the other attributes).
+
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        # (default namespace, prefixes of namespaces)
+        self.namespaces = [(None, {"http://www.w3.org/XML/1998/namespace": "xml"})]
+
+    def _qname(self, name, default_namespace, prefixes):
+        if name[0] != "{":
+            return name
+        uri, local = name[1:].split("}", 1)
+        if uri == default_namespace:
+            return local
+        return "%s:%s" % (prefixes[uri], local)
+
+    def start(self, tag, attrib, nsmap):
+        default_namespace, prefixes = self.namespaces[-1]
+        attrs = {}
+        if len(nsmap) > 0:
+            prefixes = dict(prefixes)
+            for prefix, uri in nsmap.items():
+                if prefix is None or prefix == "":
+                    default_namespace = uri if uri != "" else None
+                    attrs["xmlns"] = uri
+                else:
+                    prefixes[uri] = prefix
+                    attrs["xmlns:" + prefix] = uri
+        self.namespaces.append((default_namespace, prefixes))
+        for k, v in attrib.items():
+            attrs[self._qname(k, None, prefixes)] = v
+        self.handler.startElement(self._qname(tag, default_namespace, prefixes), attrs)
+
+    def end(self, tag):
+        default_namespace, prefixes = self.namespaces.pop()
+        self.handler.endElement(self._qname(tag, default_namespace, prefixes))
+
+    def data(self, data):
+        self.handler.characters(data)
+
+    def close(self):
+        return None
+
+
+def _parse_error(e):
+    """Convert the parse error of one of the parsers to an XmlParseError."""
+    if isinstance(e, xml.parsers.expat.ExpatError):
+        return XmlParseError(xml.parsers.expat.ErrorString(e.code), e.lineno, e.offset)
+    if isinstance(e, xml.sax.SAXParseException):
+        return XmlParseError(e.getMessage(), e.getLineNumber(), e.getColumnNumber())
+    return XmlParseError(e.msg, e.lineno, e.offset)
+
+
+def _raise_parse_errors(function, errors):
+    """Wrap the feed or close function of a parser, so that it raises
+    XmlParseError instead of the errors of the parser.
+
+    """
+    def wrapped(*args):
+        try:
+            return function(*args)
+        except errors as e:
+            raise _parse_error(e) from e
+    return wrapped
+
+
+def _xml_parser(xml_parser, handler):
+    """Create an incremental parser that reports to handler and return
+    its feed and close functions.
+
+    """
+    assert xml_parser in xml_parsers, f"'{xml_parser}' is not a recognized XML parser."
+    if xml_parser == "expat":
+        parser = xml.parsers.expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = handler.startElement
+        parser.EndElementHandler = handler.endElement
+        parser.CharacterDataHandler = handler.characters
+        feed, close = parser.Parse, lambda: parser.Parse("", True)
+        errors = xml.parsers.expat.ExpatError
+    elif xml_parser == "lxml":
+        if etree is None:
+            raise ImportError("The lxml parser requires the lxml module (pip install lxml)")
+        # Like expat, skip references to external entities instead of
+        # loading them
+        parser = etree.XMLParser(target=_LxmlTarget(handler), huge_tree=True, resolve_entities=False, no_network=True)
+        feed, close = parser.feed, parser.close
+        errors = etree.XMLSyntaxError
+    else:
+        parser = xml.sax.make_parser(["xml.sax.xmlreader.IncrementalParser"])
+        parser.setContentHandler(handler)
+        feed, close = parser.feed, parser.close
+        errors = xml.sax.SAXParseException
+    return _raise_parse_errors(feed, errors), _raise_parse_errors(close, errors)
+
+
+def incremental_xml_parser(f, eos_tags=None, prune_tags=None, segment=None, xml_parser=default_xml_parser, character_offsets=True):
+    """Parse the XML data line by line and yield the tokens together
+    with the corresponding lines of input. Elements in prune_tags are
+    removed before the data is passed to the parser; in the lines of
+    input, they are replaced by NUL characters if character_offsets is
+    True and removed otherwise.
+
+    """
+    # SaxTokenHandler still prunes elements that are introduced by
+    # entity references
     handler = SaxTokenHandler(eos_tags, prune_tags)
-    parser.setContentHandler(handler)
+    feed, close = _xml_parser(xml_parser, handler)
+    if segment is not None:
+        # Open the enclosing elements without creating tokens for them
+        handler.sentence_start = segment.sentence_start
+        handler.skip_start = len(segment.context)
+        feed(segment.doctype + "".join(segment.context))
+    prune_filter = None
+    if prune_tags:
+        prune_filter = _PruneFilter(prune_tags, placeholders=character_offsets)
+        lines = prune_filter.filter(f)
+    else:
+        lines = ((line, line) for line in f)
     line_buffer = []
-    for line in f:
-        parser.feed(line)
+    for text, line in lines:
+        feed(text)
         line_buffer.append(line)
         if len(handler.token_list) > 0:
             yield handler.token_list, line_buffer
             handler.token_list = []
             line_buffer = []
-    parser.close()
+    if segment is not None and len(segment.closing) > 0:
+        # Close the enclosing elements without creating tokens for
+        # them; text at the end of the segment is treated as if it
+        # was followed by the first tag of the next segment
+        handler.next_eos = segment.next_eos
+        feed("".join("</%s>" % name for name in segment.closing))
+        if len(handler.token_list) > 0:
+            yield handler.token_list, line_buffer
+    else:
+        close()
+    if prune_filter is not None and segment is None:
+        logging.info("Pruned %d elements (%d characters)" % (prune_filter.n_elements, prune_filter.n_characters))
 
 
-def _xml_chunk_generator(f, eos_tags=None, prune_tags=None, character_offsets=False):
+def _xml_chunk_generator(f, eos_tags=None, prune_tags=None, character_offsets=False, segment=None, xml_parser=default_xml_parser):
     """Parse the XML data and yield doubly linked lists of Token objects
     that are delimited by eos_tags.
 
     """
     non_whitespace = re.compile(r"\S")
-    token_and_line_lists = incremental_xml_parser(f, eos_tags, prune_tags)
+    token_and_line_lists = incremental_xml_parser(f, eos_tags, prune_tags, segment, xml_parser, character_offsets)
     current = []
     bos, eos = True, False
     lexical_tokens = 0
@@ -254,7 +930,7 @@ def _xml_chunk_generator(f, eos_tags=None, prune_tags=None, character_offsets=Fa
     del algo_dot, algo_sketch
     input_buffer = ""
     output_buffer = []
-    position = 0
+    position = 0 if segment is None else segment.position
     for token_list, line_list in token_and_line_lists:
         if character_offsets:
             input_buffer += "".join(line_list)
@@ -326,21 +1002,286 @@ def _xml_chunk_generator(f, eos_tags=None, prune_tags=None, character_offsets=Fa
         yield current, raw_xml, position
 
 
-def xml_chunk_generator(data, is_file=True, eos_tags=None, prune_tags=None, character_offsets=False):
+# A stretch of an XML document that can be parsed independently:
+# context are the start tags of the enclosing elements, closing the
+# names of the elements that are still open at the end of the segment
+# and next_eos whether the first tag after the segment is an eos tag.
+# sentence_start and mark_last carry the relevant state of
+# SaxTokenHandler and _xml_chunk_generator across segment boundaries.
+# doctype is the document type declaration of the document if it
+# precedes the segment (it affects the handling of undefined
+# entities).
+XmlSegment = collections.namedtuple("XmlSegment", ["raw", "position", "context", "closing", "next_eos", "sentence_start", "mark_last", "eos_tags", "prune_tags", "character_offsets", "xml_parser", "doctype"])
+
+
+class _XmlSplitter:
+    """Follow the state of SaxTokenHandler and _xml_chunk_generator
+    through a document without creating any tokens, in order to find
+    the positions where _xml_chunk_generator starts a new chunk at an
+    eos tag.
+
+    """
+
+    non_whitespace = re.compile(r"\S")
+
+    def __init__(self, eos_tags, prune_tags):
+        self.eos_tags = eos_tags if eos_tags is not None else set()
+        self.prune_tags = prune_tags if prune_tags is not None else set()
+        # Open elements: names and start tags
+        self.stack = []
+        self.prune_depth = 0
+        # SaxTokenHandler
+        self.content = False
+        self.lexical_content = False
+        self.sentence_start = True
+        # _xml_chunk_generator
+        self.lexical = False
+        self.eos = False
+        # Trailing whitespace and start tags that would be moved to
+        # the next chunk: (offset, depth of the stack, sentence_start,
+        # next_eos)
+        self.carry = None
+        self.carry_has_text = False
+        self.text_start = 0
+
+    def characters(self, text):
+        if self.prune_depth == 0 and text != "":
+            self.content = True
+            if not self.lexical_content and self.non_whitespace.search(_xml_unescape(text)):
+                self.lexical_content = True
+
+    def start_element(self, name, raw, start, end):
+        """Process a start tag; if _xml_chunk_generator starts a new chunk
+        at this tag, return the carry info and mark_last.
+
+        """
+        if name in self.prune_tags:
+            self.prune_depth += 1
+        split = None
+        if self.prune_depth == 0:
+            split = self._element(name, True, start, end)
+        self.stack.append((name, raw))
+        return split
+
+    def end_element(self, name, start, end):
+        if len(self.stack) == 0 or self.stack[-1][0] != name:
+            raise ValueError("Mismatched end tag </%s>" % name)
+        if self.prune_depth == 0:
+            self._element(name, False, start, end)
+        if name in self.prune_tags:
+            self.prune_depth -= 1
+        self.stack.pop()
+
+    def _element(self, name, is_start, start, end):
+        eos_tag = name in self.eos_tags
+        flushed = self.content
+        if self.content:
+            if self.lexical_content:
+                self.eos = False
+                self.lexical = True
+                self.carry = None
+            else:
+                if self.carry is None:
+                    self.carry = (self.text_start, len(self.stack), self.sentence_start, False)
+                self.carry_has_text = True
+            self.content = False
+            self.lexical_content = False
+            self.sentence_start = False
+        split = None
+        if is_start:
+            if self.carry is None:
+                self.carry = (start, len(self.stack), self.sentence_start, eos_tag if flushed else False)
+                self.carry_has_text = False
+            if eos_tag:
+                if self.lexical:
+                    split = self.carry + (not self.carry_has_text,)
+                self.lexical = False
+                self.eos = False
+            elif self.eos:
+                self.eos = False
+                if self.lexical:
+                    # The chunk ends before this tag; it does not carry
+                    # anything over
+                    self.carry = (start, len(self.stack), self.sentence_start, eos_tag if flushed else False)
+                    self.carry_has_text = False
+                    self.lexical = False
+        else:
+            if eos_tag:
+                self.eos = True
+            self.carry = None
+        if eos_tag:
+            self.sentence_start = True
+        self.text_start = end
+        return split
+
+
+def _xml_segment_generator(fh, eos_tags, prune_tags, character_offsets, segment_size, xml_parser):
+    """Scan the markup of the XML document and cut it into segments at
+    the eos tags where _xml_chunk_generator starts a new chunk. If the
+    rest of the document cannot be cut into segments (a DTD with an
+    internal subset might declare entities, or the markup is
+    ill-formed), its chunks are yielded instead.
+
+    """
+    splitter = _XmlSplitter(eos_tags, prune_tags)
+    buffer = ""
+    # Offsets of the buffer and of the start of the current
+    # segment in the document and scan position in the buffer
+    buffer_offset, segment_offset, pos = 0, 0, 0
+    context, sentence_start = [], True
+    # The document type declaration and the one that is passed on
+    # with the current segment (the first segment contains it)
+    doctype, segment_doctype = "", ""
+    splittable = True
+    final = False
+    # Pruned element that is being skipped: name, depth and start
+    pruned, prune_depth, prune_start = None, 0, 0
+    n_pruned, n_pruned_characters = 0, 0
+    while splittable and not final:
+        block = fh.read(_block_size)
+        final = block == ""
+        buffer += block
+        while True:
+            if prune_depth > 0:
+                pos, prune_depth = _skip_pruned(buffer, pos, len(buffer), pruned, prune_depth, final)
+                if prune_depth > 0:
+                    break
+                splitter.end_element(pruned, None, None)
+                n_pruned += 1
+                n_pruned_characters += buffer_offset + pos - prune_start
+            lt = buffer.find("<", pos)
+            if lt == -1:
+                if final:
+                    splitter.characters(buffer[pos:])
+                    pos = len(buffer)
+                break
+            m = _xml_markup.match(buffer, lt)
+            if m is not None and m.group(2) is not None:
+                m = _xml_doctype.match(buffer, lt)
+                if m is not None and "[" in m.group(0):
+                    # Entities might be declared in the internal subset
+                    splittable = False
+                    break
+                if m is not None:
+                    splitter.characters(buffer[pos:lt])
+                    pos = m.end()
+                    doctype = m.group(0)
+                    continue
+            if m is None:
+                # Incomplete or ill-formed markup
+                if final:
+                    splittable = False
+                break
+            splitter.characters(buffer[pos:lt])
+            pos = m.end()
+            if m.group(1) is not None:
+                splitter.characters(m.group(1))
+            elif m.group(4) is not None:
+                name = m.group(4)
+                start, end = buffer_offset + lt, buffer_offset + pos
+                try:
+                    if m.group(3) == "/":
+                        splitter.end_element(name, start, end)
+                        continue
+                    split = splitter.start_element(name, m.group(0), start, end)
+                    if m.group(5) == "/":
+                        splitter.end_element(name, start, end)
+                        if splitter.prune_depth == 0 and name in splitter.prune_tags:
+                            n_pruned += 1
+                            n_pruned_characters += end - start
+                    elif splitter.prune_depth == 1 and name in splitter.prune_tags:
+                        pruned, prune_depth, prune_start = name, 1, start
+                        continue
+                except ValueError:
+                    # Let the XML parser report the error
+                    splittable = False
+                    break
+                if split is not None and split[0] - segment_offset >= segment_size:
+                    offset, depth, next_sentence_start, next_eos, mark_last = split
+                    enclosing = splitter.stack[:depth]
+                    yield XmlSegment(
+                        buffer[segment_offset - buffer_offset:offset - buffer_offset],
+                        segment_offset if character_offsets else 0,
+                        context,
+                        [name for name, raw in reversed(enclosing)],
+                        next_eos,
+                        sentence_start,
+                        mark_last,
+                        eos_tags,
+                        prune_tags,
+                        character_offsets,
+                        xml_parser,
+                        segment_doctype
+                    )
+                    context = [raw for name, raw in enclosing]
+                    sentence_start = next_sentence_start
+                    segment_offset = offset
+                    segment_doctype = doctype
+                    # Drop everything before the new segment
+                    pos -= segment_offset - buffer_offset
+                    buffer = buffer[segment_offset - buffer_offset:]
+                    buffer_offset = segment_offset
+    segment = XmlSegment(buffer[segment_offset - buffer_offset:], segment_offset if character_offsets else 0, context, [], False, sentence_start, False, eos_tags, prune_tags, character_offsets, xml_parser, segment_doctype)
+    if splittable:
+        yield segment
+        if prune_tags:
+            logging.info("Pruned %d elements (%d characters)" % (n_pruned, n_pruned_characters))
+    else:
+        # Parse the rest of the document as a stream
+        rest = itertools.chain([segment.raw], fh)
+        for chunk in _xml_chunk_generator(rest, eos_tags, prune_tags, character_offsets, segment._replace(raw=None), xml_parser):
+            yield chunk
+
+
+def xml_segment_generator(data, is_file=True, eos_tags=None, prune_tags=None, character_offsets=False, segment_size=10000, xml_parser=default_xml_parser):
+    """Split the XML data into XmlSegments of at least segment_size
+    characters (if possible) that can be parsed independently of each
+    other (see xml_segment_chunks). Concatenating the chunks of all
+    segments gives the same result as xml_chunk_generator. If the
+    document cannot be split (any further), the chunks of the rest of
+    the document are yielded instead of segments, in the same format
+    as xml_chunk_generator.
+
+    """
+    if is_file:
+        if isinstance(data, str):
+            with open_file(data) as f:
+                yield from _xml_segment_generator(f, eos_tags, prune_tags, character_offsets, segment_size, xml_parser)
+        else:
+            yield from _xml_segment_generator(data, eos_tags, prune_tags, character_offsets, segment_size, xml_parser)
+    else:
+        yield from _xml_segment_generator(io.StringIO(data), eos_tags, prune_tags, character_offsets, segment_size, xml_parser)
+
+
+def xml_segment_chunks(segment):
+    """Parse an XmlSegment and return its chunks in the same format as
+    xml_chunk_generator.
+
+    """
+    chunks = list(_xml_chunk_generator(io.StringIO(segment.raw), segment.eos_tags, segment.prune_tags, segment.character_offsets, segment, segment.xml_parser))
+    if segment.mark_last and len(chunks) > 0:
+        for t in reversed(chunks[-1][0]):
+            if not t.markup:
+                t.last_in_sentence = True
+                break
+    return chunks
+
+
+def xml_chunk_generator(data, is_file=True, eos_tags=None, prune_tags=None, character_offsets=False, xml_parser=default_xml_parser):
     """Parse the XML data and yield doubly linked lists of Token objects
     that are delimited by eos_tags.
 
     """
     if is_file:
         if isinstance(data, str):
-            with open(data, encoding="utf-8") as f:
-                for chunk, raw_xml, position in _xml_chunk_generator(f, eos_tags, prune_tags, character_offsets):
+            with open_file(data) as f:
+                for chunk, raw_xml, position in _xml_chunk_generator(f, eos_tags, prune_tags, character_offsets, xml_parser=xml_parser):
                     yield chunk, raw_xml, position
         else:
-            for chunk, raw_xml, position in _xml_chunk_generator(data, eos_tags, prune_tags, character_offsets):
+            for chunk, raw_xml, position in _xml_chunk_generator(data, eos_tags, prune_tags, character_offsets, xml_parser=xml_parser):
                 yield chunk, raw_xml, position
     else:
-        for chunk, raw_xml, position in _xml_chunk_generator(io.StringIO(data), eos_tags, prune_tags, character_offsets):
+        for chunk, raw_xml, position in _xml_chunk_generator(io.StringIO(data), eos_tags, prune_tags, character_offsets, xml_parser=xml_parser):
             yield chunk, raw_xml, position
 
 
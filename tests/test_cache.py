@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import array
+import os
+import pickle
+import tempfile
+import unittest
+
+from somajo.cache import ResultCache
+from somajo.token import Token, pack_tokens
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        """Necessary preparations"""
+        tokens = [Token("Foo", first_in_sentence=True), Token("bäär", original_spelling="bar", last_in_sentence=True), Token("\ud800.")]
+        for i, t in enumerate(tokens):
+            t.character_offset = (i * 5, i * 5 + 4)
+        self.result = (pack_tokens(tokens), array.array("L", [2, 1]))
+
+    def test_cache_01(self):
+        cache = ResultCache(maxsize=2)
+        for i in range(3):
+            cache.put(cache.key(str(i), ()), i)
+        self.assertIsNone(cache.get(cache.key("0", ())))
+        self.assertEqual(cache.get(cache.key("2", ())), 2)
+        self.assertEqual((cache.hits, cache.disk_hits, cache.misses), (1, 0, 1))
+        self.assertEqual(cache.hit_rate, 0.5)
+
+    def test_cache_02(self):
+        cache = ResultCache()
+        self.assertNotEqual(cache.key("foo", ("de_CMC",)), cache.key("foo", ("en_PTB",)))
+        self.assertNotEqual(cache.key("foo", ("de_CMC",)), cache.key("bar", ("de_CMC",)))
+
+    def test_cache_03(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            cache = ResultCache(maxsize=0, path=path)
+            cache.put(b"foo", self.result)
+            cache.close()
+            cache = ResultCache(path=path)
+            self.assertEqual(cache.get(b"foo"), self.result)
+            self.assertEqual(cache.get(b"foo"), self.result)
+            self.assertEqual((cache.hits, cache.disk_hits, cache.misses), (1, 1, 0))
+            cache.clear()
+            self.assertIsNone(cache.get(b"foo"))
+            cache.close()
+
+    def test_cache_04(self):
+        cache = ResultCache(maxsize=5)
+        cache.put(b"foo", "bar")
+        cache.get(b"foo")
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(copy.maxsize, 5)
+        self.assertIsNone(copy.get(b"foo"))
+        self.assertEqual(copy.hits, 0)
+
+    def test_cache_05(self):
+        # Results are not unpickled
+        class Exploit:
+            def __reduce__(self):
+                return (exec, ("raise RuntimeError('pwned')",))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            cache = ResultCache(path=path)
+            cache.put(b"foo", self.result)
+            cache._database().execute("UPDATE results SET value = ?", (pickle.dumps(Exploit()),))
+            cache._results.clear()
+            self.assertIsNone(cache.get(b"foo"))
+            self.assertEqual(cache.misses, 1)
+            cache.close()
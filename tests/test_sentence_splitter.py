@@ -5,6 +5,7 @@ import logging
 import unittest
 
 from somajo import SentenceSplitter
+from somajo import sentence_splitter
 from somajo import SoMaJo
 from somajo import Tokenizer
 
@@ -259,6 +260,19 @@ class TestMiscPretokenized(TestSentenceSplitterPretokenized):
     def test_misc_04(self):
         self._equal("Wir könnten wandern , schwimmen , Fahrrad fahren , usw. Worauf hättest du denn Lust ?", ["Wir könnten wandern , schwimmen , Fahrrad fahren , usw.", "Worauf hättest du denn Lust ?"])
 
+    def test_misc_05(self):
+        self._equal("Hallo ! @susi wie geht's ? #fail -- “ na ja ” .", ["Hallo !", "@susi wie geht's ?", "#fail -- “ na ja ” ."])
+
+    def test_misc_06(self):
+        self._equal("Das war's ETC. Oder ? ...", ["Das war's ETC.", "Oder ? ..."])
+
+    def test_misc_07(self):
+        tokens = "Hallo Susi . Hallo Peter .".split()
+        self.assertEqual(self.sentence_splitter.split(tokens, spans=True), [(0, 3), (3, 6)])
+
+    def test_misc_08(self):
+        self.assertEqual(self.sentence_splitter.split([], spans=True), [(0, 0)])
+
 
 class TestXMLPretokenized(TestSentenceSplitterPretokenized):
     """"""
@@ -280,6 +294,54 @@ class TestXMLPretokenized(TestSentenceSplitterPretokenized):
     def test_xml_06(self):
         self._equal_xml("<foo> <p> foo bar </p> <p> foo bar </p> </foo>", ["<foo> <p> foo bar </p>", "<p> foo bar </p> </foo>"])
 
+    def test_xml_07(self):
+        tokens = "<foo> <p> hallo </p> du </foo>".split()
+        self.assertEqual(self.sentence_splitter.split_xml(tokens, {"p"}, spans=True), [(0, 4), (4, 6)])
+
+
+class TestSplitMany(TestSentenceSplitterPretokenized):
+    """"""
+    paragraphs = [
+        "Hallo Susi . Hallo Peter .",
+        "",
+        "Wir könnten wandern , usw. Worauf hättest du denn Lust ?",
+        "Hallo ! @susi wie geht's ? #fail -- “ na ja ” .",
+        "„ Komm ! “ Sie kam . ( Endlich ! ) » Na ? « 12 Leute",
+        "Das war's ETC. Oder ? ...",
+    ]
+
+    def _equal_many(self, paragraphs):
+        """"""
+        paragraphs = [p.split() for p in paragraphs]
+        self.assertEqual(self.sentence_splitter.split_many(paragraphs), [self.sentence_splitter.split(p) for p in paragraphs])
+        self.assertEqual(self.sentence_splitter.split_many(paragraphs, spans=True), [self.sentence_splitter.split(p, spans=True) for p in paragraphs])
+
+    def test_split_many_01(self):
+        self._equal_many(self.paragraphs)
+
+    def test_split_many_02(self):
+        self._equal_many([])
+
+    def test_split_many_03(self):
+        self.assertEqual(self.sentence_splitter.split_many(["Hallo Susi . Hallo".split(), "“ Peter ! ” Hallo".split()]), [[["Hallo", "Susi", "."], ["Hallo"]], [["“", "Peter", "!", "”"], ["Hallo"]]])
+
+    def test_split_many_04(self):
+        splitter = SentenceSplitter(language="de_CMC", is_tuple=True)
+        paragraphs = [[("Hallo", "regular"), ("Susi", "regular"), (".", "symbol"), ("Hallo", "regular")], []]
+        self.assertEqual(splitter.split_many(paragraphs), [splitter.split(p) for p in paragraphs])
+
+
+class TestSplitManyWithoutNumpy(TestSplitMany):
+    """"""
+    def setUp(self):
+        """Necessary preparations"""
+        super().setUp()
+        self.np = sentence_splitter.np
+        sentence_splitter.np = None
+
+    def tearDown(self):
+        sentence_splitter.np = self.np
+
 
 class TestMiscTuple(TestSentenceSplitterTuple):
     """"""
@@ -367,3 +429,18 @@ class TestXMLBoundaries(TestSentenceSplitterXMLBoundaries):
 
     def test_xml_boundaries_25(self):
         self._equal_xml("<foo><p>Hallo Susi.</p> <p></p> <p>Hallo Peter.</p></foo>", "<foo> <p> <s> Hallo Susi . </s> </p> <p> </p> <p> <s> Hallo Peter . </s> </p> </foo>")
+
+    def test_xml_boundaries_26(self):
+        self._equal_xml("<foo>Hallo <x>Susi. <b><i></i><p>Hallo Peter.</p></b></x></foo>", "<foo> <s> Hallo <x> Susi . <b> <i> </i> </b> </x> </s> <x> <b> <p> <s> Hallo Peter . </s> </p> </b> </x> </foo>")
+
+    def test_xml_boundaries_27(self):
+        self._equal_xml("<foo><b><x>Hallo Susi.<br/></x> Peter</b> kommt.</foo>", "<foo> <b> <x> <s> Hallo Susi . </s> <br> </br> </x> </b> <s> <b> Peter </b> kommt . </s> </foo>")
+
+    def test_xml_boundaries_28(self):
+        depth = 200
+        raw = "<foo>" + "".join("Satz %d ist <i>kurz. " % i for i in range(depth)) + "</i>" * depth + "</foo>"
+        sentences = list(self.tokenizer.tokenize_xml(raw, ["p"]))
+        # 7 * depth + 2 tokens, 2 * depth sentence tags and one
+        # closing and re-opening tag per sentence boundary
+        self.assertEqual(sum(map(len, sentences)), 7 * depth + 2 + 2 * depth + 2 * (depth - 1))
+        self.assertEqual(self.tokenizer.xml_tag_statistics, {"closed": depth - 1, "reopened": depth - 1, "max_depth": depth + 1})
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from somajo.server import TokenizationServer, UnixTokenizationServer
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        """Necessary preparations"""
+        self.server = TokenizationServer(("127.0.0.1", 0))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def _post(self, request):
+        data = json.dumps(request).encode("utf-8")
+        with urllib.request.urlopen(urllib.request.Request(self.url + "/tokenize", data=data)) as response:
+            self.assertEqual(response.headers["Content-Type"], "application/x-ndjson")
+            return [json.loads(line) for line in response]
+
+    def _equal(self, request, tokenized_sentences):
+        results = self._post(request)
+        self.assertEqual([[t["text"] for t in r["tokens"]] for r in results], [ts.split() for ts in tokenized_sentences])
+        return results
+
+    def _status(self, method, path, data=None):
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(urllib.request.Request(self.url + path, data=data, method=method))
+        cm.exception.close()
+        return cm.exception.code
+
+    def test_server_01(self):
+        results = self._equal({"paragraphs": ["Heyi:)", "Was machst du morgen Abend?! Lust auf Film?;-)"]}, ["Heyi :)", "Was machst du morgen Abend ?!", "Lust auf Film ? ;-)"])
+        self.assertEqual([(r["paragraph"], r["sentence"]) for r in results], [(0, 0), (1, 0), (1, 1)])
+        self.assertEqual(results[0]["tokens"][1], {"text": ":)", "token_class": "emoticon", "space_after": True})
+
+    def test_server_02(self):
+        results = self._equal({"paragraphs": ["Don't panic."], "language": "en_PTB", "split_sentences": False, "character_offsets": True}, ["Do n't panic ."])
+        self.assertEqual([t["character_offset"] for t in results[0]["tokens"]], [[0, 2], [2, 5], [6, 11], [11, 12]])
+
+    def test_server_03(self):
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append((i, self._post({"paragraphs": ["Hallo Nutzer%d!" % i] * 3})))) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for i, result in results:
+            self.assertEqual([[t["text"] for t in r["tokens"]] for r in result], [["Hallo", "Nutzer%d" % i, "!"]] * 3)
+        with urllib.request.urlopen(self.url + "/metrics") as response:
+            metrics = response.read().decode("utf-8")
+        self.assertIn("somajo_requests_total 8", metrics)
+        self.assertIn("somajo_paragraphs_total 24", metrics)
+        self.assertIn('somajo_request_latency_seconds_bucket{le="+Inf"} 8', metrics)
+        self.assertIn("somajo_queue_depth 0", metrics)
+
+    def test_server_04(self):
+        self.assertEqual(self._status("POST", "/tokenize", b'{"paragraphs": ["Foo"], "deadline": 0}'), 504)
+        self.assertEqual(self._status("POST", "/tokenize", b'{"paragraphs": "Foo"}'), 400)
+        self.assertEqual(self._status("POST", "/tokenize", b'{"paragraphs": ["Foo"], "language": "fr"}'), 400)
+        self.assertEqual(self._status("POST", "/tokenize", b'Foo'), 400)
+        self.assertEqual(self._status("GET", "/foo"), 404)
+
+    def test_server_05(self):
+        self.assertEqual(self._status("POST", "/tokenize", b'{"paragraphs": ["Foo"], "split_camel_case": "yes"}'), 400)
+        self.assertEqual(self._status("POST", "/tokenize", b'{"paragraphs": ["Foo"], "character_offsets": 1}'), 400)
+        self.assertEqual(self._status("POST", "/tokenize", b'{"paragraphs": ["Foo"], "xml_sentences": ["s"]}'), 400)
+        self.assertEqual(self._status("POST", "/tokenize", b'{"paragraphs": ["Foo"], "language": ["de_CMC"]}'), 400)
+        self.assertEqual(len(self.server._batchers), 0)
+
+    def test_server_06(self):
+        self.server.max_instances = 2
+        for language in ("de_CMC", "en_PTB", "de_CMC", "en_PTB"):
+            for split_sentences in (True, False):
+                self._equal({"paragraphs": ["Foo bar."], "language": language, "split_sentences": split_sentences}, ["Foo bar ."])
+                self.assertLessEqual(len(self.server._batchers), 2)
+        self.assertEqual([key[0] for key in self.server._batchers], ["en_PTB", "en_PTB"])
+
+
+class TestUnixServer(unittest.TestCase):
+    def test_unix_server_01(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "somajo.sock")
+            server = UnixTokenizationServer(path)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            connection = http.client.HTTPConnection("localhost")
+            connection.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.sock.connect(path)
+            connection.request("POST", "/tokenize", body=json.dumps({"paragraphs": ["Foo bar."]}))
+            response = connection.getresponse()
+            results = [json.loads(line) for line in response.read().splitlines()]
+            connection.close()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.assertEqual([[t["text"] for t in r["tokens"]] for r in results], [["Foo", "bar", "."]])
@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 
+import asyncio
 import io
+import logging
+import os
+import tempfile
+import threading
 import unittest
+import xml.sax
 
+from somajo.cache import ResultCache
+from somajo import utils
 from somajo.somajo import SoMaJo
 
 
@@ -11,33 +19,33 @@ class TestSoMaJo(unittest.TestCase):
         """Necessary preparations"""
         self.tokenizer = SoMaJo("de_CMC")
 
-    def _equal_text(self, paragraphs, tokenized_sentences, parallel=1):
-        sentences = self.tokenizer.tokenize_text(paragraphs, parallel=parallel)
+    def _equal_text(self, paragraphs, tokenized_sentences, parallel=1, backend="process"):
+        sentences = self.tokenizer.tokenize_text(paragraphs, parallel=parallel, backend=backend)
         sentences = [[t.text for t in s] for s in sentences]
         self.assertEqual(sentences, [ts.split() for ts in tokenized_sentences])
 
-    def _equal_text_file_single_newlines(self, paragraphs, tokenized_sentences, parallel=1):
+    def _equal_text_file_single_newlines(self, paragraphs, tokenized_sentences, parallel=1, backend="process"):
         pseudofile = io.StringIO("\n".join(paragraphs))
-        sentences = self.tokenizer.tokenize_text_file(pseudofile, paragraph_separator="single_newlines", parallel=parallel)
+        sentences = self.tokenizer.tokenize_text_file(pseudofile, paragraph_separator="single_newlines", parallel=parallel, backend=backend)
         sentences = [[t.text for t in s] for s in sentences]
         self.assertEqual(sentences, [ts.split() for ts in tokenized_sentences])
 
-    def _equal_text_file_empty_lines(self, paragraphs, tokenized_sentences, parallel=1):
+    def _equal_text_file_empty_lines(self, paragraphs, tokenized_sentences, parallel=1, backend="process"):
         pseudofile = io.StringIO("\n\n".join(paragraphs))
-        sentences = self.tokenizer.tokenize_text_file(pseudofile, paragraph_separator="empty_lines", parallel=parallel)
+        sentences = self.tokenizer.tokenize_text_file(pseudofile, paragraph_separator="empty_lines", parallel=parallel, backend=backend)
         sentences = [[t.text for t in s] for s in sentences]
         self.assertEqual(sentences, [ts.split() for ts in tokenized_sentences])
 
-    def _equal_xml(self, xml, tokenized_sentences, strip_tags=False, parallel=1, prune_tags=None):
+    def _equal_xml(self, xml, tokenized_sentences, strip_tags=False, parallel=1, backend="process", prune_tags=None):
         eos_tags = "title h1 h2 h3 h4 h5 h6 p br hr div ol ul dl table".split()
-        sentences = self.tokenizer.tokenize_xml(xml, eos_tags, strip_tags=strip_tags, parallel=parallel, prune_tags=prune_tags)
+        sentences = self.tokenizer.tokenize_xml(xml, eos_tags, strip_tags=strip_tags, parallel=parallel, backend=backend, prune_tags=prune_tags)
         sentences = [[t.text for t in s] for s in sentences]
         self.assertEqual(sentences, [ts.split() for ts in tokenized_sentences])
 
-    def _equal_xml_file(self, xml, tokenized_sentences, strip_tags=False, parallel=1, prune_tags=None):
+    def _equal_xml_file(self, xml, tokenized_sentences, strip_tags=False, parallel=1, backend="process", prune_tags=None):
         eos_tags = "title h1 h2 h3 h4 h5 h6 p br hr div ol ul dl table".split()
         pseudofile = io.StringIO(xml)
-        sentences = self.tokenizer.tokenize_xml_file(pseudofile, eos_tags, strip_tags=strip_tags, parallel=parallel, prune_tags=prune_tags)
+        sentences = self.tokenizer.tokenize_xml_file(pseudofile, eos_tags, strip_tags=strip_tags, parallel=parallel, backend=backend, prune_tags=prune_tags)
         sentences = [[t.text for t in s] for s in sentences]
         self.assertEqual(sentences, [ts.split() for ts in tokenized_sentences])
 
@@ -84,6 +92,92 @@ class TestTextParallel(TestSoMaJo):
     def test_text_03(self):
         self._equal_text_file_single_newlines(["Foo bar. Baz qux", "alpha. Beta gamma"], ["Foo bar .", "Baz qux", "alpha .", "Beta gamma"], parallel=2)
 
+    def test_text_04(self):
+        self.tokenizer._initial_batch_size = 50
+        paragraphs = ["Foo bar. Baz qux %d" % i for i in range(100)]
+        paragraphs[10] = " ".join(["Lorem ipsum."] * 500)
+        tokenized_sentences = [s for p in paragraphs for s in self.tokenizer.tokenize_text([p])]
+        tokenized_sentences = [" ".join(t.text for t in s) for s in tokenized_sentences]
+        self._equal_text_file_single_newlines(paragraphs, tokenized_sentences, parallel=2)
+
+
+class TestTextThreads(TestSoMaJo):
+    def test_text_01(self):
+        self._equal_text(["Foo bar. Baz qux", "alpha. Beta gamma"], ["Foo bar .", "Baz qux", "alpha .", "Beta gamma"], parallel=2, backend="thread")
+
+    def test_text_02(self):
+        self._equal_text_file_empty_lines(["Foo bar. Baz qux", "alpha. Beta gamma"], ["Foo bar .", "Baz qux", "alpha .", "Beta gamma"], parallel=2, backend="thread")
+
+    def test_text_03(self):
+        self._equal_text_file_single_newlines(["Foo bar. Baz qux", "alpha. Beta gamma"], ["Foo bar .", "Baz qux", "alpha .", "Beta gamma"], parallel=2, backend="serial")
+
+    def test_text_04(self):
+        paragraphs = ["Foo bar. Baz qux %d" % i for i in range(200)]
+        tokenized_sentences = [s for i in range(200) for s in ["Foo bar .", "Baz qux %d" % i]]
+        self._equal_text(paragraphs, tokenized_sentences, parallel=4, backend="thread")
+
+    def test_text_05(self):
+        self.assertRaises(AssertionError, self.tokenizer.tokenize_text, ["Foo bar."], parallel=2, backend="fork")
+
+
+class TestTextUnordered(TestSoMaJo):
+    def _equal_unordered(self, paragraphs, tokenized_sentences, parallel=1, backend="process", reorder_buffer=None):
+        sentences = self.tokenizer.tokenize_text(paragraphs, parallel=parallel, backend=backend, ordered=False, reorder_buffer=reorder_buffer)
+        sentences = sorted((i, j, " ".join(t.text for t in s)) for i, j, s in sentences)
+        self.assertEqual(sentences, tokenized_sentences)
+
+    def test_unordered_01(self):
+        self._equal_unordered(["Foo bar. Baz qux", "", "alpha. Beta gamma"], [(0, 0, "Foo bar ."), (0, 1, "Baz qux"), (2, 0, "alpha ."), (2, 1, "Beta gamma")])
+
+    def test_unordered_02(self):
+        self._equal_unordered(["Foo bar. Baz qux", "alpha. Beta gamma"], [(0, 0, "Foo bar ."), (0, 1, "Baz qux"), (1, 0, "alpha ."), (1, 1, "Beta gamma")], parallel=2)
+
+    def test_unordered_03(self):
+        paragraphs = ["Foo bar. Baz qux %d" % i for i in range(100)]
+        tokenized_sentences = [(i, j, s) for i in range(100) for j, s in enumerate(["Foo bar .", "Baz qux %d" % i])]
+        self._equal_unordered(paragraphs, tokenized_sentences, parallel=4, backend="thread")
+
+    def test_unordered_04(self):
+        self.tokenizer._initial_batch_size = 10
+        paragraphs = ["Foo bar. Baz qux %d" % i for i in range(20)]
+        sentences = self.tokenizer.tokenize_text(paragraphs, parallel=2, ordered=False, reorder_buffer=100)
+        self.assertEqual([(i, j) for i, j, s in sentences], [(i, j) for i in range(20) for j in range(2)])
+
+    def test_unordered_05(self):
+        tokenizer = SoMaJo("de_CMC", xml_sentences="s")
+        sentences = tokenizer.tokenize_text(["Foo bar. Baz qux"], ordered=False)
+        self.assertEqual([(i, j, " ".join(t.text for t in s)) for i, j, s in sentences], [(0, 0, "<s> Foo bar . </s>"), (0, 1, "<s> Baz qux </s>")])
+
+    def test_unordered_06(self):
+        sentences = self.tokenizer.tokenize_xml("<x><p>Foo bar. Baz</p><p>qux</p></x>", ["p"], ordered=False, parallel=2, backend="thread")
+        self.assertEqual(sorted((i, j, " ".join(t.text for t in s)) for i, j, s in sentences), [(0, 0, "<x> <p> Foo bar ."), (0, 1, "Baz </p>"), (1, 0, "<p> qux </p> </x>")])
+
+
+class TestCorpus(TestSoMaJo):
+    def _equal_corpus(self, files, tokenized, xml=False, parallel=1, backend="process"):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for name, content in files.items():
+                paths.append(os.path.join(tmpdir, name))
+                with open(paths[-1], "w", encoding="utf-8") as fh:
+                    fh.write(content)
+            eos_tags = ["p"] if xml else None
+            results = self.tokenizer.tokenize_corpus(paths, xml=xml, eos_tags=eos_tags, parallel=parallel, backend=backend)
+            results = [(os.path.basename(path), [" ".join(t.text for t in s) for s in sentences]) for path, sentences in results]
+        self.assertEqual(results, tokenized)
+
+    def test_corpus_01(self):
+        self._equal_corpus({"a.txt": "Foo bar. Baz qux\n\nalpha.", "b.txt": "", "c.txt": "Beta gamma delta epsilon."}, [("c.txt", ["Beta gamma delta epsilon ."]), ("a.txt", ["Foo bar .", "Baz qux", "alpha ."]), ("b.txt", [])])
+
+    def test_corpus_02(self):
+        self._equal_corpus({"a.txt": "Foo bar. Baz qux\n\nalpha.", "b.txt": "", "c.txt": "Beta gamma delta epsilon."}, [("c.txt", ["Beta gamma delta epsilon ."]), ("a.txt", ["Foo bar .", "Baz qux", "alpha ."]), ("b.txt", [])], parallel=2)
+
+    def test_corpus_03(self):
+        self._equal_corpus({"a.txt": "Foo bar. Baz qux", "c.txt": "Beta gamma delta epsilon."}, [("c.txt", ["Beta gamma delta epsilon ."]), ("a.txt", ["Foo bar .", "Baz qux"])], parallel=2, backend="thread")
+
+    def test_corpus_04(self):
+        self._equal_corpus({"a.xml": "<x><p>Foo bar. Baz</p><p>qux</p></x>", "b.xml": "<x>Foo &amp; bar</x>"}, [("a.xml", ["<x> <p> Foo bar .", "Baz </p>", "<p> qux </p> </x>"]), ("b.xml", ["<x> Foo &amp; bar </x>"])], xml=True, parallel=2)
+
 
 class TestTextNoSent(TestSoMaJoNoSent):
     def test_text_01(self):
@@ -123,6 +217,31 @@ class TestXMLParallel(TestSoMaJo):
         self._equal_xml_file("<html>\n  <body>\n    <p>Foo bar. Baz qux</p>\n    <p>alpha. Beta gamma</p>\n  </body>\n</html>", ["<html> <body> <p> Foo bar .", "Baz qux </p>", "<p> alpha .", "Beta gamma </p> </body> </html>"], parallel=2)
 
 
+    def test_xml_03(self):
+        self.tokenizer._xml_segment_size = 0
+        self._equal_xml("<html>\n  <body>\n    <p>Foo bar. Baz qux</p>\n    <p>alpha. <b>Beta</b> gamma</p>\n <div>delta</div></body>\n</html>", ["<html> <body> <p> Foo bar .", "Baz qux </p>", "<p> alpha .", "<b> Beta </b> gamma </p>", "<div> delta </div> </body> </html>"], parallel=2)
+
+    def test_xml_04(self):
+        self.tokenizer._xml_segment_size = 0
+        self._equal_xml_file("<html>\n  <body>\n    <p>Foo bar. Baz qux</p>\n    <p>alpha. <b>Beta</b> gamma</p>\n <div>delta</div></body>\n</html>", ["<html> <body> <p> Foo bar .", "Baz qux </p>", "<p> alpha .", "<b> Beta </b> gamma </p>", "<div> delta </div> </body> </html>"], parallel=2)
+
+    def test_xml_05(self):
+        self.tokenizer._xml_segment_size = 0
+        for xml_parser in sorted(self.tokenizer.xml_parsers):
+            if xml_parser == "lxml" and utils.etree is None:
+                continue
+            with self.assertRaises(xml.sax.SAXParseException, msg=xml_parser):
+                list(self.tokenizer.tokenize_xml("<x><p>Foo</p><p>bar &undefined;</p></x>", ["p"], parallel=2, xml_parser=xml_parser))
+
+
+class TestXMLThreads(TestSoMaJo):
+    def test_xml_01(self):
+        self._equal_xml("<html>\n  <body>\n    <p>Foo bar. Baz qux</p>\n    <p>alpha. Beta gamma</p>\n  </body>\n</html>", ["<html> <body> <p> Foo bar .", "Baz qux </p>", "<p> alpha .", "Beta gamma </p> </body> </html>"], parallel=2, backend="thread")
+
+    def test_xml_02(self):
+        self._equal_xml_file("<html>\n  <body>\n    <p>Foo bar. Baz qux</p>\n    <p>alpha. Beta gamma</p>\n  </body>\n</html>", ["<html> <body> <p> Foo bar .", "Baz qux </p>", "<p> alpha .", "Beta gamma </p> </body> </html>"], parallel=2, backend="thread")
+
+
 class TestXMLNoSent(TestSoMaJoNoSent):
     def test_xml_01(self):
         self._equal_xml("<html>\n  <body>\n    <p>Foo bar. Baz qux</p>\n    <p>alpha. Beta gamma</p>\n  </body>\n</html>", ["<html> <body> <p> Foo bar . Baz qux </p>", "<p> alpha . Beta gamma </p> </body> </html>"])
@@ -160,11 +279,18 @@ class TestCharacterOffsets(TestSoMaJo):
         """Necessary preparations"""
         self.tokenizer = SoMaJo("de_CMC", character_offsets=True)
 
-    def _equal_offsets_text_file(self, paragraphs, tokenized_sentences, parallel=1):
+    def _equal_offsets_text_file(self, paragraphs, tokenized_sentences, parallel=1, on_disk=False):
         raw = "\n\n".join(paragraphs)
-        pseudofile = io.StringIO(raw)
-        sentences = self.tokenizer.tokenize_text_file(pseudofile, paragraph_separator="empty_lines", parallel=parallel)
-        sentences = list(sentences)
+        if on_disk:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, "foo.txt")
+                with open(path, "w", encoding="utf-8") as fh:
+                    fh.write(raw)
+                sentences = list(self.tokenizer.tokenize_text_file(path, paragraph_separator="empty_lines", parallel=parallel))
+        else:
+            pseudofile = io.StringIO(raw)
+            sentences = self.tokenizer.tokenize_text_file(pseudofile, paragraph_separator="empty_lines", parallel=parallel)
+            sentences = list(sentences)
         tokens = [[t.text for t in s] for s in sentences]
         self.assertEqual(tokens, [ts.split() for ts in tokenized_sentences])
         offsets = [[t.character_offset for t in s] for s in sentences]
@@ -184,8 +310,247 @@ class TestCharacterOffsets(TestSoMaJo):
     def test_text_offsets_01(self):
         self._equal_offsets_text_file(["Foo bar. Baz qux", "alpha. Beta gamma"], ["Foo bar .", "Baz qux", "alpha .", "Beta gamma"])
 
+    def test_text_offsets_02(self):
+        self._equal_offsets_text_file(["Föö bar. Bäz qux", "\u3000", "alpha. Beta gamma"], ["Föö bar .", "Bäz qux", "alpha .", "Beta gamma"], parallel=2, on_disk=True)
+
     def test_xml_offsets_01(self):
         self._equal_offsets_xml("<foo><p>bar</p><p>baz</p></foo>", ["<foo> <p> bar </p>", "<p> baz </p> </foo>"])
 
     def test_xml_offsets_02(self):
         self._equal_offsets_xml("<foo>\n<p>\nbar\n</p>\n<p>\nbaz\n</p>\n</foo>", ["<foo> <p> bar </p>", "<p> baz </p> </foo>"])
+
+    def test_xml_offsets_03(self):
+        self._equal_offsets_xml("<foo><p>bar <del>x</del> baz.</p>\n<script>\nvar x;\n</script><p>qux</p></foo>", ["<foo> <p> bar baz . </p>", "<p> qux </p> </foo>"], prune_tags=["del", "script"])
+
+    def test_xml_offsets_04(self):
+        self.tokenizer._xml_segment_size = 0
+        self._equal_offsets_xml("<foo><p>bar <del>x</del> baz.</p>\n<script>\nvar x;\n</script><p>qux</p></foo>", ["<foo> <p> bar baz . </p>", "<p> qux </p> </foo>"], parallel=2, prune_tags=["del", "script"])
+
+
+class TestCache(TestCharacterOffsets):
+    def setUp(self):
+        """Necessary preparations"""
+        self.cache = ResultCache(maxsize=10)
+        self.tokenizer = SoMaJo("de_CMC", character_offsets=True, cache=self.cache)
+
+    def test_cache_01(self):
+        self._equal_offsets_text_file(["Foo bar. Baz qux", "alpha", "Foo bar. Baz qux", "alpha", "Ende"], ["Foo bar .", "Baz qux", "alpha", "Foo bar .", "Baz qux", "alpha", "Ende"])
+        self.assertEqual((self.cache.hits, self.cache.disk_hits, self.cache.misses), (2, 0, 3))
+
+    def test_cache_02(self):
+        self._equal_offsets_text_file(["Föö bar. Bäz qux", "alpha", "Föö bar. Bäz qux", "alpha", "Ende"], ["Föö bar .", "Bäz qux", "alpha", "Föö bar .", "Bäz qux", "alpha", "Ende"], parallel=2, on_disk=True)
+        self.assertEqual((self.cache.hits, self.cache.disk_hits, self.cache.misses), (2, 0, 3))
+
+    def test_cache_03(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            self.tokenizer.cache = ResultCache(path=path)
+            self._equal_text(["Foo bar. Baz qux", "alpha"], ["Foo bar .", "Baz qux", "alpha"])
+            self.tokenizer.cache.close()
+            self.tokenizer.cache = ResultCache(path=path)
+            self._equal_text(["alpha", "Foo bar. Baz qux"], ["alpha", "Foo bar .", "Baz qux"], parallel=2)
+            self.assertEqual(self.tokenizer.cache.disk_hits, 2)
+            self.assertEqual(self.tokenizer.cache.hit_rate, 1.0)
+            self.tokenizer.cache.close()
+
+    def test_cache_04(self):
+        tokenizer = SoMaJo("de_CMC", split_sentences=False, cache=self.cache)
+        self._equal_text(["Foo bar. Baz qux"], ["Foo bar .", "Baz qux"])
+        sentences = [[t.text for t in s] for s in tokenizer.tokenize_text(["Foo bar. Baz qux"])]
+        self.assertEqual(sentences, [["Foo", "bar", ".", "Baz", "qux"]])
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_cache_05(self):
+        tokenizer = SoMaJo("de_CMC", cache=self.cache, regex_timeout=0.01)
+        with self.assertLogs(level="WARNING"):
+            for i in range(2):
+                self.assertEqual(sum(len(s) for s in tokenizer.tokenize_text(["a." * 2000])), 2000)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+
+class TestRegexTimeout(TestSoMaJo):
+    def setUp(self):
+        """Necessary preparations"""
+        self.tokenizer = SoMaJo("de_CMC", regex_timeout=0.01)
+
+    def test_regex_timeout_01(self):
+        # the workers log the timeouts
+        logging.disable(logging.WARNING)
+        try:
+            self.assertEqual(sum(len(s) for s in self.tokenizer.tokenize_text(["a." * 2000, "Foo bar."], parallel=2)), 2003)
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertGreater(self.tokenizer.regex_timeouts["email"], 0)
+        self.assertEqual(SoMaJo("de_CMC").regex_timeouts, {})
+
+    def test_regex_timeout_02(self):
+        # Timeouts in other threads do not keep a result from being cached
+        cache = ResultCache()
+        tokenizer = SoMaJo("de_CMC", cache=cache, regex_timeout=0.01)
+        paragraphs = ["a." * 2000] * 3 + ["Foo bar %d." % i for i in range(3)]
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(sum(len(s) for s in tokenizer.tokenize_text(paragraphs, parallel=3, backend="thread")), 6009)
+        self.assertGreaterEqual(sum(tokenizer.regex_timeouts.values()), 3)
+        self.assertEqual(cache.misses, 6)
+        list(tokenizer.tokenize_text(["Foo bar %d." % i for i in range(3)]))
+        self.assertEqual(cache.hits, 3)
+
+
+class TestAsync(TestSoMaJo):
+    def _equal_async(self, tokenize, tokenized_sentences, limit=None):
+        async def collect():
+            sentences = []
+            async for sentence in tokenize():
+                sentences.append([t.text for t in sentence])
+                if len(sentences) == limit:
+                    break
+            return sentences
+        self.assertEqual(asyncio.run(collect()), [ts.split() for ts in tokenized_sentences])
+
+    def test_async_01(self):
+        self._equal_async(lambda: self.tokenizer.atokenize_text(["Foo bar. Baz qux", "alpha. Beta gamma"]), ["Foo bar .", "Baz qux", "alpha .", "Beta gamma"])
+
+    def test_async_02(self):
+        async def paragraphs():
+            for p in ["Foo bar. Baz qux", "alpha. Beta gamma"]:
+                await asyncio.sleep(0)
+                yield p
+        self._equal_async(lambda: self.tokenizer.atokenize_text(paragraphs(), parallel=2, queue_size=1), ["Foo bar .", "Baz qux", "alpha .", "Beta gamma"])
+
+    def test_async_03(self):
+        self._equal_async(lambda: self.tokenizer.atokenize_text(("Hallo Nutzer%d!" % i for i in range(1000)), queue_size=2), ["Hallo Nutzer0 !", "Hallo Nutzer1 !"], limit=2)
+
+    def test_async_04(self):
+        self._equal_async(lambda: self.tokenizer.atokenize_text_file(io.StringIO("Foo bar. Baz qux\n\nalpha"), "empty_lines"), ["Foo bar .", "Baz qux", "alpha"])
+
+    def test_async_05(self):
+        self._equal_async(lambda: self.tokenizer.atokenize_xml("<x><p>Foo bar. Baz qux</p><p>alpha</p></x>", ["p"], strip_tags=True), ["Foo bar .", "Baz qux", "alpha"])
+
+    def test_async_06(self):
+        with self.assertRaises(AssertionError):
+            self._equal_async(lambda: self.tokenizer.atokenize_text(["Foo"], backend="foo"), [])
+
+    def test_async_07(self):
+        closed = threading.Event()
+
+        def paragraphs():
+            try:
+                i = 0
+                while True:
+                    yield "Hallo Nutzer%d!" % i
+                    i += 1
+            finally:
+                closed.set()
+
+        async def collect():
+            agen = self.tokenizer.atokenize_text(paragraphs(), parallel=2, queue_size=2)
+            async for sentence in agen:
+                break
+            await agen.aclose()
+            return closed.is_set()
+
+        threads = set(threading.enumerate())
+        self.assertTrue(asyncio.run(collect()))
+        self.assertEqual(set(threading.enumerate()) - threads, set())
+
+    def test_async_08(self):
+        async def paragraphs():
+            yield "Foo bar."
+            yield "Baz."
+            await asyncio.Event().wait()
+
+        async def collect():
+            agen = self.tokenizer.atokenize_text(paragraphs())
+            sentence = await agen.__anext__()
+            await agen.aclose()
+            return [t.text for t in sentence]
+
+        threads = set(threading.enumerate())
+        self.assertEqual(asyncio.run(asyncio.wait_for(collect(), 10)), ["Foo", "bar", "."])
+        self.assertEqual(set(threading.enumerate()) - threads, set())
+
+
+class TestDocument(TestSoMaJo):
+    def setUp(self):
+        """Necessary preparations"""
+        self.tokenizer = SoMaJo("de_CMC", character_offsets=True)
+
+    def _equal_edit(self, text, edit, tokenized_sentences, index, removed, added, paragraph_separator="empty_lines"):
+        document = self.tokenizer.tokenize_document(text, paragraph_separator)
+        diff = document.edit(*edit)
+        self.assertEqual(document.text, text[:edit[0]] + edit[2] + text[edit[1]:])
+        sentences = list(document)
+        tokens = [[t.text for t in s] for s in sentences]
+        self.assertEqual(tokens, [ts.split() for ts in tokenized_sentences])
+        extracted = [[document.text[s:e] for s, e in (t.character_offset for t in sent)] for sent in sentences]
+        self.assertEqual(tokens, extracted)
+        self.assertEqual(diff.index, index)
+        self.assertEqual([[t.text for t in s] for s in diff.removed], [ts.split() for ts in removed])
+        self.assertEqual([[t.text for t in s] for s in diff.added], [ts.split() for ts in added])
+
+    def test_document_01(self):
+        self._equal_edit("Foo bar. Baz qux\n\nalpha. Beta gamma\n\nEnde.", (9, 12, "Quux"), ["Foo bar .", "Quux qux", "alpha .", "Beta gamma", "Ende ."], 1, ["Baz qux"], ["Quux qux"])
+
+    def test_document_02(self):
+        self._equal_edit("Foo bar. Baz qux\n\nalpha. Beta gamma\n\nEnde.", (16, 18, " "), ["Foo bar .", "Baz qux alpha .", "Beta gamma", "Ende ."], 1, ["Baz qux", "alpha ."], ["Baz qux alpha ."])
+
+    def test_document_03(self):
+        self._equal_edit("Foo bar. Baz qux\nalpha. Beta gamma\nEnde.", (16, 16, "\n\n"), ["Foo bar .", "Baz qux", "alpha .", "Beta gamma Ende ."], 1, ["Baz qux alpha ."], ["Baz qux", "alpha ."])
+
+    def test_document_04(self):
+        self._equal_edit("Foo bar.\nBaz qux\n", (7, 9, " "), ["Foo bar Baz qux"], 0, ["Foo bar .", "Baz qux"], ["Foo bar Baz qux"], paragraph_separator="single_newlines")
+
+    def test_document_05(self):
+        self._equal_edit("Foo bar.\n\nBaz qux", (17, 17, ". Quux"), ["Foo bar .", "Baz qux .", "Quux"], 1, ["Baz qux"], ["Baz qux .", "Quux"])
+
+    def test_document_06(self):
+        self._equal_edit("", (0, 0, "Foo bar."), ["Foo bar ."], 0, [], ["Foo bar ."])
+
+
+class TestObservers(TestSoMaJo):
+    def setUp(self):
+        """Necessary preparations"""
+        self.events = []
+        self.tokenizer = SoMaJo("de_CMC", observers=[self.events.append])
+
+    def test_observers_01(self):
+        list(self.tokenizer.tokenize_text(["Foo bar. Baz qux", "alpha"]))
+        self.assertEqual([(e.index, e.characters, e.tokens, e.sentences) for e in self.events], [(0, 16, 5, 2), (1, 5, 1, 1)])
+
+    def test_observers_02(self):
+        sentences = list(self.tokenizer.tokenize_text(["Foo bar. Baz qux", "alpha"], parallel=2, backend="thread"))
+        self.assertEqual(len(sentences), 3)
+        self.assertEqual(sorted((e.index, e.tokens, e.sentences) for e in self.events), [(0, 5, 2), (1, 1, 1)])
+
+    def test_observers_03(self):
+        sentences = list(self.tokenizer.tokenize_text(["Foo bar. Baz qux", "alpha"], parallel=2))
+        self.assertEqual(len(sentences), 3)
+        self.assertEqual(sorted((e.index, e.tokens, e.sentences) for e in self.events), [(0, 5, 2), (1, 1, 1)])
+
+    def test_observers_04(self):
+        list(self.tokenizer.tokenize_xml("<x><p>Foo bar. Baz qux</p><p>alpha</p></x>", ["p"]))
+        self.assertEqual(sum(e.tokens for e in self.events), 6)
+        self.assertEqual(sum(e.sentences for e in self.events), 3)
+
+    def test_observers_05(self):
+        tokenizer = SoMaJo("de_CMC", split_sentences=False, observers=[self.events.append])
+        list(tokenizer.tokenize_text(["Foo bar. Baz qux"]))
+        self.assertEqual([(e.tokens, e.sentences) for e in self.events], [(5, 0)])
+
+    def test_observers_06(self):
+        events = []
+        tokenizer = SoMaJo("de_CMC")
+        sentences = tokenizer.tokenize_text(["Foo bar.", "Baz qux", "alpha"])
+        next(sentences)
+        tokenizer.observers.append(events.append)
+        list(sentences)
+        self.assertEqual(events, [])
+        list(tokenizer.tokenize_text(["Foo bar."]))
+        self.assertEqual(len(events), 1)
+        # Observers added to a non-empty list receive the remaining events
+        sentences = self.tokenizer.tokenize_text(["Foo bar.", "Baz qux", "alpha"])
+        next(sentences)
+        self.tokenizer.observers.append(events.append)
+        list(sentences)
+        self.assertEqual(len(self.events), 3)
+        self.assertGreater(len(events), 1)
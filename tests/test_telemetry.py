@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from somajo.telemetry import JsonLinesWriter, ParagraphEvent, ProgressLogger, PrometheusExporter
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        """Necessary preparations"""
+        self.events = [ParagraphEvent(0, 16, 5, 2, 0.002, 1), ParagraphEvent(1, 5, 1, 1, 0.3, 2)]
+
+    def test_progress_01(self):
+        progress = ProgressLogger(interval=3600)
+        with self.assertLogs(level="INFO") as logs:
+            for event in self.events:
+                progress(event)
+            progress.close()
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("2 paragraphs, 6 tokens, 3 sentences", logs.output[0])
+        self.assertIn("slowest paragraph: 1 (5 characters, 0.300 seconds)", logs.output[0])
+
+    def test_progress_02(self):
+        progress = ProgressLogger(interval=0)
+        with self.assertLogs(level="INFO") as logs:
+            for event in self.events:
+                progress(event)
+            progress.close()
+        self.assertEqual(len(logs.output), 2)
+
+    def test_prometheus_01(self):
+        exporter = PrometheusExporter("unused", interval=3600)
+        for event in self.events:
+            exporter(event)
+        lines = exporter.render().splitlines()
+        self.assertIn("somajo_tokens_total 6", lines)
+        self.assertIn('somajo_paragraph_seconds_bucket{le="0.0025"} 1', lines)
+        self.assertIn('somajo_paragraph_seconds_bucket{le="0.25"} 1', lines)
+        self.assertIn('somajo_paragraph_seconds_bucket{le="0.5"} 2', lines)
+        self.assertIn('somajo_paragraph_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn("somajo_paragraph_seconds_count 2", lines)
+        self.assertIn('somajo_worker_paragraphs_total{worker="2"} 1', lines)
+
+    def test_prometheus_02(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "somajo.prom")
+            exporter = PrometheusExporter(path)
+            exporter(self.events[0])
+            exporter.close()
+            with open(path, encoding="utf-8") as fh:
+                self.assertEqual(fh.read(), exporter.render())
+            self.assertEqual(os.listdir(tmpdir), ["somajo.prom"])
+
+    def test_json_lines_01(self):
+        fh = io.StringIO()
+        writer = JsonLinesWriter(fh)
+        for event in self.events:
+            writer(event)
+        writer.close()
+        events = [ParagraphEvent(**json.loads(line)) for line in fh.getvalue().splitlines()]
+        self.assertEqual(events, self.events)
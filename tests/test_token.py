@@ -2,7 +2,7 @@
 
 import unittest
 
-from somajo.token import Token
+from somajo.token import Token, _class_codes, pack_tokens, unpack_tokens
 
 
 class TestToken(unittest.TestCase):
@@ -19,3 +19,55 @@ class TestToken(unittest.TestCase):
         t = Token("<p foo='bar'>", markup=True, markup_class="start", markup_eos=True)
         self.assertEqual(t.markup_class, "start")
         self.assertTrue(t.markup_eos)
+
+    def test_token_04(self):
+        t = Token("FooBar", token_class="regular")
+        t.token_class = "URL"
+        self.assertEqual(t.token_class, "URL")
+        with self.assertRaises(AssertionError):
+            t.token_class = "foo"
+        with self.assertRaises(AssertionError):
+            Token("FooBar", token_class="foo")
+
+    def test_token_05(self):
+        t = Token._new(":)", _class_codes["emoticon"], False, ": )", True, False)
+        self.assertEqual(vars(t), vars(Token(":)", token_class="emoticon", space_after=False, original_spelling=": )", first_in_sentence=True)))
+
+    def test_token_06(self):
+        self.assertEqual(Token("<tei:p n='1'>", markup=True, markup_class="start", markup_eos=True).tag_name, "tei:p")
+        self.assertEqual(Token("</tei:p>", markup=True, markup_class="end", markup_eos=True).tag_name, "tei:p")
+        self.assertEqual(Token("<p>", markup=True, markup_class="start", markup_eos=True, tag_name="q").tag_name, "q")
+        self.assertIsNone(Token("p").tag_name)
+        with self.assertRaises(AssertionError):
+            Token("p", tag_name="p")
+
+    def test_pack_tokens_01(self):
+        tokens = [
+            Token("<p>", markup=True, markup_class="start", markup_eos=True, locked=True, character_offset=(0, 3)),
+            Token("Foo", token_class="regular", space_after=False, first_in_sentence=True, character_offset=(3, 6)),
+            Token(":)", token_class="emoticon", original_spelling=": )", last_in_sentence=True, character_offset=(6, 9)),
+            Token("</p>", markup=True, markup_class="end", markup_eos=False, character_offset=(9, 13)),
+        ]
+        unpacked = unpack_tokens(pack_tokens(tokens))
+        self.assertEqual([vars(t) for t in unpacked], [vars(t) for t in tokens])
+
+    def test_pack_tokens_02(self):
+        self.assertEqual(unpack_tokens(pack_tokens([])), [])
+
+    def test_pack_tokens_03(self):
+        tokens = [
+            Token("<br>", markup=True, markup_class="start", markup_eos=True, character_offset=(100000, 100005)),
+            Token("</br>", markup=True, markup_class="end", markup_eos=True, character_offset=(100005, 100005)),
+            Token("x" * 70000, token_class="regular", character_offset=(100000, 170000)),
+        ]
+        unpacked = unpack_tokens(pack_tokens(tokens))
+        self.assertEqual([vars(t) for t in unpacked], [vars(t) for t in tokens])
+
+    def test_pack_tokens_04(self):
+        tokens = [
+            Token('<tei:hi rend="it" n="2">', markup=True, markup_class="start", markup_eos=False),
+            Token("Foo", token_class="regular"),
+            Token("</tei:hi>", markup=True, markup_class="end", markup_eos=False),
+        ]
+        unpacked = unpack_tokens(pack_tokens(tokens))
+        self.assertEqual([t.tag_name for t in unpacked], ["tei:hi", None, "tei:hi"])
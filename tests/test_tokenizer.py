@@ -2,6 +2,8 @@
 
 import itertools
 import logging
+import pickle
+import threading
 import unittest
 
 from somajo import Tokenizer
@@ -1445,3 +1447,50 @@ class TestDeprecated(TestTokenizerDeprecated):
 
     def test_deprecated_02(self):
         self._equal_xml("<p>foo bar baz</p>", "<p> foo bar baz </p>")
+
+
+class TestRegexTimeout(TestTokenizer):
+    def setUp(self):
+        """Necessary preparations"""
+        self.tokenizer = Tokenizer(language="de_CMC", split_camel_case=True, regex_timeout=0.01)
+
+    def test_regex_timeout_01(self):
+        with self.assertLogs(level="WARNING") as logs:
+            self._equal("a." * 2000, ["a."] * 2000)
+        self.assertGreater(self.tokenizer.regex_timeouts["email"], 0)
+        self.assertTrue(any("Rule email timed out" in line for line in logs.output))
+
+    def test_regex_timeout_02(self):
+        self.tokenizer.regex_timeout = 1e-9
+        self._equal("Mail an foo@example.com oder www.example.com!", "Mail an foo@example.com oder www.example.com !")
+        self.assertEqual(sum(self.tokenizer.regex_timeouts.values()), 0)
+
+    def test_regex_timeout_03(self):
+        self.assertEqual(self.tokenizer._rule_name(self.tokenizer.email), "email")
+        self.assertEqual(self.tokenizer._rule_name(self.tokenizer.url_rules[0]), "url_rules")
+        tokenizer = Tokenizer(language="en_PTB")
+        self.assertEqual(tokenizer._rule_name(tokenizer.en_twopart_contractions[1]), "en_twopart_contractions[1]")
+
+    def test_regex_timeout_04(self):
+        self.assertIsNone(Tokenizer().regex_timeout)
+
+    def test_regex_timeout_05(self):
+        def time_out():
+            # Thread identifiers can be reused, so only the difference counts
+            n_timeouts = self.tokenizer._timeouts_in_thread()
+            for i in range(500):
+                self.tokenizer._timed_out(self.tokenizer.email, "a." * 200)
+            counts.append(self.tokenizer._timeouts_in_thread() - n_timeouts)
+        counts = []
+        threads = [threading.Thread(target=time_out) for i in range(8)]
+        with self.assertLogs(level="WARNING"):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(self.tokenizer.regex_timeouts["email"], 4000)
+        self.assertEqual(counts, [500] * 8)
+        self.assertEqual(self.tokenizer._timeouts_in_thread(), 0)
+        tokenizer = pickle.loads(pickle.dumps(self.tokenizer))
+        self.assertEqual(tokenizer._take_timeouts(), {"email": 4000})
+        self.assertEqual(tokenizer.regex_timeouts, {})
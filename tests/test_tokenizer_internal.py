@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import random
 import unittest
 
 import regex as re
@@ -256,3 +257,76 @@ class TestSplitAllSet(unittest.TestCase):
         self.tokenizer._split_all_set(token_dll, self.regex, self.set_, to_lower=True)
         tokens = token_dll.to_list()
         self.assertEqual([t.text for t in tokens], "0 aBc 0 0xYz0".split())
+
+
+class TestSplitAllMatchesFused(unittest.TestCase):
+    """"""
+    def setUp(self):
+        """Necessary preparations"""
+        self.tokenizer = Tokenizer(language="en_PTB", split_camel_case=True)
+        self.fragments = ["http://example.com/foo_(bar)", "www.example.org", "[link](https://x.com)", "doi:10.1000/182",
+                          "doi: 10.1000/182", "tagesschau.de-App", "r/python", "/u/foo/", "2024-01-02", "1.2.2024",
+                          "12/31/99", "3.4.", "1.234,5", "192.168.0.1", "1.2.3.", "-1.5e3", "gonna", "cannot",
+                          "dunno", "whaddya", "I'm", "'tis", " ", " ", "foo", "(", ")", ".", "-", "/", "'"]
+
+    def _random_text(self, rng):
+        return "".join(rng.choice(self.fragments) for _ in range(rng.randint(1, 12)))
+
+    def _equal_sequential(self, rule_group, text):
+        fused_dll = DLL([Token(text, first_in_sentence=True, last_in_sentence=True)])
+        self.tokenizer._split_all_matches_fused(rule_group, fused_dll)
+        sequential_dll = DLL([Token(text, first_in_sentence=True, last_in_sentence=True)])
+        for regex, token_class, kwargs in rule_group[1]:
+            self.tokenizer._split_all_matches(regex, sequential_dll, token_class, **kwargs)
+        fused = [(t.text, t.token_class, t._locked, t.space_after, t.first_in_sentence, t.last_in_sentence) for t in fused_dll.to_list()]
+        sequential = [(t.text, t.token_class, t._locked, t.space_after, t.first_in_sentence, t.last_in_sentence) for t in sequential_dll.to_list()]
+        self.assertEqual(fused, sequential, text)
+
+    def test_split_all_matches_fused_01(self):
+        rng = random.Random(26)
+        for rule_group in (self.tokenizer.url_rules, self.tokenizer.date_rules, self.tokenizer.number_rules, self.tokenizer.en_contraction_rules):
+            for _ in range(300):
+                self._equal_sequential(rule_group, self._random_text(rng))
+
+    def test_split_all_matches_fused_02(self):
+        token_dll = DLL([Token("See 1.2.3. and 10.0.0.1 or 3,5")])
+        self.tokenizer._split_all_matches_fused(self.tokenizer.number_rules, token_dll)
+        self.assertEqual([t.text for t in token_dll.to_list()], ["See", "1.2.3.", "and", "10.0.0.1", "or", "3,5"])
+
+
+class TestSplitAllMatchesFusedGerman(TestSplitAllMatchesFused):
+    """"""
+    def setUp(self):
+        """Necessary preparations"""
+        self.tokenizer = Tokenizer(language="de_CMC", split_camel_case=True)
+        self.fragments = ["http://example.com/foo_(bar)", "www.example.org", "[link](https://x.com)", "doi:10.1000/182",
+                          "tagesschau.de-App", "r/python", "2024-01-02", "1.2.2024", "01.02.24", "3.4.", "31.12.", "3.",
+                          "12/31/99", "1. Mai", "2.-4.", "z.B.", "d.h.", "Nr.", "S.", "1.234,5", "192.168.0.1", "1.2.3.",
+                          "-1.5e3", "17:30", "WS 2023/24", "1,-", "3/4", "eBay", "InDesign", " ", " ", "foo", "(", ")",
+                          ".", "-", "/", "'"]
+
+    def test_split_all_matches_fused_01(self):
+        rng = random.Random(26)
+        for rule_group in (self.tokenizer.url_rules, self.tokenizer.date_rules, self.tokenizer.number_rules):
+            for _ in range(300):
+                self._equal_sequential(rule_group, self._random_text(rng))
+
+    def test_split_all_matches_fused_02(self):
+        token_dll = DLL([Token("Am 1.2.2024 und 31.12. um 3,5")])
+        self.tokenizer._split_all_matches_fused(self.tokenizer.date_rules, token_dll)
+        self.assertEqual([t.text for t in token_dll.to_list()], ["Am", "1.", "2.", "2024", "und", "31.", "12.", "um 3,5"])
+
+    def test_split_all_matches_fused_03(self):
+        # The whole tokenizer gives the same results with and without
+        # fused rule groups
+        rng = random.Random(35)
+        texts = [self._random_text(rng) for _ in range(300)]
+        fused = [[(t.text, t.token_class) for t in self.tokenizer._tokenize(DLL([Token(text, first_in_sentence=True, last_in_sentence=True)]))] for text in texts]
+
+        def sequential(rule_group, token_dll):
+            for regex, token_class, kwargs in rule_group[1]:
+                self.tokenizer._split_all_matches(regex, token_dll, token_class, **kwargs)
+
+        self.tokenizer._split_all_matches_fused = sequential
+        for text, tokens in zip(texts, fused):
+            self.assertEqual([(t.text, t.token_class) for t in self.tokenizer._tokenize(DLL([Token(text, first_in_sentence=True, last_in_sentence=True)]))], tokens, text)
@@ -1,5 +1,11 @@
 #!/usr/bin/env python3
 
+import bz2
+import gzip
+import io
+import os
+import pickle
+import tempfile
 import unittest
 
 from somajo import utils
@@ -61,6 +67,17 @@ class TestXmlChunkGenerator(unittest.TestCase):
     def test_xml_chunk_generator_09(self):
         self._equal("<x>bar\n  <del>foo</del>\nbaz</x>", [["<x>", "bar\n  \nbaz", "</x>"]], prune_tags=["del"])
 
+    def test_xml_chunk_generator_10(self):
+        self._equal("<x>foo<del>a<!-- </del> -->b<del>c</del><![CDATA[</del>]]></del>bar</x>", [["<x>", "foobar", "</x>"]], prune_tags=["del"])
+
+    def test_xml_chunk_generator_11(self):
+        self._equal("<x>foo<del\n a='>'>\n<p>a</p>\n</del\n>bar<del/><delete>baz</delete></x>", [["<x>", "foobar", "<delete>", "baz", "</delete>", "</x>"]], prune_tags=["del"])
+
+    def test_xml_chunk_generator_12(self):
+        with self.assertLogs(level="INFO") as cm:
+            self._equal("<x>foo<del>a</del>\n<del>\nb\n</del>\n</x>", [["<x>", "foo\n\n", "</x>"]], prune_tags=["del"])
+        self.assertEqual(cm.output, ["INFO:root:Pruned 2 elements (26 characters)"])
+
     def test_xml_chunk_offsets_01(self):
         self._equal_offsets("<foo>T&#x0065;st</foo>", [["<foo>", "T&#x0065;st", "</foo>"]])
 
@@ -120,6 +137,223 @@ class TestXmlChunkGenerator(unittest.TestCase):
     def test_xml_chunk_offsets_18(self):
         self._equal_offsets("<foo>foo<p>bar</p></foo>", [["<foo>", "foo"], ["<p>", "bar", "</p>", "</foo>"]])
 
-    @unittest.expectedFailure
     def test_xml_chunk_offsets_19(self):
-        self._equal_offsets("<foo>bar <del>futsch</del> baz</foo>", [["<foo>", "bar  baz", "</foo>"]], prune_tags=["del"])
+        self._equal_offsets("<foo>bar <del>futsch</del> baz</foo>", [["<foo>", "bar <del>futsch</del> baz", "</foo>"]], prune_tags=["del"])
+
+    def test_xml_chunk_offsets_20(self):
+        self._equal_offsets("<foo><del>futsch</del>bar<del/></foo>", [["<foo>", "bar", "</foo>"]], prune_tags=["del"])
+
+
+class TestXmlSegments(unittest.TestCase):
+    def _equal(self, xml, eos_tags, prune_tags=None, character_offsets=False, n_segments=None):
+        """Concatenating the chunks of the segments gives the same result
+        as xml_chunk_generator."""
+        expected = list(utils.xml_chunk_generator(xml, is_file=False, eos_tags=eos_tags, prune_tags=prune_tags, character_offsets=character_offsets))
+        segments = list(utils.xml_segment_generator(xml, is_file=False, eos_tags=eos_tags, prune_tags=prune_tags, character_offsets=character_offsets, segment_size=0))
+        chunks = [chunk for segment in segments for chunk in (utils.xml_segment_chunks(segment) if isinstance(segment, utils.XmlSegment) else [segment])]
+        self.assertEqual(len(chunks), len(expected))
+        for (tokens, raw, position), (exp_tokens, exp_raw, exp_position) in zip(chunks, expected):
+            self.assertEqual([(t.text, t.markup, t.markup_class, t.markup_eos, t.first_in_sentence, t.last_in_sentence, t.character_offset) for t in tokens],
+                             [(t.text, t.markup, t.markup_class, t.markup_eos, t.first_in_sentence, t.last_in_sentence, t.character_offset) for t in exp_tokens])
+        if n_segments is not None:
+            self.assertEqual(sum(isinstance(segment, utils.XmlSegment) for segment in segments), n_segments)
+
+    def test_xml_segments_01(self):
+        self._equal("<doc><p>Foo bar.</p>\n<p>Baz <b>qux</b></p></doc>", {"p"}, n_segments=2)
+
+    def test_xml_segments_02(self):
+        self._equal("<doc><p>Foo bar.</p>\n<p>Baz <b>qux</b></p></doc>", {"p"}, character_offsets=True, n_segments=2)
+
+    def test_xml_segments_03(self):
+        self._equal("<doc><div a='1>'>Foo <i>bar</i>\n <b>\n<p>Baz</p>qux</b></div></doc>\n", {"p", "div"})
+
+    def test_xml_segments_04(self):
+        self._equal("<doc><p>Foo</p>bar &amp; <b>baz</b> <p>qux</p><br/><p>quux</p></doc>", {"p", "br"}, character_offsets=True)
+
+    def test_xml_segments_05(self):
+        self._equal("<doc><p>Foo <del>bar</del></p><del><p>baz</p></del><p>qux</p></doc>", {"p"}, prune_tags={"del"})
+
+    def test_xml_segments_06(self):
+        self._equal("<doc><!-- <p> --><p>Foo</p><![CDATA[<p>bar]]><p>baz</p></doc>", {"p"})
+
+    def test_xml_segments_07(self):
+        self._equal("<!DOCTYPE doc><doc><p>Foo</p><p>bar</p></doc>", {"p"}, n_segments=2)
+
+    def test_xml_segments_08(self):
+        self._equal("<doc><p>Foo</p>bar</doc>", {"p"}, n_segments=1)
+
+    def test_xml_segments_10(self):
+        # Undefined entities are skipped if there is an external DTD
+        self._equal('<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "xhtml1-strict.dtd">\n<html><p>Foo</p><p>a&nbsp;b</p></html>', {"p"}, n_segments=2)
+
+    def test_xml_segments_11(self):
+        # Entities declared in the internal subset: the document is
+        # parsed as a stream
+        self._equal("<!DOCTYPE d [<!ENTITY x 'ex'>]><d><p>Foo</p><p>&x;</p></d>", {"p"}, n_segments=0)
+
+    def test_xml_segments_09(self):
+        self._equal("<doc>Foo<i b='q'/>\n<p>bar</p>baz</doc>\n", {"p"}, character_offsets=True, n_segments=2)
+
+
+class TestXmlParsers(unittest.TestCase):
+    def _equal(self, xml, eos_tags, prune_tags=None, character_offsets=False):
+        """All XML parsers give the same chunks as the SAX parser."""
+        parsers = [p for p in utils.xml_parsers if p != "lxml" or utils.etree is not None]
+        results = []
+        for xml_parser in parsers:
+            chunks = utils.xml_chunk_generator(xml, is_file=False, eos_tags=eos_tags, prune_tags=prune_tags, character_offsets=character_offsets, xml_parser=xml_parser)
+            results.append([[(t.text, t.markup, t.markup_class, t.markup_eos, t.first_in_sentence, t.last_in_sentence, t.character_offset) for t in tokens] for tokens, raw, position in chunks])
+        for xml_parser, result in zip(parsers, results):
+            self.assertEqual(result, results[parsers.index("sax")], xml_parser)
+
+    def test_xml_parsers_01(self):
+        self._equal("<doc><p class='a' id=\"b\">Foo &amp; bar.</p>\n<p>Baz <b>qux</b></p></doc>", {"p"}, character_offsets=True)
+
+    def test_xml_parsers_02(self):
+        self._equal("<doc><p>Foo <del>bar</del></p><del><p>baz</p></del><p>qux<br/></p></doc>", {"p", "br"}, prune_tags={"del"})
+
+    def test_xml_parsers_03(self):
+        self._equal("<!DOCTYPE d [<!ENTITY x 'ex &amp; y'>]><d>a &x; &#x1F600;<![CDATA[<b>]]><!-- c --><?pi x?></d>", {"p"})
+
+    def test_xml_parsers_04(self):
+        self._equal("<d xmlns='urn:a' xmlns:b='urn:b' b:c='1'><b:p xml:lang='de'>x</b:p><p xmlns=''>y</p></d>", {"p", "b:p"})
+
+    def test_xml_parsers_05(self):
+        self._equal("<doc>\r\n" + "foo &amp; bar\n" * 1000 + "<p a='x\ty'>baz</p></doc>", {"p"})
+
+    def test_xml_parsers_07(self):
+        # References to external entities are skipped
+        self._equal("<!DOCTYPE d [<!ENTITY x SYSTEM 'x.xml'>]><d><p>a &x; b</p></d>", {"p"})
+
+    def test_xml_parsers_08(self):
+        for xml_parser in utils.xml_parsers:
+            if xml_parser == "lxml" and utils.etree is None:
+                continue
+            with self.assertRaises(utils.XmlParseError, msg=xml_parser) as cm:
+                list(utils.xml_chunk_generator("<d>\n<p>a</q></d>", is_file=False, xml_parser=xml_parser))
+            self.assertEqual(cm.exception.getLineNumber(), 2)
+            error = pickle.loads(pickle.dumps(cm.exception))
+            self.assertEqual((str(error), error.getLineNumber()), (str(cm.exception), 2))
+
+    @unittest.skipIf(utils.etree is not None, "lxml is installed")
+    def test_xml_parsers_06(self):
+        self.assertRaises(ImportError, list, utils.xml_chunk_generator("<x/>", is_file=False, xml_parser="lxml"))
+
+
+class TestPruneFilter(unittest.TestCase):
+    def setUp(self):
+        """Necessary preparations"""
+        self.lines = ["<d>a<script>\n", "x < y\n" * 1000, "</script>b<style/>\n", "c</d>\n"]
+
+    def test_prune_filter_01(self):
+        results = list(utils._PruneFilter({"script", "style"}).filter(self.lines))
+        self.assertEqual("".join(kept for kept, raw in results), "<d>ab\nc</d>\n")
+        self.assertEqual(len("".join(raw for kept, raw in results)), len("".join(self.lines)))
+
+    def test_prune_filter_02(self):
+        results = list(utils._PruneFilter({"script", "style"}, placeholders=False).filter(self.lines))
+        self.assertEqual([kept for kept, raw in results], [raw for kept, raw in results])
+        self.assertEqual("".join(kept for kept, raw in results), "<d>ab\nc</d>\n")
+
+
+class TestReorder(unittest.TestCase):
+    def _equal(self, indexes, max_buffered, expected):
+        items = [(i, str(i)) for i in indexes]
+        self.assertEqual([i for i, value in utils.reorder(items, max_buffered)], expected)
+
+    def test_reorder_01(self):
+        self._equal([2, 0, 1, 4, 3], 10, [0, 1, 2, 3, 4])
+
+    def test_reorder_02(self):
+        self._equal([3, 2, 1, 0], 2, [1, 2, 3, 0])
+
+    def test_reorder_03(self):
+        self._equal([1, 2, 3, 0, 4], 1, [1, 2, 3, 0, 4])
+
+    def test_reorder_04(self):
+        self._equal([], 5, [])
+
+
+class TestOpenFile(unittest.TestCase):
+    def _roundtrip(self, filename):
+        text = "Fööbar.\n\nBaz qux\n" * 1000
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, filename)
+            with utils.open_file(path, "w") as fh:
+                fh.write(text)
+            with open(path, "rb") as fh:
+                raw = fh.read()
+            with utils.open_file(path) as fh:
+                self.assertEqual(fh.read(), text)
+        return raw
+
+    def test_open_file_01(self):
+        self.assertEqual(self._roundtrip("foo.txt"), ("Fööbar.\n\nBaz qux\n" * 1000).encode("utf-8"))
+
+    def test_open_file_02(self):
+        self.assertTrue(self._roundtrip("foo.txt.gz").startswith(b"\x1f\x8b"))
+
+    def test_open_file_03(self):
+        self.assertTrue(self._roundtrip("foo.txt.bz2").startswith(b"BZh"))
+
+    def test_open_file_04(self):
+        self.assertTrue(self._roundtrip("foo.txt.xz").startswith(b"\xfd7zXZ\x00"))
+
+    def test_open_file_05(self):
+        # Compression is detected by content, not by name
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "foo.txt")
+            with gzip.open(path, "wt", encoding="utf-8") as fh:
+                fh.write("Foo bar.\n\nBaz qux")
+            paragraphs = [p for _, p, _ in utils.get_paragraphs_list(path)]
+        self.assertEqual(paragraphs, ["Foo bar.\n\n", "Baz qux"])
+
+    def test_open_file_06(self):
+        # Plain text that starts like a bzip2 header
+        for text in ("BZh ist ein Test.\n\nFoo", "BZh91AY&SX bar\n"):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, "foo.txt")
+                with open(path, "w", encoding="utf-8") as fh:
+                    fh.write(text)
+                with utils.open_file(path) as fh:
+                    self.assertEqual(fh.read(), text)
+                self.assertIsNotNone(utils.get_paragraph_slices(path))
+
+    def test_open_file_07(self):
+        # An empty bzip2 stream has no block header
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "foo.txt")
+            with bz2.open(path, "wt", encoding="utf-8") as fh:
+                pass
+            with utils.open_file(path) as fh:
+                self.assertEqual(fh.read(), "")
+
+
+class TestParagraphSlices(unittest.TestCase):
+    def _equal(self, text, paragraph_separator):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "foo.txt")
+            with open(path, "w", encoding="utf-8", newline="") as fh:
+                fh.write(text)
+            slices = utils.get_paragraph_slices(path, paragraph_separator)
+            paragraphs = [(raw, position) for _, raw, position in map(utils.read_slice, slices)]
+        self.assertEqual(paragraphs, list(utils.get_paragraphs_str(io.StringIO(text), paragraph_separator)))
+
+    def test_paragraph_slices_01(self):
+        self._equal("Föö bar.\nBaz\n\nqux", "empty_lines")
+
+    def test_paragraph_slices_02(self):
+        self._equal("\n\nFöö bar.\n \n\u3000\n\xa0\nBaz\n\n\nqux\n\n", "empty_lines")
+
+    def test_paragraph_slices_03(self):
+        self._equal("\n\nFöö bar.\n \n\u3000\n\xa0\nBaz\n\n\nqux\n\n", "single_newlines")
+
+    def test_paragraph_slices_04(self):
+        self._equal("Föö\x85bar\u2028Baz\nqux", "single_newlines")
+
+    def test_paragraph_slices_05(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "foo.txt")
+            with open(path, "w", encoding="utf-8", newline="") as fh:
+                fh.write("Foo\r\n\r\nbar")
+            self.assertIsNone(utils.get_paragraph_slices(path))
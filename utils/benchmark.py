@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import itertools
+import logging
+import time
+
+from somajo import SoMaJo
+
+
+SYNTHETIC_PARAGRAPHS = [
+    "Heyi:) Was machst du morgen Abend?! Lust auf Film?;-)",
+    "Am 3.10.2024 um 14:30 Uhr gibt es z.B. bei www.example.com/foo_(bar) 20% Rabatt auf alle Artikel.",
+    "Das ist ein ganz normaler Satz mit ein paar Wörtern. Und noch einer, der etwas länger ist als der erste.",
+    "@somebody #hashtag ProfSmith meinte, die Vorlesung am Mo. fällt aus... Schade!!! 🙂👍🏽",
+    "That aint bad!:D I'm gonna check https://example.org/?q=1&x=2 later, e.g. on Jan. 5th.",
+]
+
+# Inputs on which some of the regular expressions take superlinear
+# time. Each pattern is repeated up to the length given by --length.
+PATHOLOGICAL_PARAGRAPHS = {
+    "abbreviation dots": "a.",
+    "number dots": "1.",
+    "number commas": "1,",
+    "pseudo-URL": "www.a-",
+    "pseudo-DOI": "10.1/",
+    "URL with brackets": "http://a.de/(a",
+    "obfuscated email": "a [at] b [dot] ",
+    "single quotes": "'a ",
+    "dashes": "-",
+    "punctuation": "!?.",
+}
+
+
+def arguments():
+    """"""
+    parser = argparse.ArgumentParser(description="Measure the throughput of SoMaJo with different parallelization backends.")
+    parser.add_argument("-l", "--language", choices=SoMaJo.supported_languages, default=SoMaJo._default_language, help="Language (Default: de_CMC)")
+    parser.add_argument("-s", "--paragraph_separator", choices=SoMaJo.paragraph_separators, default=SoMaJo._default_parsep, help="How are paragraphs separated in FILE? (Default: empty_lines)")
+    parser.add_argument("-x", "--xml", action="store_true", help="FILE is an XML file")
+    parser.add_argument("--parallel", type=int, action="append", help="Number of workers. Can be used multiple times. (Default: 1 and 4)")
+    parser.add_argument("--backend", choices=sorted(SoMaJo.backends), action="append", help="Backends to compare. Can be used multiple times. (Default: all)")
+    parser.add_argument("--split_sentences", "--split-sentences", action="store_true", help="Also split the input into sentences.")
+    parser.add_argument("-n", "--paragraphs", type=int, default=5000, help="Number of synthetic paragraphs if no FILE is given (Default: 5000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Report the best of this many runs (Default: 3)")
+    parser.add_argument("--pathological", action="store_true", help="Instead of measuring throughput, time the tokenization of single paragraphs of pathological input and report the rules that time out.")
+    parser.add_argument("--length", type=int, default=5000, help="Length of the pathological paragraphs in characters (Default: 5000)")
+    parser.add_argument("--regex-timeout", type=float, metavar="SECONDS", help="Timeout per rule and token in seconds. (Default: no timeout)")
+    parser.add_argument("FILE", nargs="?", help="The input file (UTF-8-encoded). If omitted, a synthetic corpus is used.")
+    args = parser.parse_args()
+    return args
+
+
+def read_input(args):
+    """"""
+    if args.FILE is not None:
+        with open(args.FILE, encoding="utf-8") as fh:
+            return fh.read()
+    paragraphs = itertools.islice(itertools.cycle(SYNTHETIC_PARAGRAPHS), args.paragraphs)
+    if args.xml:
+        return "<doc>\n" + "\n".join("<p>%s</p>" % p.replace("&", "&amp;") for p in paragraphs) + "\n</doc>\n"
+    return "\n\n".join(paragraphs)
+
+
+def run(tokenizer, data, args, parallel, backend):
+    """Tokenize data and return the number of tokens and the elapsed time."""
+    t0 = time.perf_counter()
+    if args.xml:
+        eos_tags = "title h1 h2 h3 h4 h5 h6 p br hr div ol ul dl table".split()
+        chunks = tokenizer.tokenize_xml(data, eos_tags, parallel=parallel, backend=backend)
+    else:
+        chunks = tokenizer.tokenize_text_file(io.StringIO(data), args.paragraph_separator, parallel=parallel, backend=backend)
+    n_tokens = sum(1 for chunk in chunks for token in chunk if not token.markup)
+    return n_tokens, time.perf_counter() - t0
+
+
+def pathological(tokenizer, args):
+    """Tokenize every pathological paragraph once and report the time
+    and the timeouts per rule.
+
+    """
+    print("%-20s %10s %8s %10s  %s" % ("input", "characters", "tokens", "seconds", "timeouts"))
+    for name, pattern in PATHOLOGICAL_PARAGRAPHS.items():
+        text = (pattern * (args.length // len(pattern) + 1))[:args.length]
+        tokenizer.regex_timeouts.clear()
+        t0 = time.perf_counter()
+        n_tokens = sum(1 for sentence in tokenizer.tokenize_text([text]) for token in sentence)
+        seconds = time.perf_counter() - t0
+        timeouts = ", ".join("%s (%d)" % (rule, n) for rule, n in sorted(tokenizer.regex_timeouts.items()))
+        print("%-20s %10d %8d %10.3f  %s" % (name, len(text), n_tokens, seconds, timeouts))
+
+
+def main():
+    """"""
+    args = arguments()
+    tokenizer = SoMaJo(args.language, split_sentences=args.split_sentences, regex_timeout=args.regex_timeout)
+    if args.pathological:
+        logging.disable(logging.WARNING)
+        pathological(tokenizer, args)
+        return
+    data = read_input(args)
+    parallel = args.parallel if args.parallel is not None else [1, 4]
+    backends = args.backend if args.backend is not None else sorted(SoMaJo.backends)
+    print("%d characters of input" % len(data))
+    print("%-10s %8s %10s %12s" % ("backend", "parallel", "seconds", "tokens/s"))
+    for backend in backends:
+        for n in parallel:
+            if backend == "serial" and n != parallel[0]:
+                continue
+            results = [run(tokenizer, data, args, n, backend) for _ in range(args.repeat)]
+            n_tokens, seconds = min(results, key=lambda r: r[1])
+            print("%-10s %8d %10.3f %12d" % (backend, n, seconds, n_tokens / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unicodedata
+import xml.sax
+import xml.sax.saxutils
+
+
+EOS_TAGS = ["p", "div", "title"]
+
+WORDS = ["Haus", "gehen", "schön", "the", "quick", "don't", "Straße", "CamelCase", "ein", "Test", "I", "gonna", "wanna", "U.S.", "AG"]
+ABBREVIATIONS = ["z.B.", "usw.", "Dr.", "bzw.", "e.g.", "i.e.", "Nr.", "Str.", "S.", "p.", "etc.", "vs.", "Jan.", "Art.", "Mio."]
+EMOTICONS = [":)", ";-)", ":-(", ":D", "xD", "^^", "<3", "^3", ":-P", "(-.-)", "¯\\_(ツ)_/¯", "🙂", "👍🏽", "🇩🇪", "❤️", "👨‍👩‍👧", ": )", ":smile:"]
+PUNCTUATION = [".", "!", "?", "?!", "...", "…", ",", ";", ":", "-", "--", "–", "(", ")", "[", "]", "\"", "'", "„", "“", "»", "«", "/", "*", "+", "&", "#", "@", "%", "€", "°"]
+COMBINING = ["\u0301", "\u0308", "\u0327", "\u030A", "\u0323"]
+ENTITIES = ["&amp;", "&lt;", "&gt;", "&quot;", "&apos;", "&#x41;", "&#228;", "&#x1F600;"]
+WHITESPACE = [" ", " ", " ", "  ", "\n", "\t", "\u00A0", "\u200B", "\u00AD", "\uFEFF"]
+INLINE_TAGS = ["i", "b", "span", "a"]
+
+
+def arguments():
+    """"""
+    parser = argparse.ArgumentParser(description="Differential testing of the current SoMaJo engine against a frozen reference implementation. Randomized inputs are generated from a grammar (URLs, emoticons, dates, XML fragments, abbreviations, combining characters, entities, etc.) and tokenized by both engines. Diverging outputs and character offsets that do not round-trip are reported together with a minimized input.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-r", "--reference", type=os.path.abspath, help="Directory that contains the reference somajo package, e.g. the src directory of a git worktree")
+    group.add_argument("--reference-rev", type=str, help="Git revision of this repository to use as reference, e.g. v2.4.3")
+    parser.add_argument("-n", "--cases", type=int, default=1000, help="Number of random inputs (Default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (Default: 0)")
+    parser.add_argument("-l", "--language", action="append", choices=["de_CMC", "en_PTB"], help="Languages to test. Can be used multiple times. (Default: all)")
+    parser.add_argument("--max-failures", type=int, default=10, help="Stop after this many failures (Default: 10)")
+    parser.add_argument("--no-minimize", action="store_true", help="Report diverging inputs without minimizing them")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if not args.worker and args.reference is None and args.reference_rev is None:
+        parser.error("one of the arguments -r/--reference --reference-rev is required")
+    return args
+
+
+def random_url(rng):
+    """"""
+    scheme = rng.choice(["http://", "https://", "", "www.", "ftp://"])
+    host = rng.choice(["example", "tagesschau", "foo-bar", "uni-erlangen"]) + rng.choice([".de", ".com", ".org", ".co.uk"])
+    if scheme == "":
+        host = "www." + host
+    path = "".join(rng.choice(["/", "/foo", "/bar_(baz)", "?q=1&x=2", "#top", "/index.html", "-App"]) for _ in range(rng.randint(0, 3)))
+    return rng.choice([scheme + host + path, f"[link]({scheme}{host}{path})", f"<{scheme}{host}{path}>", "doi:10.1000/182", "r/python", f"{rng.choice(['foo', 'a.b'])}@{host}"])
+
+
+def random_date(rng):
+    """"""
+    day, month, year = rng.randint(1, 31), rng.randint(1, 12), rng.randint(1900, 2099)
+    sep = rng.choice([".", "/", "-"])
+    return rng.choice([f"{day}{sep}{month}{sep}{year}", f"{year}-{month:02d}-{day:02d}", f"{day}.{month}.", f"{rng.randint(0, 23)}:{rng.randint(0, 59):02d}",
+                       f"{day}. {rng.choice(['Januar', 'März', 'Mai'])}", "1.2.3", "192.168.0.1", f"{rng.randint(0, 9999)},{rng.randint(0, 99)}", "3-4", "5km", "10 %", "1.000,-"])
+
+
+def random_text_atom(rng, xml_input):
+    """Return a single atom of text (a string)."""
+    category = rng.choices(["word", "abbreviation", "emoticon", "punctuation", "url", "date", "combining", "entity", "whitespace"],
+                           weights=[30, 5, 5, 15, 4, 5, 3, 3 if xml_input else 0, 30])[0]
+    if category == "word":
+        return rng.choice(WORDS)
+    elif category == "abbreviation":
+        return rng.choice(ABBREVIATIONS)
+    elif category == "emoticon":
+        return rng.choice(EMOTICONS)
+    elif category == "punctuation":
+        return rng.choice(PUNCTUATION)
+    elif category == "url":
+        return random_url(rng)
+    elif category == "date":
+        return random_date(rng)
+    elif category == "combining":
+        return rng.choice("aeiouAOU") + rng.choice(COMBINING)
+    elif category == "entity":
+        return rng.choice(ENTITIES)
+    return rng.choice(WHITESPACE)
+
+
+def escape_atom(atom):
+    """Escape a text atom for XML input. Atoms that are entities are left alone."""
+    if atom in ENTITIES:
+        return atom
+    return xml.sax.saxutils.escape(atom)
+
+
+def random_case(rng, language):
+    """Generate a test case. The input is stored as a list of atoms so
+    that it can be minimized.
+
+    """
+    xml_input = rng.random() < 0.3
+    atoms = []
+    if xml_input:
+        atoms.append("<doc>")
+        for _ in range(rng.randint(1, 3)):
+            eos_tag = rng.choice(EOS_TAGS)
+            atoms.append("<%s>" % eos_tag)
+            for _ in range(rng.randint(1, 15)):
+                if rng.random() < 0.1:
+                    tag = rng.choice(INLINE_TAGS)
+                    atoms.extend(["<%s>" % tag] + [escape_atom(random_text_atom(rng, xml_input)) for _ in range(rng.randint(1, 3))] + ["</%s>" % tag])
+                elif rng.random() < 0.03:
+                    atoms.append("<br/>")
+                else:
+                    atoms.append(escape_atom(random_text_atom(rng, xml_input)))
+            atoms.append("</%s>" % eos_tag)
+        atoms.append("</doc>")
+    else:
+        atoms = [random_text_atom(rng, xml_input) for _ in range(rng.randint(1, 25))]
+    return {"language": language, "xml": xml_input, "atoms": atoms}
+
+
+def well_formed(data):
+    """"""
+    try:
+        xml.sax.parseString(data.encode("utf-8"), xml.sax.handler.ContentHandler())
+    except xml.sax.SAXParseException:
+        return False
+    return True
+
+
+def tokenize_case(tokenizers, case):
+    """Tokenize the input of a case and return a JSON-serializable
+    representation of the output.
+
+    """
+    import somajo
+    key = case["language"]
+    if key not in tokenizers:
+        tokenizers[key] = somajo.SoMaJo(case["language"], split_sentences=True, character_offsets=True)
+    tokenizer = tokenizers[key]
+    data = "".join(case["atoms"])
+    try:
+        if case["xml"]:
+            sentences = tokenizer.tokenize_xml(data, EOS_TAGS)
+        else:
+            sentences = tokenizer.tokenize_text_file(io.StringIO(data), paragraph_separator="empty_lines")
+        return [[[t.text, t.token_class, t.extra_info, list(t.character_offset)] for t in sentence] for sentence in sentences]
+    except Exception as e:
+        return "%s: %s" % (type(e).__name__, e)
+
+
+def worker():
+    """Read JSON cases from STDIN and write JSON results to STDOUT, one per line."""
+    tokenizers = {}
+    for line in sys.stdin:
+        print(json.dumps(tokenize_case(tokenizers, json.loads(line))), flush=True)
+
+
+class ReferenceEngine:
+    """The frozen reference implementation, running in a separate
+    process so that both versions of somajo can be imported.
+
+    """
+    def __init__(self, path):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = path + os.pathsep + env.get("PYTHONPATH", "")
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env, encoding="utf-8")
+
+    def tokenize(self, case):
+        """"""
+        self.process.stdin.write(json.dumps(case) + "\n")
+        self.process.stdin.flush()
+        return json.loads(self.process.stdout.readline())
+
+    def close(self):
+        """"""
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def _strip_skipable(string):
+    """"""
+    from somajo import alignment
+    string = unicodedata.normalize("NFC", string)
+    return "".join(c for c in string if not (c.isspace() or c in alignment._skipable_characters))
+
+
+def offset_errors(case, result):
+    """Check that the character offsets round-trip, i.e. that they point
+    to the input text of the tokens.
+
+    """
+    from somajo import alignment
+    if isinstance(result, str):
+        return [result]
+    data = "".join(case["atoms"])
+    errors = []
+    previous_end = 0
+    for sentence in result:
+        for text, token_class, extra_info, (start, end) in sentence:
+            if not (previous_end <= start <= end <= len(data)):
+                errors.append(f"Offsets ({start}, {end}) of '{text}' are out of order")
+                continue
+            previous_end = end
+            if token_class is None:
+                continue
+            expected = text
+            if "OriginalSpelling=" in extra_info:
+                expected = extra_info.split('OriginalSpelling="', maxsplit=1)[1][:-1]
+            found = data[start:end]
+            if case["xml"]:
+                expected = alignment._resolve_entities(expected)[0]
+                found = alignment._resolve_entities(found)[0]
+            if _strip_skipable(found) != _strip_skipable(expected):
+                errors.append(f"Offsets ({start}, {end}) of '{text}' point to '{found}'")
+    return errors
+
+
+def failure(case, reference, tokenizers):
+    """Return a description of the failure or None if the engines agree
+    and the offsets round-trip.
+
+    """
+    if case["xml"] and not well_formed("".join(case["atoms"])):
+        return None
+    current = json.loads(json.dumps(tokenize_case(tokenizers, case)))
+    expected = reference.tokenize(case)
+    if current != expected:
+        return "Output differs from reference"
+    errors = offset_errors(case, current)
+    if errors:
+        return errors[0]
+    return None
+
+
+def minimize(case, reference, tokenizers):
+    """Remove chunks of atoms as long as the engines still fail in the
+    same way.
+
+    """
+    original = failure(case, reference, tokenizers)
+    atoms = case["atoms"]
+    size = len(atoms) // 2
+    while size >= 1:
+        i = 0
+        while i < len(atoms):
+            candidate = dict(case, atoms=atoms[:i] + atoms[i + size:])
+            if len(candidate["atoms"]) > 0 and failure(candidate, reference, tokenizers) == original:
+                atoms = candidate["atoms"]
+            else:
+                i += 1
+        size //= 2
+    return dict(case, atoms=atoms)
+
+
+def report(case, reference, tokenizers):
+    """"""
+    description = failure(case, reference, tokenizers)
+    print("%s (%s, %s input)" % (description, case["language"], "XML" if case["xml"] else "text"))
+    print("Input:     %s" % json.dumps("".join(case["atoms"]), ensure_ascii=False))
+    print("Reference: %s" % json.dumps(reference.tokenize(case), ensure_ascii=False))
+    print("Current:   %s" % json.dumps(tokenize_case(tokenizers, case), ensure_ascii=False))
+    print()
+
+
+def export_revision(revision, directory):
+    """Export the src directory of a git revision."""
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    archive = subprocess.run(["git", "-C", repository, "archive", "--format=tar", revision, "src"], check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        # Do not write outside of directory (Python 3.12+ and backports)
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(directory, filter="data")
+        else:
+            tar.extractall(directory)
+    return os.path.join(directory, "src")
+
+
+def main():
+    """"""
+    args = arguments()
+    if args.worker:
+        worker()
+        return
+    languages = args.language if args.language is not None else ["de_CMC", "en_PTB"]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        reference_path = args.reference
+        if args.reference_rev is not None:
+            reference_path = export_revision(args.reference_rev, tmpdir)
+        reference = ReferenceEngine(reference_path)
+        tokenizers = {}
+        rng = random.Random(args.seed)
+        n_cases, n_failures = 0, 0
+        for _ in range(args.cases):
+            case = random_case(rng, rng.choice(languages))
+            n_cases += 1
+            if failure(case, reference, tokenizers) is None:
+                continue
+            n_failures += 1
+            if not args.no_minimize:
+                case = minimize(case, reference, tokenizers)
+            report(case, reference, tokenizers)
+            if n_failures >= args.max_failures:
+                break
+        reference.close()
+    print("%d of %d inputs failed" % (n_failures, n_cases))
+    sys.exit(1 if n_failures > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
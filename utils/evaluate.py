@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 
 import argparse
-import collections
+import json
+import multiprocessing
 import os
-
-
-Character = collections.namedtuple("Character", ("char", "token_boundary", "sentence_boundary"))
+import shutil
+import tempfile
 
 
 def arguments():
@@ -17,111 +17,257 @@ def arguments():
     parser.add_argument("--ignore-xml", action="store_true", help="Ignore XML tags for evaluation")
     parser.add_argument("-s", "--sentences", action="store_true", help="Also evaluate sentence boundaries")
     parser.add_argument("-e", "--errors", type=os.path.abspath, help="Write errors to file")
+    parser.add_argument("-j", "--json", type=os.path.abspath, help="Write a summary of the results in JSON format to file")
+    parser.add_argument("--parallel", type=int, default=os.cpu_count(), help="Number of files that are evaluated in parallel with -d (Default: number of CPUs)")
     parser.add_argument("SYSTEM", type=os.path.abspath, help="System output")
     parser.add_argument("GOLD", type=os.path.abspath, help="Gold data")
     args = parser.parse_args()
     return args
 
 
-def read_characters(f, ignore_xml, sentences):
-    characters = []
+def read_tokens(f, ignore_xml, sentences):
+    """Yield the tokens in f (one per line) together with a flag that
+    tells whether a sentence ends after the token. The flag is only
+    known when the following lines have been read.
+
+    """
+    token, sentence_boundary = None, False
     for line in f:
         line = line.rstrip()
-        if sentences and line == "":
-            characters[-1] = Character(characters[-1].char, True, True)
+        if line == "":
+            if sentences and token is not None:
+                sentence_boundary = True
             continue
         if ignore_xml and line.startswith("<") and line.endswith(">"):
             continue
-        for char in line:
-            characters.append(Character(char, False, False))
-        characters[-1] = Character(characters[-1].char, True, False)
-    return characters
+        if token is not None:
+            yield token, sentence_boundary
+        token, sentence_boundary = line, False
+    if token is not None:
+        yield token, sentence_boundary
 
 
-def char_to_str(system, gold, focus=False):
-    """"""
-    string = system.char
-    if focus:
-        # sentence fp
-        if system.sentence_boundary and (not gold.sentence_boundary):
-            string += "■ "
-        # sentence fn
-        elif (not system.sentence_boundary) and gold.sentence_boundary:
-            string += "□ "
-        # token fp
-        elif system.token_boundary and (not gold.token_boundary):
-            string += "● "
-        # token fn
-        elif (not system.token_boundary) and gold.token_boundary:
-            string += "○ "
-        # any tp
-        elif (system.sentence_boundary and gold.sentence_boundary) or (system.token_boundary and gold.token_boundary):
-            string += " "
-    else:
-        if system.sentence_boundary or system.token_boundary:
-            string += " "
-    return string
+def marker(system, gold):
+    """Mark an error at a boundary. system and gold are pairs (token
+    boundary, sentence boundary).
+
+    """
+    # sentence fp
+    if system[1] and (not gold[1]):
+        return "■ "
+    # sentence fn
+    if (not system[1]) and gold[1]:
+        return "□ "
+    # token fp
+    if system[0] and (not gold[0]):
+        return "● "
+    # token fn
+    return "○ "
+
+
+class ErrorContext:
+    """Write the errors together with 20 characters of context on both
+    sides. The context is taken from the system output, in which the
+    tokens are separated by spaces. Only a window around the current
+    position is kept in memory.
+
+    """
+
+    width = 20
+
+    def __init__(self, fh):
+        self.fh = fh
+        # The end of the system output rendered as text and the
+        # position of its first character in the whole output
+        self.rendered = ""
+        self.base = 0
+        self.offset = 0
+        # (left context, focus, start of right context)
+        self.pending = []
+
+    def add_token(self, text, start):
+        """Add a system token that starts at character position start."""
+        self._write_pending()
+        if len(self.pending) == 0 and len(self.rendered) > self.width:
+            self.base += len(self.rendered) - self.width
+            self.rendered = self.rendered[-self.width:]
+        self.offset = self.base + len(self.rendered) - start
+        self.rendered += text + " "
+
+    def add_error(self, position, system, gold):
+        """Add an error at the boundary before character position."""
+        focus = self.offset + position - 1
+        i = focus - self.base
+        left = self.rendered[max(i - self.width, 0):i]
+        right_start = focus + (2 if system[0] else 1)
+        self.pending.append((left, self.rendered[i] + marker(system, gold), right_start))
+
+    def _write_pending(self, final=False):
+        end = self.base + len(self.rendered)
+        while len(self.pending) > 0 and (final or self.pending[0][2] + self.width <= end):
+            left, focus, right_start = self.pending.pop(0)
+            i = right_start - self.base
+            self.fh.write("%s%s%s\n" % (left, focus, self.rendered[i:i + self.width]))
+
+    def close(self):
+        self._write_pending(final=True)
+
+
+def compare(system, gold, errors=None):
+    """Walk through the tokens of system and gold in lockstep and count
+    the true positives, false positives and false negatives for token
+    and sentence boundaries. Both outputs must consist of the same
+    characters.
+
+    """
+    counts = dict.fromkeys(("token_tp", "token_fp", "token_fn", "sentence_tp", "sentence_fp", "sentence_fn"), 0)
+    # Text that has been read from one side but not from the other
+    surplus, surplus_is_system = "", True
+    gold_context = ""
+
+    def consume(text, is_system):
+        nonlocal surplus, surplus_is_system, gold_context
+        if not is_system:
+            gold_context = (gold_context + text)[-20:]
+        if surplus == "" or surplus_is_system == is_system:
+            surplus += text
+            surplus_is_system = is_system
+            return
+        n = min(len(surplus), len(text))
+        if surplus[:n] != text[:n]:
+            i = next(i for i in range(n) if surplus[i] != text[i])
+            system_text, gold_text = (text, surplus) if is_system else (surplus, text)
+            print("'" + gold_context + "'")
+            print("'%s' != '%s'" % (system_text[i], gold_text[i]))
+            raise AssertionError("System output and gold data differ")
+        if len(text) > n:
+            surplus, surplus_is_system = text[n:], is_system
+        else:
+            surplus = surplus[n:]
+
+    s = next(system, None)
+    g = next(gold, None)
+    system_end = gold_end = 0
+    if s is not None:
+        if errors is not None:
+            errors.add_token(s[0], system_end)
+        system_end += len(s[0])
+        consume(s[0], True)
+    if g is not None:
+        gold_end += len(g[0])
+        consume(g[0], False)
+    while s is not None and g is not None:
+        position = min(system_end, gold_end)
+        system_boundary = (system_end == position, system_end == position and s[1])
+        gold_boundary = (gold_end == position, gold_end == position and g[1])
+        if system_boundary[0] and gold_boundary[0]:
+            counts["token_tp"] += 1
+        elif system_boundary[0]:
+            counts["token_fp"] += 1
+        else:
+            counts["token_fn"] += 1
+        if system_boundary[1] and gold_boundary[1]:
+            counts["sentence_tp"] += 1
+        elif system_boundary[1]:
+            counts["sentence_fp"] += 1
+        elif gold_boundary[1]:
+            counts["sentence_fn"] += 1
+        if errors is not None and system_boundary != gold_boundary:
+            errors.add_error(position, system_boundary, gold_boundary)
+        if system_boundary[0]:
+            s = next(system, None)
+            if s is not None:
+                if errors is not None:
+                    errors.add_token(s[0], system_end)
+                system_end += len(s[0])
+                consume(s[0], True)
+        if gold_boundary[0]:
+            g = next(gold, None)
+            if g is not None:
+                gold_end += len(g[0])
+                consume(g[0], False)
+    assert s is None and g is None and surplus == "", "System output and gold data have different lengths"
+    if errors is not None:
+        errors.close()
+    return counts
 
 
 def precision_recall_f1(tp, fp, fn):
     """"""
-    precision = tp / (tp + fp)
-    recall = tp / (tp + fn)
-    f1 = (2 * precision * recall) / (precision + recall)
+    precision = tp / (tp + fp) if tp + fp > 0 else 0.0
+    recall = tp / (tp + fn) if tp + fn > 0 else 0.0
+    f1 = (2 * precision * recall) / (precision + recall) if precision + recall > 0 else 0.0
     return precision, recall, f1
 
 
-def evaluate_file(system_path, gold_path, ignore_xml, sentences, error_file):
+def scores(counts, prefix):
     """"""
-    print("%s ⇔ %s" % (system_path, gold_path))
-    if error_file:
-        with open(error_file, mode="a", encoding="utf-8") as e:
-            e.write("%s ⇔ %s\n" % (system_path, gold_path))
+    tp, fp, fn = counts[prefix + "_tp"], counts[prefix + "_fp"], counts[prefix + "_fn"]
+    precision, recall, f1 = precision_recall_f1(tp, fp, fn)
+    return {"tp": tp, "fp": fp, "fn": fn, "precision": precision, "recall": recall, "f1": f1}
+
+
+def evaluate_file(system_path, gold_path, ignore_xml, sentences, error_file):
+    """Compare the files and return the scores for tokens and, if
+    sentences is True, for sentences.
+
+    """
     with open(system_path, encoding="utf-8") as system, open(gold_path, encoding="utf-8") as gold:
-        sys_chars = read_characters(system, ignore_xml, sentences)
-        gold_chars = read_characters(gold, ignore_xml, sentences)
-        window = collections.deque([""] * 20)
-        for s, g in zip(sys_chars, gold_chars):
-            window.append(g.char)
-            window.popleft()
-            if s.char != g.char:
-                print("'" + "".join(window) + "'")
-                print("'%s' != '%s'" % (s.char, g.char))
-                break
-        assert len(sys_chars) == len(gold_chars)
-        assert all((s.char == g.char for s, g in zip(sys_chars, gold_chars)))
-        token_precision, token_recall, token_f1, sentence_precision, sentence_recall, sentence_f1 = 0, 0, 0, 0, 0, 0
-        token_tp, token_fp, token_fn, sentence_tp, sentence_fp, sentence_fn = 0, 0, 0, 0, 0, 0
+        system_tokens = read_tokens(system, ignore_xml, sentences)
+        gold_tokens = read_tokens(gold, ignore_xml, sentences)
         if error_file:
             with open(error_file, mode="a", encoding="utf-8") as e:
-                sys_window = collections.deque([Character("", False, False)] * 41)
-                gold_window = collections.deque([Character("", False, False)] * 41)
-                for s, g in zip(sys_chars + [Character("", False, False)] * 20, gold_chars + [Character("", False, False)] * 20):
-                    sys_window.append(s)
-                    sys_window.popleft()
-                    gold_window.append(g)
-                    gold_window.popleft()
-                    if sys_window[20] != gold_window[20]:
-                        e.write("%s%s%s\n" % ("".join(char_to_str(x, y) for x, y in zip(list(sys_window)[:20], list(gold_window)[:20]))[-20:],
-                                          char_to_str(sys_window[20], gold_window[20], focus=True),
-                                          "".join(char_to_str(x, y) for x, y in zip(list(sys_window)[21:], list(gold_window)[21:]))[:20]))
-        token_tp = len([s for s, g in zip(sys_chars, gold_chars) if g.token_boundary and s.token_boundary])
-        token_fp = len([s for s, g in zip(sys_chars, gold_chars) if (not g.token_boundary) and s.token_boundary])
-        token_fn = len([s for s, g in zip(sys_chars, gold_chars) if g.token_boundary and (not s.token_boundary)])
-        token_precision, token_recall, token_f1 = precision_recall_f1(token_tp, token_fp, token_fn)
-        print("Tokenization:")
-        print("P = %6.2f%%   R = %6.2f%%   F = %6.2f%%" % (token_precision * 100, token_recall * 100, token_f1 * 100))
-        print("%d false positives, %d false negatives" % (token_fp, token_fn))
-        if sentences:
-            sentence_tp = len([s for s, g in zip(sys_chars, gold_chars) if g.sentence_boundary and s.sentence_boundary])
-            sentence_fp = len([s for s, g in zip(sys_chars, gold_chars) if (not g.sentence_boundary) and s.sentence_boundary])
-            sentence_fn = len([s for s, g in zip(sys_chars, gold_chars) if g.sentence_boundary and (not s.sentence_boundary)])
-            sentence_precision, sentence_recall, sentence_f1 = precision_recall_f1(sentence_tp, sentence_fp, sentence_fn)
-            print("Sentence splitting:")
-            print("P = %6.2f%%   R = %6.2f%%   F = %6.2f%%" % (sentence_precision * 100, sentence_recall * 100, sentence_f1 * 100))
-            print("%d false positives, %d false negatives" % (sentence_fp, sentence_fn))
-        print()
-        return token_tp, token_fp, token_fn, token_precision, token_recall, token_f1, sentence_tp, sentence_fp, sentence_fn, sentence_precision, sentence_recall, sentence_f1
+                e.write("%s ⇔ %s\n" % (system_path, gold_path))
+                counts = compare(system_tokens, gold_tokens, ErrorContext(e))
+        else:
+            counts = compare(system_tokens, gold_tokens)
+    result = {"system": system_path, "gold": gold_path, "tokens": scores(counts, "token")}
+    if sentences:
+        result["sentences"] = scores(counts, "sentence")
+    return result
+
+
+def _evaluate_file(job):
+    """Evaluate a pair of files in a worker process; the errors are
+    written to a temporary file.
+
+    """
+    system_path, gold_path, ignore_xml, sentences, error_file = job
+    if error_file:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(error_file), suffix=".part")
+        os.close(fd)
+        return evaluate_file(system_path, gold_path, ignore_xml, sentences, tmp), tmp
+    return evaluate_file(system_path, gold_path, ignore_xml, sentences, None), None
+
+
+def print_scores(name, s):
+    """"""
+    print("%s:" % name)
+    print("P = %6.2f%%   R = %6.2f%%   F = %6.2f%%" % (s["precision"] * 100, s["recall"] * 100, s["f1"] * 100))
+    print("%d false positives, %d false negatives" % (s["fp"], s["fn"]))
+
+
+def print_result(result):
+    """"""
+    print("%s ⇔ %s" % (result["system"], result["gold"]))
+    print_scores("Tokenization", result["tokens"])
+    if "sentences" in result:
+        print_scores("Sentence splitting", result["sentences"])
+    print()
+
+
+def total(results, key, weight):
+    """Pool the counts of all files and compute the average of the
+    scores, weighted by the number of tokens or sentences.
+
+    """
+    counts = {k: sum(r[key][k] for r in results) for k in ("tp", "fp", "fn")}
+    s = scores({key + "_" + k: v for k, v in counts.items()}, key)
+    weights = [weight(r[key]) for r in results]
+    n = sum(weights)
+    s["n"] = n
+    s["weighted"] = {m: sum(w * r[key][m] for w, r in zip(weights, results)) / n if n > 0 else 0.0 for m in ("precision", "recall", "f1")}
+    return s
 
 
 def main():
@@ -131,40 +277,36 @@ def main():
         with open(args.errors, mode="w", encoding="utf-8") as e:
             pass
     if args.files:
-        evaluate_file(args.SYSTEM, args.GOLD, args.ignore_xml, args.sentences, args.errors)
+        result = evaluate_file(args.SYSTEM, args.GOLD, args.ignore_xml, args.sentences, args.errors)
+        print_result(result)
+        summary = {"files": [result]}
     elif args.directories:
-        n_tokens, token_precision, token_recall, token_f1, n_sentences, sentence_precision, sentence_recall, sentence_f1 = 0, 0, 0, 0, 0, 0, 0, 0
-        token_tp, token_fp, token_fn, sentence_tp, sentence_fp, sentence_fn = 0, 0, 0, 0, 0, 0
         system_files = sorted(os.listdir(args.SYSTEM))
         gold_files = sorted(os.listdir(args.GOLD))
         assert len(system_files) == len(gold_files)
         assert all((s == g for s, g in zip(system_files, gold_files)))
-        for system_file, gold_file in zip(system_files, gold_files):
-            ttp, tfp, tfn, tp, tr, tf, stp, sfp, sfn, sp, sr, sf = evaluate_file(os.path.join(args.SYSTEM, system_file), os.path.join(args.GOLD, gold_file), args.ignore_xml, args.sentences, args.errors)
-            nt = ttp + tfn
-            ns = stp + sfp
-            token_tp += ttp
-            token_fp += tfp
-            token_fn += tfn
-            sentence_tp += stp
-            sentence_fp += sfp
-            sentence_fn += sfn
-            n_tokens += nt
-            token_precision += nt * tp
-            token_recall += nt * tr
-            token_f1 += nt * tf
-            n_sentences += ns
-            sentence_precision += ns * sp
-            sentence_recall += ns * sr
-            sentence_f1 += ns * sf
+        jobs = [(os.path.join(args.SYSTEM, s), os.path.join(args.GOLD, g), args.ignore_xml, args.sentences, args.errors) for s, g in zip(system_files, gold_files)]
+        results = []
+        with multiprocessing.Pool(max(min(args.parallel, len(jobs)), 1)) as pool:
+            for result, tmp in pool.imap(_evaluate_file, jobs):
+                print_result(result)
+                results.append(result)
+                if tmp is not None:
+                    with open(args.errors, mode="a", encoding="utf-8") as e, open(tmp, encoding="utf-8") as t:
+                        shutil.copyfileobj(t, e)
+                    os.remove(tmp)
+        summary = {"files": results, "total": {"tokens": total(results, "tokens", lambda s: s["tp"] + s["fn"])}}
+        if args.sentences:
+            summary["total"]["sentences"] = total(results, "sentences", lambda s: s["tp"] + s["fp"])
         print("TOTAL")
-        print("Tokenization (weighted average on %d tokens):" % n_tokens)
-        print("P = %6.2f%%   R = %6.2f%%   F = %6.2f%%" % (token_precision / n_tokens * 100, token_recall / n_tokens * 100, token_f1 / n_tokens * 100))
-        print("%d false positives, %d false negatives" % (token_fp, token_fn))
+        t = summary["total"]["tokens"]
+        print_scores("Tokenization (weighted average on %d tokens)" % t["n"], dict(t["weighted"], fp=t["fp"], fn=t["fn"]))
         if args.sentences:
-            print("Sentence splitting (weighted average on %d sentences):" % n_sentences)
-            print("P = %6.2f%%   R = %6.2f%%   F = %6.2f%%" % (sentence_precision / n_sentences * 100, sentence_recall / n_sentences * 100, sentence_f1 / n_sentences * 100))
-            print("%d false positives, %d false negatives" % (sentence_fp, sentence_fn))
+            t = summary["total"]["sentences"]
+            print_scores("Sentence splitting (weighted average on %d sentences)" % t["n"], dict(t["weighted"], fp=t["fp"], fn=t["fn"]))
+    if args.json:
+        with open(args.json, mode="w", encoding="utf-8") as fh:
+            json.dump(summary, fh, ensure_ascii=False, indent=2)
 
 
 if __name__ == "__main__":